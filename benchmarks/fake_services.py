@@ -0,0 +1,277 @@
+import asyncio
+import base64
+import hashlib
+import io
+import json
+import os
+import random
+import threading
+import time
+from email.utils import formatdate
+from typing import Optional
+from urllib.parse import parse_qs
+from xml.sax.saxutils import escape
+
+from PIL import Image
+
+from utils.http_server import HTTPServer, Request, Response
+from utils.image_gen import IMAGE_PROFILES
+
+TELEGRAM_TOKEN = 'bench:token'
+# Сколько записей держит синтетическая лента (свежие сверху)
+FEED_LENGTH = 10
+MAX_BODY_SIZE = 32 * 1024 * 1024
+
+WORDS = (
+    "model agent robot vision language open source benchmark dataset chip startup funding "
+    "research paper transformer diffusion reasoning safety alignment policy regulation cloud "
+    "inference training cluster gpu memory latency privacy medical climate quantum search "
+    "translation speech video music coding assistant enterprise release update partnership "
+    "lawsuit copyright hardware edge mobile browser protein weather finance education"
+).split()
+
+class FakeServices:
+    """Локальные заглушки RSS-лент, Groq, Stability и Telegram Bot API.
+
+    Работают в отдельном потоке со своим event loop, чтобы не делить
+    процессор с измеряемым ботом. Задержка и доля ошибок задаются по
+    сервисам: 'feeds', 'groq', 'stability', 'telegram'.
+    """
+
+    def __init__(self, feeds: int = 20, items_per_cycle: int = 2, latency: Optional[dict] = None,
+                 errors: Optional[dict] = None, rate_limited: Optional[dict] = None,
+                 recorded_dir: Optional[str] = None, seed: int = 0):
+        self.items_per_cycle = items_per_cycle
+        self.latency = latency or {}
+        self.errors = errors or {}
+        self.rate_limited = rate_limited or {}
+        self.random = random.Random(seed)
+        self.cycle = 0
+        self.message_id = 0
+        self.requests = {}
+        self.recorded = []
+        if recorded_dir:
+            for name in sorted(os.listdir(recorded_dir)):
+                if name.endswith('.xml'):
+                    with open(os.path.join(recorded_dir, name), 'rb') as f:
+                        self.recorded.append(f.read())
+        self.feed_count = len(self.recorded) or feeds
+        self.image_base64 = base64.b64encode(self._make_image()).decode('ascii')
+        self.base_url = None
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='fake-services', daemon=True)
+        self.server = HTTPServer('127.0.0.1', 0, max_body=MAX_BODY_SIZE)
+        self._register_routes()
+
+    @property
+    def feed_urls(self) -> list:
+        return [f"{self.base_url}/feeds/{i}.xml" for i in range(self.feed_count)]
+
+    def start(self) -> str:
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self.server.start(), self.loop).result()
+        port = self.server.server.sockets[0].getsockname()[1]
+        self.base_url = f"http://127.0.0.1:{port}"
+        return self.base_url
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self.server.stop(timeout=2), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    def advance(self):
+        """Следующий цикл: в каждой синтетической ленте появляются новые записи"""
+        self.cycle += 1
+
+    def _make_image(self) -> bytes:
+        # Шум плохо сжимается, поэтому размер близок к настоящим ответам Stability
+        image = Image.merge('RGB', [Image.effect_noise((1024, 1024), 48 + 16 * i) for i in range(3)])
+        buffer = io.BytesIO()
+        image.save(buffer, format='PNG')
+        return buffer.getvalue()
+
+    def _register_routes(self):
+        for i in range(self.feed_count):
+            self.server.route('GET', f"/feeds/{i}.xml", self._feed_handler(i))
+            self.server.route('HEAD', f"/feeds/{i}.xml", self._feed_handler(i))
+        self.server.route('POST', '/openai/v1/chat/completions', self._groq_completion)
+        self.server.route('GET', '/openai/v1/models', self._groq_models)
+        for engine_id in {profile.engine_id for profile in IMAGE_PROFILES}:
+            self.server.route('POST', f"/v1/generation/{engine_id}/text-to-image", self._stability_generate)
+        self.server.route('GET', '/v1/user/balance', self._stability_balance)
+        for method in ('getMe', 'sendPhoto', 'sendMessage', 'editMessageCaption', 'editMessageText',
+                       'editMessageMedia', 'answerCallbackQuery', 'setWebhook', 'deleteWebhook'):
+            self.server.route('POST', f"/bot{TELEGRAM_TOKEN}/{method}", self._telegram_handler(method))
+
+    async def _simulate(self, service: str) -> Optional[str]:
+        """Задержка сервиса; возвращает 'error' или 'rate_limited' для неудачного ответа"""
+        self.requests[service] = self.requests.get(service, 0) + 1
+        latency = self.latency.get(service, 0)
+        if latency:
+            await asyncio.sleep(max(0.0, self.random.gauss(latency, latency * 0.2)))
+        roll = self.random.random()
+        if roll < self.rate_limited.get(service, 0):
+            return 'rate_limited'
+        if roll < self.rate_limited.get(service, 0) + self.errors.get(service, 0):
+            return 'error'
+        return None
+
+    # --- RSS ---
+
+    def _feed_handler(self, index: int):
+        async def handler(request: Request) -> Response:
+            failure = await self._simulate('feeds')
+            if failure == 'error':
+                return Response(500, 'Internal Server Error')
+            if failure == 'rate_limited':
+                return Response(429, 'Too Many Requests', headers={'Retry-After': '1'})
+            body = self.recorded[index] if self.recorded else self._synthetic_feed(index)
+            etag = '"' + hashlib.sha256(body).hexdigest()[:16] + '"'
+            if request.headers.get('if-none-match') == etag:
+                return Response(304, b'', headers={'ETag': etag})
+            if request.method == 'HEAD':
+                body = b''
+            return Response(200, body, 'application/rss+xml; charset=utf-8', headers={'ETag': etag})
+        return handler
+
+    def _title(self, feed: int, cycle: int, item: int) -> str:
+        rng = random.Random(f"{feed}-{cycle}-{item}")
+        return ' '.join(rng.sample(WORDS, 8)).capitalize()
+
+    def _synthetic_feed(self, index: int) -> bytes:
+        items = []
+        now = time.time()
+        position = 0
+        for cycle in range(self.cycle, 0, -1):
+            for item in range(self.items_per_cycle):
+                if position >= FEED_LENGTH:
+                    break
+                title = self._title(index, cycle, item)
+                description = self._title(index, cycle, item + FEED_LENGTH)
+                items.append(
+                    "<item>"
+                    f"<title>{escape(title)}</title>"
+                    f"<link>https://bench.example/{index}/{cycle}/{item}</link>"
+                    f"<guid>bench-{index}-{cycle}-{item}</guid>"
+                    f"<pubDate>{formatdate(now - position * 600, usegmt=True)}</pubDate>"
+                    f"<description>{escape(title)}. {escape(description)}</description>"
+                    "</item>"
+                )
+                position += 1
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?><rss version="2.0"><channel>'
+            f"<title>Bench feed {index}</title><link>https://bench.example/{index}</link>"
+            f"<description>Synthetic feed</description>{''.join(items)}</channel></rss>"
+        ).encode('utf-8')
+
+    # --- Groq ---
+
+    async def _groq_completion(self, request: Request) -> Response:
+        failure = await self._simulate('groq')
+        if failure == 'rate_limited':
+            return Response(429, json.dumps({'error': {'message': 'Rate limit reached'}}),
+                            'application/json', headers={'retry-after': '1'})
+        if failure == 'error':
+            return Response(500, json.dumps({'error': {'message': 'Internal error'}}), 'application/json')
+
+        payload = json.loads(request.body)
+        user_content = payload['messages'][-1]['content']
+        if payload.get('response_format', {}).get('type') == 'json_object':
+            items = json.loads(user_content)
+            content = json.dumps({'posts': [
+                {'id': item['id'], 'text': self._post_text(item['title'])} for item in items
+            ]}, ensure_ascii=False)
+        else:
+            content = self._post_text(user_content.split('\n', 1)[0].replace('Заголовок: ', ''))
+        body = {
+            'id': f"chatcmpl-bench-{self.requests['groq']}",
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': payload.get('model', ''),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': content},
+                'finish_reason': 'stop'
+            }],
+            'usage': {'prompt_tokens': len(user_content) // 4, 'completion_tokens': len(content) // 4,
+                      'total_tokens': (len(user_content) + len(content)) // 4}
+        }
+        return Response(200, json.dumps(body, ensure_ascii=False), 'application/json')
+
+    async def _groq_models(self, request: Request) -> Response:
+        await self._simulate('groq')
+        return Response(200, json.dumps({'object': 'list', 'data': []}), 'application/json')
+
+    def _post_text(self, title: str) -> str:
+        return (f"📌 <b>{escape(title)}</b>\n\n🔍 {escape(title)}.\n\n"
+                f"💡 Тестовый пост бенчмарка.\n\n🔔 <b>Подпишись на @ai_revo</b>")
+
+    # --- Stability ---
+
+    async def _stability_generate(self, request: Request) -> Response:
+        failure = await self._simulate('stability')
+        if failure == 'rate_limited':
+            return Response(429, json.dumps({'message': 'rate limited'}), 'application/json',
+                            headers={'Retry-After': '1'})
+        if failure == 'error':
+            return Response(500, json.dumps({'message': 'internal error'}), 'application/json')
+        body = {'artifacts': [{'base64': self.image_base64, 'seed': 0, 'finishReason': 'SUCCESS'}]}
+        return Response(200, json.dumps(body), 'application/json')
+
+    async def _stability_balance(self, request: Request) -> Response:
+        await self._simulate('stability')
+        return Response(200, json.dumps({'credits': 1000.0}), 'application/json')
+
+    # --- Telegram ---
+
+    def _telegram_handler(self, method: str):
+        async def handler(request: Request) -> Response:
+            failure = await self._simulate('telegram')
+            if failure == 'rate_limited':
+                return self._telegram_response({'ok': False, 'error_code': 429,
+                                                'description': 'Too Many Requests: retry after 1',
+                                                'parameters': {'retry_after': 1}}, 429)
+            if failure == 'error':
+                return self._telegram_response({'ok': False, 'error_code': 500,
+                                                'description': 'Internal Server Error'}, 500)
+            return self._telegram_response({'ok': True, 'result': self._telegram_result(method, request)})
+        return handler
+
+    def _telegram_response(self, body: dict, status: int = 200) -> Response:
+        return Response(status, json.dumps(body), 'application/json')
+
+    def _telegram_result(self, method: str, request: Request):
+        if method == 'getMe':
+            return {'id': 1, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}
+        if method in ('answerCallbackQuery', 'setWebhook', 'deleteWebhook'):
+            return True
+        self.message_id += 1
+        message = {
+            'message_id': self.message_id,
+            'date': int(time.time()),
+            'chat': {'id': self._chat_id(request), 'type': 'private'}
+        }
+        if method in ('sendPhoto', 'editMessageCaption', 'editMessageMedia'):
+            message['photo'] = [{
+                'file_id': f"bench-file-{self.message_id}",
+                'file_unique_id': f"bench-unique-{self.message_id}",
+                'width': 1024,
+                'height': 1024
+            }]
+            message['caption'] = 'bench'
+        else:
+            message['text'] = 'bench'
+        return message
+
+    def _chat_id(self, request: Request) -> int:
+        # Файлы приходят multipart-формой, остальное — JSON или urlencoded
+        content_type = request.headers.get('content-type', '')
+        try:
+            if content_type.startswith('application/json'):
+                return int(json.loads(request.body).get('chat_id', 0))
+            if content_type.startswith('application/x-www-form-urlencoded'):
+                return int(parse_qs(request.body.decode('utf-8')).get('chat_id', ['0'])[0])
+        except (ValueError, TypeError):
+            pass
+        return 0
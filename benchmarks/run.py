@@ -0,0 +1,374 @@
+"""Офлайн-бенчмарк бота на локальных заглушках внешних сервисов.
+
+Запуск из корня репозитория:
+
+    python -m benchmarks.run --cycles 3 --feeds 40 --latency groq=0.8 stability=2 telegram=0.05
+
+С --webhook нажатия кнопок доходят до бота как POST-запросы на WEBHOOK_PATH
+встроенного сервера и обрабатываются через Application, как в режиме
+webhook. Отправленные обновления сохраняются в updates.jsonl рабочего
+каталога; --updates FILE воспроизводит ранее записанные обновления.
+
+Бот работает в отдельном временном каталоге (posts.db, images/, bot.log),
+поэтому рабочие данные не затрагиваются. Отчет содержит пропускную
+способность, процентили длительности этапов из реестра метрик и пиковую
+память основного процесса (водяные знаки считаются в дочерних процессах
+и в tracemalloc не попадают).
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import resource
+import socket
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Процессы водяных знаков стартуют через spawn и должны находить пакеты проекта
+sys.path.insert(0, ROOT)
+
+from benchmarks.fake_services import FakeServices, TELEGRAM_TOKEN
+
+ADMIN_CHAT_ID = '1001'
+CHANNEL_ID = '1002'
+WEBHOOK_SECRET = 'bench-secret'
+SERVICES = ('feeds', 'groq', 'stability', 'telegram')
+
+def _service_map(values) -> dict:
+    """Разбор аргументов вида groq=0.8"""
+    result = {}
+    for value in values or []:
+        service, _, number = value.partition('=')
+        if service not in SERVICES:
+            raise argparse.ArgumentTypeError(f"Неизвестный сервис: {service}")
+        result[service] = float(number)
+    return result
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк обработки новостей и модерации")
+    parser.add_argument('--cycles', type=int, default=3, help="циклов process_news")
+    parser.add_argument('--feeds', type=int, default=20, help="синтетических лент")
+    parser.add_argument('--items', type=int, default=2, help="новых записей в ленте за цикл")
+    parser.add_argument('--recorded', help="каталог с записанными лентами *.xml вместо синтетических")
+    parser.add_argument('--latency', nargs='*', metavar='SERVICE=SEC', help="средняя задержка сервиса")
+    parser.add_argument('--errors', nargs='*', metavar='SERVICE=P', help="доля ответов 500")
+    parser.add_argument('--rate-limited', nargs='*', metavar='SERVICE=P', help="доля ответов 429")
+    parser.add_argument('--approve', type=float, default=0.7, help="доля одобряемых постов")
+    parser.add_argument('--click-concurrency', type=int, default=8, help="одновременных нажатий кнопок")
+    parser.add_argument('--unthrottled', action='store_true', help="снять лимиты запросов бота")
+    parser.add_argument('--webhook', action='store_true', help="доставлять нажатия через вебхук")
+    parser.add_argument('--updates', help="JSONL с записанными обновлениями для вебхука (включает --webhook)")
+    parser.add_argument('--workdir', help="рабочий каталог бота (по умолчанию временный)")
+    parser.add_argument('--json', dest='json_path', help="сохранить отчет в JSON")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--log-level', default='WARNING')
+    return parser.parse_args(argv)
+
+def _percentile(values: list, q: float):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q / 100 * len(values)))]
+
+async def _pending_post_ids(storage) -> list:
+    return await storage.read(
+        lambda conn: [row[0] for row in conn.execute("SELECT id FROM posts WHERE status='pending'")]
+    )
+
+def _callback_update(post_id: str, update_id: int, action: str) -> dict:
+    """Обновление Telegram с нажатием кнопки модерации"""
+    return {
+        'update_id': update_id,
+        'callback_query': {
+            'id': str(update_id),
+            'from': {'id': int(ADMIN_CHAT_ID), 'is_bot': False, 'first_name': 'Admin'},
+            'chat_instance': 'bench',
+            'data': f"{action}:{post_id}",
+            'message': {
+                'message_id': update_id,
+                'date': int(time.time()),
+                'chat': {'id': int(ADMIN_CHAT_ID), 'type': 'private'},
+                'caption': 'bench'
+            }
+        }
+    }
+
+async def _click(newsbot, post_id: str, update_id: int, action: str) -> Optional[float]:
+    from telegram import Update
+
+    update = Update.de_json(_callback_update(post_id, update_id, action), newsbot.bot)
+    start = time.perf_counter()
+    try:
+        await newsbot.handle_button(update, None)
+    except Exception as e:
+        # В боте такие ошибки перехватывает Application; здесь только считаем их
+        logging.getLogger(__name__).warning(f"Ошибка обработки нажатия: {str(e)}")
+        return None
+    return time.perf_counter() - start
+
+async def _replay_webhook(newsbot, updates: list, concurrency: int) -> tuple:
+    """POST обновлений на вебхук бота; время — от запроса до конца обработки нажатия"""
+    import bot
+    from utils.http_client import get_http_client
+
+    started = {}
+    durations = {}
+    finished = asyncio.Event()
+    handle_button = newsbot.handle_button
+
+    async def tracked(update, context):
+        try:
+            await handle_button(update, context)
+        finally:
+            durations[update.update_id] = time.perf_counter() - started[update.update_id]
+            if len(durations) == len(updates):
+                finished.set()
+
+    # Application связывает обработчик при сборке, поэтому подмена — до нее
+    newsbot.handle_button = tracked
+    application = newsbot._build_application()
+    await application.initialize()
+    await application.start()
+    await newsbot._start_webhook(application)
+    for server in newsbot.http_servers.values():
+        await server.start()
+    url = f"http://127.0.0.1:{bot.WEBHOOK_PORT}{bot.WEBHOOK_PATH}"
+    client = get_http_client()
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    try:
+        # Чужой секрет (не ASCII) должен давать 403, а не ошибку сервера
+        response = await client.post(url, headers={'X-Telegram-Bot-Api-Secret-Token': 'чужой'.encode('utf-8')},
+                                     json_body=updates[0] if updates else {})
+        bad_secret_status = response.status_code
+
+        async def post(update):
+            async with semaphore:
+                started[update['update_id']] = time.perf_counter()
+                try:
+                    response = await client.post(url, json_body=update,
+                                                 headers={'X-Telegram-Bot-Api-Secret-Token': WEBHOOK_SECRET})
+                    accepted = response.status_code == 200
+                except Exception as e:
+                    logging.getLogger(__name__).warning(f"Ошибка отправки на вебхук: {str(e)}")
+                    accepted = False
+                # Отвергнутое обновление до обработчика не дойдет: считаем его ошибкой сразу
+                if not accepted:
+                    durations[update['update_id']] = None
+                    if len(durations) == len(updates):
+                        finished.set()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(post(update) for update in updates))
+        if updates:
+            await finished.wait()
+        seconds = time.perf_counter() - start
+    finally:
+        for server in newsbot.http_servers.values():
+            await server.stop()
+        await application.stop()
+        await application.shutdown()
+        newsbot.handle_button = handle_button
+    return [durations.get(update['update_id']) for update in updates], seconds, bad_secret_status
+
+async def run_benchmark(newsbot, services: FakeServices, args) -> dict:
+    from utils.http_client import close_http_client
+    from utils.metrics import REGISTRY
+
+    posts = REGISTRY.metrics['newsbot_posts_total']
+    await newsbot.bot.initialize()
+    try:
+        cycles = []
+        for _ in range(args.cycles):
+            services.advance()
+            before = posts.get(status='moderation')
+            start = time.perf_counter()
+            await newsbot.process_news()
+            await newsbot.drain_jobs()
+            cycles.append({
+                'seconds': time.perf_counter() - start,
+                'posts': posts.get(status='moderation') - before
+            })
+
+        post_ids = await _pending_post_ids(newsbot.storage)
+        approve_count = int(len(post_ids) * args.approve)
+        bad_secret_status = None
+        if args.webhook:
+            if args.updates:
+                with open(args.updates, encoding='utf-8') as f:
+                    updates = [json.loads(line) for line in f if line.strip()]
+            else:
+                updates = [_callback_update(post_id, i + 1, 'approve' if i < approve_count else 'reject')
+                           for i, post_id in enumerate(post_ids)]
+                with open('updates.jsonl', 'w', encoding='utf-8') as f:
+                    for update in updates:
+                        f.write(json.dumps(update, ensure_ascii=False) + '\n')
+            click_times, clicks_seconds, bad_secret_status = await _replay_webhook(
+                newsbot, updates, args.click_concurrency
+            )
+        else:
+            semaphore = asyncio.Semaphore(max(1, args.click_concurrency))
+
+            async def click(i, post_id):
+                async with semaphore:
+                    return await _click(newsbot, post_id, i + 1, 'approve' if i < approve_count else 'reject')
+
+            start = time.perf_counter()
+            click_times = await asyncio.gather(*(click(i, post_id) for i, post_id in enumerate(post_ids)))
+            clicks_seconds = time.perf_counter() - start
+    finally:
+        await newsbot.bot.shutdown()
+        await close_http_client()
+
+    return {
+        'cycles': cycles,
+        'clicks': [t for t in click_times if t is not None],
+        'click_errors': sum(t is None for t in click_times),
+        'clicks_seconds': clicks_seconds,
+        'bad_secret_status': bad_secret_status
+    }
+
+def build_report(result: dict, services: FakeServices) -> dict:
+    from utils.metrics import REGISTRY, Counter, Histogram
+
+    total_seconds = sum(c['seconds'] for c in result['cycles'])
+    total_posts = sum(c['posts'] for c in result['cycles'])
+    stages = {}
+    counters = {}
+    for metric in REGISTRY.metrics.values():
+        if isinstance(metric, Histogram) and metric.name == 'newsbot_stage_seconds':
+            for key, series in sorted(metric.series.items()):
+                labels = dict(zip(metric.labelnames, key))
+                stages[labels['stage']] = {
+                    'count': series['count'],
+                    'p50': metric.percentile(50, **labels),
+                    'p95': metric.percentile(95, **labels),
+                    'p99': metric.percentile(99, **labels),
+                    'mean': series['sum'] / series['count']
+                }
+        elif isinstance(metric, Counter):
+            for key, value in sorted(metric.values.items()):
+                counters[metric.name + '{' + ','.join(key) + '}'] = value
+
+    _, peak_traced = tracemalloc.get_traced_memory()
+    return {
+        'cycles': result['cycles'],
+        'posts': total_posts,
+        'posts_per_second': total_posts / total_seconds if total_seconds else 0,
+        'clicks': len(result['clicks']),
+        'clicks_per_second': len(result['clicks']) / result['clicks_seconds'] if result['clicks_seconds'] else 0,
+        'click_errors': result['click_errors'],
+        'click_p50': _percentile(result['clicks'], 50),
+        'click_p95': _percentile(result['clicks'], 95),
+        'webhook_bad_secret_status': result['bad_secret_status'],
+        'stages': stages,
+        'counters': counters,
+        'requests': dict(services.requests),
+        'peak_traced_mb': peak_traced / 1024 / 1024,
+        # ru_maxrss в Linux возвращается в килобайтах
+        'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    }
+
+def print_report(report: dict):
+    def fmt(value):
+        return '-' if value is None else f"{value:.3f}"
+
+    print("\n=== Результаты бенчмарка ===")
+    for i, cycle in enumerate(report['cycles'], 1):
+        print(f"Цикл {i}: {cycle['posts']} постов за {cycle['seconds']:.2f} сек")
+    print(f"Пропускная способность: {report['posts_per_second']:.2f} постов/сек "
+          f"(всего {report['posts']})")
+    print(f"Модерация: {report['clicks']} нажатий, {report['clicks_per_second']:.2f}/сек, "
+          f"p50={fmt(report['click_p50'])}s p95={fmt(report['click_p95'])}s, "
+          f"ошибок {report['click_errors']}")
+    if report['webhook_bad_secret_status'] is not None:
+        print(f"Вебхук: запрос с неверным секретом -> {report['webhook_bad_secret_status']}")
+    print(f"\n{'этап':<12}{'n':>7}{'mean':>9}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for stage, s in report['stages'].items():
+        print(f"{stage:<12}{s['count']:>7}{fmt(s['mean']):>9}{fmt(s['p50']):>9}"
+              f"{fmt(s['p95']):>9}{fmt(s['p99']):>9}")
+    print("\nСчетчики:")
+    for name, value in report['counters'].items():
+        print(f"  {name} = {value:g}")
+    print("Запросы к заглушкам: " + ', '.join(f"{k}={v}" for k, v in sorted(report['requests'].items())))
+    print(f"Пиковая память: {report['peak_traced_mb']:.1f} МБ (tracemalloc), "
+          f"{report['max_rss_mb']:.1f} МБ (max RSS)")
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def main(argv=None):
+    args = parse_args(argv)
+    args.webhook = args.webhook or bool(args.updates)
+    updates_path = os.path.abspath(args.updates) if args.updates else None
+    services = FakeServices(
+        feeds=args.feeds,
+        items_per_cycle=args.items,
+        latency=_service_map(args.latency),
+        errors=_service_map(args.errors),
+        rate_limited=_service_map(args.rate_limited),
+        recorded_dir=args.recorded,
+        seed=args.seed
+    )
+    base_url = services.start()
+
+    # Переменные окружения читаются при импорте bot, поэтому задаются заранее
+    os.environ.update({
+        'TELEGRAM_BOT_TOKEN': TELEGRAM_TOKEN,
+        'TELEGRAM_ADMIN_CHAT_ID': ADMIN_CHAT_ID,
+        'TELEGRAM_CHANNEL_ID': CHANNEL_ID,
+        'TELEGRAM_API_URL': f"{base_url}/bot",
+        'GROQ_API_KEY': 'bench',
+        'GROQ_BASE_URL': base_url,
+        'STABILITY_API_KEY': 'bench',
+        'STABILITY_API_HOST': base_url,
+        'HEALTH_CHECKS': 'skip',
+        'BOT_MODE': 'polling',
+        'METRICS_PORT': '0',
+        # Вебхук поднимается только с --webhook; BOT_MODE остается polling, чтобы не регистрировать его
+        'WEBHOOK_LISTEN': '127.0.0.1',
+        'WEBHOOK_PORT': str(_free_port()),
+        'WEBHOOK_SECRET': WEBHOOK_SECRET
+    })
+    json_path = os.path.abspath(args.json_path) if args.json_path else None
+    # Все заглушки лент на одном хосте, то есть для бота это один источник
+    os.environ.setdefault('RANKING_MAX_PER_SOURCE', str(args.feeds * args.items))
+    # Циклы идут подряд: окно бюджета API короче цикла, каждый цикл получает полный бюджет
+    os.environ.setdefault('BUDGET_WINDOW', '1')
+    workdir = args.workdir or tempfile.mkdtemp(prefix='newsbot-bench-')
+    os.makedirs(workdir, exist_ok=True)
+    os.chdir(workdir)
+    args.updates = updates_path
+
+    import bot
+    from utils.rate_limiter import DEFAULT_LIMITS, RateLimiter
+
+    logging.getLogger().setLevel(args.log_level.upper())
+    bot.RSS_URLS = services.feed_urls
+
+    tracemalloc.start()
+    newsbot = bot.NewsBot()
+    if args.unthrottled:
+        newsbot.limiter = RateLimiter({key: (1e6, 1e6) for key in DEFAULT_LIMITS})
+    try:
+        result = asyncio.run(run_benchmark(newsbot, services, args))
+        report = build_report(result, services)
+    finally:
+        newsbot.watermarker.shutdown()
+        newsbot.storage.close()
+        services.stop()
+
+    print_report(report)
+    print(f"Рабочий каталог: {workdir}")
+    if json_path:
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -1,20 +1,39 @@
 import os
+import argparse
 import asyncio
-import sqlite3
+import io
+import json
+import hmac
+import socket
 import threading
-import queue
-from queue import Queue
 import time
 from datetime import datetime
-from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup
+from PIL import Image
+from telegram import Bot, InlineKeyboardButton, InlineKeyboardMarkup, InputMediaPhoto, Update
 from telegram.ext import Application, CallbackQueryHandler
-from groq import Groq
-from utils.rss_parser import parse_rss
-from utils.image_gen import generate_image
+from groq import APIConnectionError, AsyncGroq, InternalServerError
+from utils.rss_parser import parse_rss_async
+from utils.feed_cache import FeedCache
+from utils.feed_scheduler import FeedScheduler
+from utils.ranking import ArticleRanker
+from utils.candidate_pool import CandidatePool
+from utils.pipeline import Pipeline, Stage
+from utils.rate_limiter import RateLimiter
+from utils.llm_cache import CompletionCache, make_key
+from utils.image_store import ImageStore
+from utils.watermark import Watermarker
+from utils.similarity import StoryIndex
+from utils.url_dedup import UrlDeduplicator, normalize_url
+from utils.job_queue import JobQueue
+from utils.maintenance import Maintenance, enable_incremental_vacuum
+from storage import Storage
+from utils.lru import LRUCache
+from utils.image_gen import ProfileController, generate_image, get_image_generator
+from utils.health import HealthChecker
+from utils.http_server import HTTPServer, Request, Response
+from utils.http_client import close_http_client, get_http_client
+from utils.metrics import REGISTRY
 import logging
-from PIL import Image, ImageDraw, ImageFont
-import io
-import requests
 import signal
 import random
 from typing import Optional
@@ -30,16 +49,184 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Число параллельных воркеров на этапах конвейера обработки новостей
+PIPELINE_TEXT_WORKERS = int(os.getenv("PIPELINE_TEXT_WORKERS", "2"))
+PIPELINE_IMAGE_WORKERS = int(os.getenv("PIPELINE_IMAGE_WORKERS", "2"))
+PIPELINE_SEND_WORKERS = int(os.getenv("PIPELINE_SEND_WORKERS", "1"))
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "4"))
+
+NEWS_MODEL = "llama3-70b-8192"
+NEWS_SYSTEM_PROMPT = """Ты профессиональный журналист, пишешь для Telegram-канала @ai_revo об искусственном интеллекте.
+⚡ Пиши **коротко, ясно, по делу**. **Без воды**, только важное.  
+🎯 Ориентируйся на Telegram-формат — емкость важнее деталей.  
+
+Строго соблюдай правила оформления:  
+1. **Заголовок** (переводи на русский):  
+   - 📌 <b>Краткий, цепляющий заголовок с эмодзи</b>  
+   - Максимально 8-10 слов.  
+2. **Основной текст**:  
+   - 🔍 Короткое введение (1-2 предложения).  
+   - 📌 Ключевые факты (3-5 пунктов, без лишних деталей).  
+   - 💡 Итог: почему это важно?  
+3. **Оформление**:  
+   - **Переводи** заголовки и текст на **русский**!  
+   - Используй HTML-форматирование: <b>жирный</b>, <i>курсив</i>, <code>код</code>.  
+   - Эмодзи — для логического разделения блоков (но **не более 5** на пост).  
+   - Абзацы **короткие** (1-2 предложения).  
+4. **Конец поста**:  
+   - 🌐 Источник: <a href="URL">Название сайта</a>.  
+   - 🔔 <b>Подпишись на @ai_revo</b> — только важные новости об ИИ!  
+"""
+
+NEWS_BATCH_INSTRUCTIONS = """
+Тебе передается JSON-массив новостей с полями id, title и description.
+Напиши отдельный пост для каждой новости по правилам выше.
+Ответ верни строго JSON-объектом вида {"posts": [{"id": "<id новости>", "text": "<текст поста>"}]} без пояснений.
+"""
+
+# Повторы запроса к Groq после сетевой ошибки или ответа 5xx и пауза перед первым из них
+GROQ_RETRIES = 2
+GROQ_RETRY_DELAY = 0.5
+
+# Сколько новостей отправлять в Groq одним запросом (1 — без пакетов)
+LLM_BATCH_SIZE = int(os.getenv("LLM_BATCH_SIZE", "4"))
+
+# Роли процесса через запятую: fetch — опрос лент и отбор новостей, generate — тексты
+# и изображения, publish — отправка на модерацию и обработка кнопок
+BOT_ROLES = os.getenv("BOT_ROLES", "fetch,generate,publish")
+ALL_ROLES = ('fetch', 'generate', 'publish')
+# Как часто воркер проверяет очередь, если задачи ставит другой процесс
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "5"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+GENERATE_LEASE_SECONDS = int(os.getenv("GENERATE_LEASE_SECONDS", "900"))
+PUBLISH_LEASE_SECONDS = int(os.getenv("PUBLISH_LEASE_SECONDS", "300"))
+
+# Сколько пост на модерации ждет изображение, прежде чем остаться с fallback,
+# и как часто искать такие посты
+IMAGE_ATTACH_DEADLINE = int(os.getenv("IMAGE_ATTACH_DEADLINE", "600"))
+IMAGE_EXPIRY_INTERVAL = 60
+
+# Бюджет API на скользящее окно BUDGET_WINDOW секунд: генераций изображений и
+# запросов к Groq (пакетных). Расход считается по задачам generate в БД, поэтому
+# частые опросы лент не увеличивают его, а перезапуск не обнуляет
+BUDGET_WINDOW = int(os.getenv("BUDGET_WINDOW", "3600"))
+WINDOW_IMAGE_BUDGET = int(os.getenv("WINDOW_IMAGE_BUDGET", "8"))
+WINDOW_LLM_BUDGET = int(os.getenv("WINDOW_LLM_BUDGET", "4"))
+
+# Получение обновлений: polling или webhook (встроенный HTTP-сервер)
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+
+# Режим проверок сервисов при запуске: background или skip
+HEALTH_CHECKS = os.getenv("HEALTH_CHECKS", "background")
+
+# Адрес Bot API (локальный сервер Bot API или заглушка в бенчмарках); Groq берет GROQ_BASE_URL сам
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org/bot")
+
+# Встроенный HTTP-эндпоинт /metrics (не запускается, если порт не задан) и сводка в лог
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_LOG_INTERVAL = int(os.getenv("METRICS_LOG_INTERVAL", "900"))
+
+# Обслуживание БД и изображений (роль fetch): часы малой нагрузки "с-до" по
+# местному времени (пусто — в любое время) и пауза между запусками
+MAINTENANCE_HOURS = os.getenv("MAINTENANCE_HOURS", "3-6")
+MAINTENANCE_INTERVAL = int(os.getenv("MAINTENANCE_INTERVAL", "3600"))
+
+STAGE_SECONDS = REGISTRY.histogram('newsbot_stage_seconds', 'Длительность этапов обработки новостей', ['stage'])
+CYCLE_SECONDS = REGISTRY.histogram('newsbot_cycle_seconds', 'Длительность цикла проверки новостей',
+                                   buckets=(10, 30, 60, 120, 300, 600, 1200, 1800, 3600))
+API_ERRORS = REGISTRY.counter('newsbot_api_errors_total', 'Ошибки обращений к внешним API', ['api'])
+FALLBACKS = REGISTRY.counter('newsbot_fallbacks_total', 'Использованные запасные варианты', ['kind'])
+POSTS = REGISTRY.counter('newsbot_posts_total', 'Посты по этапам модерации', ['status'])
+MAINTENANCE_REMOVED = REGISTRY.counter('newsbot_maintenance_removed_total',
+                                      'Удалено при обслуживании: постов, задач, файлов изображений', ['kind'])
+LLM_CACHE = REGISTRY.counter('newsbot_llm_cache_total', 'Обращения к кэшу LLM', ['result'])
+IMAGES_BY_PROFILE = REGISTRY.counter('newsbot_image_profile_total', 'Сгенерированные изображения по профилю качества',
+                                     ['profile'])
+
+RSS_URLS = [
+    "https://www.technologyreview.com/topic/artificial-intelligence/feed/",
+    "https://export.arxiv.org/rss/cs.AI",
+    "https://rsshub.app/deepmind/blog",
+    "https://venturebeat.com/category/ai/feed/",
+    "https://www.theverge.com/rss/ai/index.xml",
+    "https://syncedreview.com/tag/artificial-intelligence/feed/",
+    "https://hnrss.org/newest?q=AI+OR+LLM+OR+GPT",
+    "https://lobste.rs/t/ai.rss"
+]
+
 class NewsBot:
     def __init__(self):
         self.shutdown_event = threading.Event()
-        self.db_queue = Queue()
-        self._init_db_worker()
+        self.loop = None
+        self.stop_event = None
+        self.http_servers = {}
+        self.pipeline = None
+        self.limiter = RateLimiter()
+        self.image_store = ImageStore(
+            budget_bytes=int(os.getenv("IMAGE_STORE_BUDGET_MB", "500")) * 1024 * 1024
+        )
+        # Под нагрузкой изображения генерируются дешевле и быстрее
+        self.image_profiles = ProfileController(
+            busy_backlog=int(os.getenv("IMAGE_BUSY_BACKLOG", "4")),
+            overload_backlog=int(os.getenv("IMAGE_OVERLOAD_BACKLOG", "12"))
+        )
+        self.watermarker = Watermarker(
+            image_format=os.getenv("WATERMARK_FORMAT", "JPEG"),
+            quality=int(os.getenv("WATERMARK_QUALITY", "85")),
+            workers=int(os.getenv("WATERMARK_WORKERS", "2"))
+        )
+        self._init_storage()
+        self.jobs = JobQueue(self.storage, max_attempts=JOB_MAX_ATTEMPTS)
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        # Сигнал воркерам этого процесса о новых задачах (другие процессы опрашивают очередь)
+        self.jobs_ready = {kind: asyncio.Event() for kind in ('generate', 'publish')}
+        # Последние прочитанные числа задач: метрика отдает их без запроса к БД
+        self.job_counts = {}
+        self.job_counts_at = 0.0
+        # Посты на модерации: одобрение не требует чтения из БД и с диска
+        self.pending_posts = LRUCache(int(os.getenv("PENDING_CACHE_SIZE", "256")))
         self._check_env()
         self._init_clients()
-        self._test_rss_feeds()
-        self._init_processed_urls_db()
+        self.feed_cache = FeedCache(self.storage)
+        self.feed_scheduler = FeedScheduler(
+            self.storage,
+            RSS_URLS,
+            min_interval=int(os.getenv("FEED_MIN_INTERVAL", str(10 * 60))),
+            max_interval=int(os.getenv("FEED_MAX_INTERVAL", str(24 * 60 * 60)))
+        )
+        self.ranker = ArticleRanker(self.storage, max_per_source=int(os.getenv("RANKING_MAX_PER_SOURCE", "3")))
+        self.candidate_pool = CandidatePool(
+            self.storage,
+            max_age=int(os.getenv("CANDIDATE_MAX_AGE", str(3 * 24 * 60 * 60)))
+        )
+        self.story_index = StoryIndex(
+            self.storage,
+            threshold=float(os.getenv("SIMILARITY_THRESHOLD", "0.6")),
+            title_threshold=float(os.getenv("SIMILARITY_TITLE_THRESHOLD", "0.5")),
+            title_text_threshold=float(os.getenv("SIMILARITY_TITLE_TEXT_THRESHOLD", "0.2"))
+        )
+        self._init_health_checks()
+        self._init_metrics()
+        self.maintenance = Maintenance(
+            self.storage,
+            self.image_store,
+            retention_days=int(os.getenv("POST_RETENTION_DAYS", "30")),
+            mode=os.getenv("POST_RETENTION_MODE", "archive"),
+            batch_size=int(os.getenv("MAINTENANCE_BATCH_SIZE", "500"))
+        )
+        self.url_dedup = UrlDeduplicator(
+            self.storage,
+            retention_days=int(os.getenv("PROCESSED_URLS_RETENTION_DAYS", "90"))
+        )
         self.fallback_image = self._load_fallback_image()
+        # Заглушка в сообщении модерации, пока генерируется изображение; после
+        # первой отправки Telegram хранит ее, и дальше достаточно file_id
+        self.placeholder_image = self.fallback_image or self._make_placeholder_image()
+        self.placeholder_file_id = None
+        self.next_image_expiry = 0.0
         
         signal.signal(signal.SIGINT, self._handle_signal)
         signal.signal(signal.SIGTERM, self._handle_signal)
@@ -47,6 +234,8 @@ class NewsBot:
     def _handle_signal(self, signum, frame):
         logger.info(f"Получен сигнал {signum}, завершаем работу...")
         self.shutdown_event.set()
+        if self.loop is not None and self.stop_event is not None:
+            self.loop.call_soon_threadsafe(self.stop_event.set)
 
     def _load_fallback_image(self) -> Optional[bytes]:
         try:
@@ -60,188 +249,273 @@ class NewsBot:
             logger.error(f"Ошибка загрузки fallback-изображения: {str(e)}")
             return None
 
-    def _init_db_worker(self):
-        def db_worker():
-            conn = sqlite3.connect('posts.db', check_same_thread=False)
-            cursor = conn.cursor()
-            cursor.execute('''CREATE TABLE IF NOT EXISTS posts
-                           (id TEXT PRIMARY KEY,
-                            text TEXT,
-                            image_path TEXT,
-                            status TEXT,
-                            source TEXT,
-                            url TEXT UNIQUE,
-                            created_at TEXT)''')
-            cursor.execute('''CREATE TABLE IF NOT EXISTS processed_urls
-                           (url TEXT PRIMARY KEY,
-                            processed_at TEXT)''')
-            conn.commit()
-            
-            while not self.shutdown_event.is_set():
-                try:
-                    task = self.db_queue.get(timeout=1)
-                    if task[0] == 'save_post':
-                        _, post_id, text, image_bytes, source, url = task
-                        image_path = None
-                        if image_bytes:
-                            os.makedirs("images", exist_ok=True)
-                            image_path = f"images/{post_id}.png"
-                            with open(image_path, 'wb') as f:
-                                f.write(image_bytes)
-                        
-                        cursor.execute(
-                            "INSERT OR IGNORE INTO posts VALUES (?, ?, ?, ?, ?, ?, ?)",
-                            (post_id, text, image_path, 'pending', source, url, datetime.now().isoformat())
-                        )
-                        conn.commit()
-                    
-                    elif task[0] == 'update_status':
-                        _, post_id, status = task
-                        cursor.execute(
-                            "UPDATE posts SET status=? WHERE id=?",
-                            (status, post_id)
-                        )
-                        conn.commit()
-
-                except queue.Empty:
-                    pass
-                except Exception as e:
-                    logger.error(f"Ошибка в рабочем потоке БД: {str(e)}")
+    def _make_placeholder_image(self) -> bytes:
+        """Однотонная заглушка, если нет assets/fallback.png"""
+        buffer = io.BytesIO()
+        Image.new('RGB', (512, 512), (32, 36, 58)).save(buffer, format='PNG')
+        return buffer.getvalue()
 
-            conn.close()
-            logger.info("Рабочий поток БД остановлен")
+    def _init_storage(self):
+        self.storage = Storage(pool_size=int(os.getenv("DB_POOL_SIZE", "4")))
+        self.storage.open()
 
-        self.db_thread = threading.Thread(target=db_worker, daemon=True)
-        self.db_thread.start()
+    async def _save_post(self, post_id: str, text: str, image_bytes: Optional[bytes],
+                         source: str, url: str, file_id: Optional[str] = None,
+                         title: Optional[str] = None, image_profile: Optional[str] = None,
+                         message_id: Optional[int] = None, image_pending: bool = False):
+        image_path = None
+        if image_bytes:
+            image_path = await asyncio.to_thread(self.image_store.put, image_bytes)
+        await self.storage.save_post(post_id, text, image_path, source, url, file_id, title, image_profile,
+                                     message_id, image_pending)
 
-    def _init_processed_urls_db(self):
-        conn = sqlite3.connect('posts.db')
-        conn.close()
+        # Изображения постов на модерации не вытесняются
+        if self.image_store.over_budget():
+            protected = await self.storage.pending_image_paths()
+            await asyncio.to_thread(self.image_store.evict, protected)
 
     def _check_env(self):
         required_vars = ['TELEGRAM_BOT_TOKEN', 'TELEGRAM_ADMIN_CHAT_ID', 
                         'TELEGRAM_CHANNEL_ID', 'GROQ_API_KEY', 'STABILITY_API_KEY']
+        if BOT_MODE == 'webhook':
+            required_vars.append('WEBHOOK_SECRET')
         for var in required_vars:
             if not os.getenv(var):
                 raise ValueError(f"Отсутствует обязательная переменная окружения: {var}")
 
     def _init_clients(self):
-        self.groq = Groq(api_key=os.getenv("GROQ_API_KEY"))
-        self.bot = Bot(token=os.getenv("TELEGRAM_BOT_TOKEN"))
-        
-        try:
-            test_image = generate_image("test connection")
-            if test_image:
-                logger.info("Stability API подключен успешно")
-            else:
-                logger.warning("Stability API не вернул изображение")
-        except Exception as e:
-            logger.error(f"Ошибка подключения к Stability API: {str(e)}")
-
-    def _test_rss_feeds(self):
-        rss_urls = [
-            "https://www.technologyreview.com/topic/artificial-intelligence/feed/",
-            "https://export.arxiv.org/rss/cs.AI",
-            "https://rsshub.app/deepmind/blog",
-            "https://venturebeat.com/category/ai/feed/",
-            "https://www.theverge.com/rss/ai/index.xml",
-            "https://syncedreview.com/tag/artificial-intelligence/feed/",
-            "https://hnrss.org/newest?q=AI+OR+LLM+OR+GPT",
-            "https://lobste.rs/t/ai.rss"
-        ]
-        
-        logger.info("=== ПРОВЕРКА RSS-ЛЕНТ ===")
-        working_feeds = 0
-        
-        for url in rss_urls:
+        # Повторы SDK отключены: 429 повторяет общий лимитер по заголовкам ответа,
+        # сетевые ошибки и 5xx — _groq_completion
+        self.groq = AsyncGroq(api_key=os.getenv("GROQ_API_KEY"), max_retries=0)
+        self.llm_cache = CompletionCache(
+            self.storage,
+            ttl=int(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 60 * 60))),
+            max_bytes=int(os.getenv("LLM_CACHE_MAX_BYTES", str(20 * 1024 * 1024)))
+        )
+        self.bot = Bot(token=os.getenv("TELEGRAM_BOT_TOKEN"), base_url=TELEGRAM_API_URL)
+
+    def _init_metrics(self):
+        REGISTRY.gauge('newsbot_db_queue_depth', 'Задачи в очереди пишущего потока БД',
+                       callback=self.storage.queue_size)
+        REGISTRY.gauge('newsbot_pipeline_queue_depth', 'Элементы, ожидающие этапа конвейера', ['stage'],
+                       callback=lambda: {(stage,): depth for stage, depth in
+                                         (self.pipeline.queue_depths() if self.pipeline else {}).items()})
+        REGISTRY.gauge('newsbot_pending_cache_size', 'Посты на модерации в памяти',
+                       callback=lambda: len(self.pending_posts))
+        REGISTRY.gauge('newsbot_jobs', 'Задачи в очереди по виду и статусу', ['kind', 'status'],
+                       callback=lambda: self.job_counts)
+
+    async def _refresh_job_counts(self) -> dict:
+        """Читает числа задач вне event loop и запоминает их для метрики"""
+        self.job_counts = await asyncio.to_thread(self.jobs.counts)
+        self.job_counts_at = time.monotonic()
+        return self.job_counts
+
+    async def _handle_metrics(self, request: Request) -> Response:
+        await self._refresh_job_counts()
+        return Response(200, REGISTRY.render(), 'text/plain; version=0.0.4; charset=utf-8')
+
+    async def _log_metrics_summary(self):
+        while True:
+            await asyncio.sleep(METRICS_LOG_INTERVAL)
+            summary = REGISTRY.summary()
+            if summary:
+                logger.info(f"Метрики: {summary}")
+
+    def _in_maintenance_window(self) -> bool:
+        if not MAINTENANCE_HOURS:
+            return True
+        start, end = (int(hour) % 24 for hour in MAINTENANCE_HOURS.split('-', 1))
+        hour = datetime.now().hour
+        # Окно может переходить через полночь, например 23-2
+        return start <= hour < end if start <= end else hour >= start or hour < end
+
+    async def _maintenance_loop(self):
+        """Обслуживание в часы малой нагрузки и только при пустой очереди задач"""
+        while True:
+            await asyncio.sleep(MAINTENANCE_INTERVAL)
             try:
-                response = requests.get(url, timeout=10)
-                if response.status_code == 200:
-                    logger.info(f"✓ Рабочий RSS: {url}")
-                    working_feeds += 1
-                else:
-                    logger.warning(f"✗ Недоступен (код {response.status_code}): {url}")
+                if not self._in_maintenance_window():
+                    continue
+                counts = await self._refresh_job_counts()
+                if any(count for (_, status), count in counts.items() if status in ('queued', 'leased')):
+                    logger.info("Обслуживание отложено: в очереди есть задачи")
+                    continue
+                stats = await asyncio.to_thread(self.maintenance.run)
+                for kind in ('posts', 'jobs', 'images'):
+                    if stats.get(kind):
+                        MAINTENANCE_REMOVED.inc(stats[kind], kind=kind)
             except Exception as e:
-                logger.error(f"✗ Ошибка подключения к {url}: {str(e)}")
-        
-        logger.info(f"Итого: {working_feeds}/{len(rss_urls)} рабочих RSS-лент")
+                logger.error(f"Ошибка обслуживания: {str(e)}")
 
-    def _add_watermark(self, image_bytes: bytes) -> bytes:
-        try:
-            img = Image.open(io.BytesIO(image_bytes)).convert('RGBA')
-            width, height = img.size
-            
-            watermark = Image.new('RGBA', img.size, (0, 0, 0, 0))
-            draw = ImageDraw.Draw(watermark)
-            
-            font_size = max(int(width * 0.03), 14)
-            
+    def _http_server_for(self, host: str, port: int) -> HTTPServer:
+        """Один сервер на порт: вебхук и /metrics могут делить его"""
+        if port not in self.http_servers:
+            self.http_servers[port] = HTTPServer(host, port)
+        return self.http_servers[port]
+
+    def _init_health_checks(self):
+        """Регистрирует дешевые проверки сервисов; сами проверки ленивые"""
+        self.health = HealthChecker(ttl=int(os.getenv("HEALTH_CHECK_TTL", "300")))
+
+        async def telegram_probe():
+            await self.limiter.call('telegram', self.bot.get_me)
+            return True
+
+        async def groq_probe():
+            await self.limiter.call('groq', self.groq.models.list)
+            return True
+
+        async def stability_probe():
+            return await get_image_generator().check_balance()
+
+        def feed_probe(url):
+            async def probe():
+                # Соединение из пула затем переиспользуется при загрузке ленты
+                response = await get_http_client().head(url, timeout=5, retries=0)
+                # Некоторые ленты не поддерживают HEAD, но сервер отвечает
+                return response.status_code < 400 or response.status_code == 405
+            return probe
+
+        self.health.register('Telegram Bot API', telegram_probe)
+        self.health.register('Groq API', groq_probe)
+        self.health.register('Stability API', stability_probe)
+        for url in RSS_URLS:
+            self.health.register(f"RSS {url}", feed_probe(url))
+
+    async def _run_health_checks(self):
+        logger.info("=== ПРОВЕРКА СЕРВИСОВ ===")
+        await self.health.check_all()
+
+    async def _groq_completion(self, system_prompt: str, user_content: str,
+                               max_tokens: int = 1000, **extra) -> str:
+        for attempt in range(GROQ_RETRIES + 1):
             try:
-                font = ImageFont.truetype("arial.ttf", font_size)
-            except:
-                font = ImageFont.load_default()
-                font.size = font_size
-            
-            watermark_text = "@ai_revo"
-            text_width = draw.textlength(watermark_text, font=font)
-            
-            x = width - text_width - 10
-            y = height - font_size - 10
-            
-            draw.rectangle(
-                [x - 5, y - 2, x + text_width + 5, y + font_size + 2],
-                fill=(0, 0, 0, 120))
-            
-            draw.text((x, y), watermark_text, font=font, fill=(255, 255, 255, 220))
-            
-            watermarked = Image.alpha_composite(img, watermark)
-            
-            output = io.BytesIO()
-            watermarked.save(output, format='PNG')
-            return output.getvalue()
-        except Exception as e:
-            logger.error(f"Ошибка добавления водяного знака: {str(e)}")
-            return image_bytes
+                with STAGE_SECONDS.time(stage='groq'):
+                    raw_response = await self.limiter.call(
+                        'groq',
+                        self.groq.chat.completions.with_raw_response.create,
+                        model=NEWS_MODEL,
+                        messages=[{
+                            "role": "system",
+                            "content": system_prompt
+                        }, {
+                            "role": "user",
+                            "content": user_content
+                        }],
+                        temperature=0.5,
+                        max_tokens=max_tokens,
+                        top_p=0.9,
+                        **extra
+                    )
+                break
+            except (APIConnectionError, InternalServerError) as e:
+                API_ERRORS.inc(api='groq')
+                if attempt == GROQ_RETRIES:
+                    raise
+                delay = GROQ_RETRY_DELAY * 2 ** attempt * random.uniform(0.8, 1.2)
+                logger.warning(f"Groq: {str(e)}, повтор через {delay:.1f} сек")
+                await asyncio.sleep(delay)
+            except Exception:
+                API_ERRORS.inc(api='groq')
+                raise
+        self.limiter.update_from_headers('groq', raw_response.headers)
+        response = await raw_response.parse()
+        return response.choices[0].message.content
+
+    def _fallback_news_text(self, title: str, description: str) -> str:
+        FALLBACKS.inc(kind='fallback_text')
+        return f"📌 <b>{title}</b>\n\n{description}\n\n🔔 <b>Подпишись на @ai_revo</b>"
 
     async def generate_news_text(self, title: str, description: str) -> str:
         try:
-            response = self.groq.chat.completions.create(
-                model="llama3-70b-8192",
-                messages=[{
-                    "role": "system",
-                    "content": """Ты профессиональный журналист, пишешь для Telegram-канала @ai_revo об искусственном интеллекте.
-⚡ Пиши **коротко, ясно, по делу**. **Без воды**, только важное.  
-🎯 Ориентируйся на Telegram-формат — емкость важнее деталей.  
+            cache_key = make_key(NEWS_MODEL, NEWS_SYSTEM_PROMPT, title, description)
+            cached = await asyncio.to_thread(self.llm_cache.get, cache_key)
+            if cached:
+                LLM_CACHE.inc(result='hit')
+                logger.info(f"Текст взят из кэша LLM: {title[:50]}")
+                return cached
+            LLM_CACHE.inc(result='miss')
 
-Строго соблюдай правила оформления:  
-1. **Заголовок** (переводи на русский):  
-   - 📌 <b>Краткий, цепляющий заголовок с эмодзи</b>  
-   - Максимально 8-10 слов.  
-2. **Основной текст**:  
-   - 🔍 Короткое введение (1-2 предложения).  
-   - 📌 Ключевые факты (3-5 пунктов, без лишних деталей).  
-   - 💡 Итог: почему это важно?  
-3. **Оформление**:  
-   - **Переводи** заголовки и текст на **русский**!  
-   - Используй HTML-форматирование: <b>жирный</b>, <i>курсив</i>, <code>код</code>.  
-   - Эмодзи — для логического разделения блоков (но **не более 5** на пост).  
-   - Абзацы **короткие** (1-2 предложения).  
-4. **Конец поста**:  
-   - 🌐 Источник: <a href="URL">Название сайта</a>.  
-   - 🔔 <b>Подпишись на @ai_revo</b> — только важные новости об ИИ!  
-"""
-                }, {
-                    "role": "user",
-                    "content": f"Заголовок: {title}\n\nТекст: {description}"
-                }],
-                temperature=0.5,
-                max_tokens=1000,
-                top_p=0.9
+            text = await self._groq_completion(
+                NEWS_SYSTEM_PROMPT,
+                f"Заголовок: {title}\n\nТекст: {description}"
             )
-            return response.choices[0].message.content
+            if text:
+                await asyncio.to_thread(self.llm_cache.put, cache_key, NEWS_MODEL, text)
+            return text
         except Exception as e:
             logger.error(f"Ошибка генерации текста новости: {str(e)}")
-            return f"📌 <b>{title}</b>\n\n{description}\n\n🔔 <b>Подпишись на @ai_revo</b>"
+            return self._fallback_news_text(title, description)
+
+    def _parse_batch_response(self, content: str, expected_ids) -> dict:
+        """Разбирает JSON-ответ пакетной генерации, оставляя только валидные посты"""
+        try:
+            posts = json.loads(content).get('posts', [])
+        except (ValueError, AttributeError) as e:
+            logger.warning(f"Некорректный JSON пакетной генерации: {str(e)}")
+            return {}
+
+        texts = {}
+        for post in posts if isinstance(posts, list) else []:
+            if not isinstance(post, dict):
+                continue
+            post_id = str(post.get('id', ''))
+            text = post.get('text')
+            if post_id in expected_ids and isinstance(text, str) and text.strip():
+                texts[post_id] = text.strip()
+        return texts
+
+    async def generate_news_texts_batch(self, entries: list) -> list:
+        """Генерирует тексты для нескольких новостей одним запросом к Groq.
+
+        Новости из кэша не отправляются; для тех, что не прошли проверку
+        ответа, выполняется обычный запрос по одной. Тексты пакета кэшируются
+        под ключом пакетного промпта: ответ в JSON-режиме отличается от
+        ответа на одиночный запрос.
+        """
+        texts = [None] * len(entries)
+        system_prompt = NEWS_SYSTEM_PROMPT + NEWS_BATCH_INSTRUCTIONS
+        keys = [make_key(NEWS_MODEL, system_prompt, e.get('title', ''), e.get('description', ''))
+                for e in entries]
+        pending = []
+        for i, key in enumerate(keys):
+            texts[i] = await asyncio.to_thread(self.llm_cache.get, key)
+            if texts[i] is None:
+                pending.append(i)
+            LLM_CACHE.inc(result='miss' if texts[i] is None else 'hit')
+        if len(entries) - len(pending):
+            logger.info(f"Текстов из кэша LLM: {len(entries) - len(pending)}/{len(entries)}")
+
+        if len(pending) > 1:
+            items = [{
+                'id': str(i),
+                'title': entries[i].get('title', ''),
+                'description': entries[i].get('description', '')
+            } for i in pending]
+            try:
+                content = await self._groq_completion(
+                    system_prompt,
+                    json.dumps(items, ensure_ascii=False),
+                    max_tokens=min(1000 * len(items), 6000),
+                    response_format={"type": "json_object"}
+                )
+                generated = self._parse_batch_response(content, {item['id'] for item in items})
+                logger.info(f"Пакетная генерация: {len(generated)}/{len(items)} постов за один запрос")
+                for i in pending:
+                    if str(i) in generated:
+                        texts[i] = generated[str(i)]
+                        await asyncio.to_thread(self.llm_cache.put, keys[i], NEWS_MODEL, texts[i])
+            except Exception as e:
+                logger.error(f"Ошибка пакетной генерации текстов: {str(e)}")
+
+        for i in pending:
+            if texts[i] is None:
+                texts[i] = await self.generate_news_text(
+                    entries[i].get('title', ''),
+                    entries[i].get('description', '')
+                )
+        return texts
 
     def _generate_safe_image_prompt(self, title: str) -> str:
         banned_words = ["nude", "sexy", "violence", "blood", "war", "kill", 
@@ -259,181 +533,571 @@ class NewsBot:
         
         return f"{clean_title[:150]}, {base_prompt}"
 
-    async def _generate_and_process_image(self, title: str) -> Optional[bytes]:
+    async def _generate_and_process_image(self, title: str, backlog: int = 0):
+        """Изображение и имя профиля, с которым оно сгенерировано (None для fallback).
+
+        backlog — сколько изображений еще ждут генерации: по нему выбирается профиль.
+        """
         try:
             image_prompt = self._generate_safe_image_prompt(title)
-            logger.info(f"Генерация изображения для: {title[:50]}...")
+            profile = self.image_profiles.choose(backlog)
+            logger.info(f"Генерация изображения ({profile.name}) для: {title[:50]}...")
             
-            image_bytes = generate_image(image_prompt)
+            with STAGE_SECONDS.time(stage='stability'):
+                image_bytes = await self.limiter.call('stability', generate_image, image_prompt, profile,
+                                                      self.image_profiles)
             
             if image_bytes:
-                image_bytes = self._add_watermark(image_bytes)
+                IMAGES_BY_PROFILE.inc(profile=profile.name)
+                with STAGE_SECONDS.time(stage='watermark'):
+                    image_bytes = await self.watermarker.apply(image_bytes)
                 logger.info("Изображение успешно сгенерировано")
-                return image_bytes
+                return image_bytes, profile.name
             
+            API_ERRORS.inc(api='stability')
+            FALLBACKS.inc(kind='fallback_image')
             logger.warning("Не удалось сгенерировать изображение, используем fallback")
-            return self.fallback_image
+            return self.fallback_image, None
             
         except Exception as e:
+            API_ERRORS.inc(api='stability')
+            FALLBACKS.inc(kind='fallback_image')
             logger.error(f"Ошибка генерации изображения: {str(e)}")
-            return self.fallback_image
+            return self.fallback_image, None
+
+    async def _window_budget(self) -> int:
+        """Сколько новостей еще можно взять в работу в текущем окне бюджета API"""
+        limit = max(0, min(WINDOW_IMAGE_BUDGET, WINDOW_LLM_BUDGET * LLM_BATCH_SIZE))
+        spent = await asyncio.to_thread(self.jobs.created_since, 'generate', time.time() - BUDGET_WINDOW)
+        return max(0, limit - spent)
 
-    async def process_news(self):
+    async def process_news(self, urls: Optional[list] = None):
+        """Роль fetch: отбирает новости из лент urls (по умолчанию всех) в очередь генерации"""
+        urls = urls or RSS_URLS
+        candidates = {}
         try:
             logger.info("=== НАЧАЛО ОБРАБОТКИ НОВОСТЕЙ ===")
-            urls = [
-                "https://www.technologyreview.com/topic/artificial-intelligence/feed/",
-                "https://export.arxiv.org/rss/cs.AI",
-                "https://rsshub.app/deepmind/blog",
-                "https://venturebeat.com/category/ai/feed/",
-                "https://www.theverge.com/rss/ai/index.xml",
-                "https://syncedreview.com/tag/artificial-intelligence/feed/",
-                "https://hnrss.org/newest?q=AI+OR+LLM+OR+GPT",
-                "https://lobste.rs/t/ai.rss"
-            ]
-            
-            entries = parse_rss(urls)
+            with STAGE_SECONDS.time(stage='fetch'):
+                entries = await parse_rss_async(urls, cache=self.feed_cache)
             logger.info(f"Найдено {len(entries)} новостей из {len(urls)} источников")
 
-            conn = sqlite3.connect('posts.db')
-            cursor = conn.cursor()
-            cursor.execute("SELECT url FROM processed_urls")
-            processed_urls = {row[0] for row in cursor.fetchall()}
-            
-            new_entries = [entry for entry in entries if entry.get('url') not in processed_urls]
-            logger.info(f"Новых постов для обработки: {len(new_entries)}")
+            with STAGE_SECONDS.time(stage='dedup'):
+                new_entries = await asyncio.to_thread(self.url_dedup.filter_new, entries)
+                for entry in new_entries:
+                    candidates.setdefault(entry.get('feed'), []).append(entry['url'])
 
-            for i, entry in enumerate(new_entries, 1):
-                if self.shutdown_event.is_set():
-                    break
-                    
-                try:
-                    logger.info(f"Обработка {i}/{len(new_entries)}: {entry.get('source', 'Неизвестный источник')}")
-                    
-                    if not entry.get('url'):
-                        logger.warning("Пропускаем запись без URL")
-                        continue
-                    
-                    cursor.execute(
-                        "INSERT OR IGNORE INTO processed_urls VALUES (?, ?)",
-                        (entry['url'], datetime.now().isoformat())
-                    )
-                    conn.commit()
-                    
-                    post_text = await self.generate_news_text(
-                        entry.get('title', ''), 
-                        entry.get('description', '')
-                    )
-                    
-                    image_bytes = await self._generate_and_process_image(entry.get('title', ''))
-                    
-                    await self._send_for_moderation(
-                        text=post_text,
-                        image_bytes=image_bytes,
-                        source=entry.get('source', 'Неизвестный источник'),
-                        url=entry.get('url')
-                    )
-                    
-                    await asyncio.sleep(15)
-                    
-                except Exception as e:
-                    logger.error(f"Ошибка обработки новости: {str(e)}")
-                    await asyncio.sleep(30)
+                # Новости прошлых циклов, не уместившиеся в бюджет, ранжируются заново вместе с новыми:
+                # их ленты могли не измениться и не вернуть их повторно
+                fresh_urls = {normalize_url(e['url']) for e in new_entries if e.get('url')}
+                leftovers = await asyncio.to_thread(self.url_dedup.filter_new,
+                                                    await asyncio.to_thread(self.candidate_pool.load))
+                new_entries += [e for e in leftovers if normalize_url(e['url']) not in fresh_urls]
+
+                # Одна история из разных лент проходит генерацию только один раз
+                unique_entries = await asyncio.to_thread(self.story_index.cluster, new_entries, False)
+            logger.info(f"Новых постов для обработки: {len(unique_entries)} "
+                        f"(похожих пропущено: {len(new_entries) - len(unique_entries)})")
+
+            # Уже поставленные в очередь записи повторно не отбираются
+            queued = await asyncio.to_thread(
+                self.jobs.known_keys, 'generate', [normalize_url(e['url']) for e in unique_entries if e.get('url')]
+            )
+            unique_entries = [e for e in unique_entries
+                              if e.get('url') and normalize_url(e['url']) not in queued]
+
+            # Генерации достаются лучшим новостям цикла в пределах остатка бюджета окна
+            budget = await self._window_budget()
+            if unique_entries and not budget:
+                logger.info(f"Бюджет API на {BUDGET_WINDOW} сек исчерпан, "
+                            f"новости ждут следующих циклов: {len(unique_entries)}")
+            with STAGE_SECONDS.time(stage='ranking'):
+                new_entries = []
+                if budget:
+                    new_entries = await asyncio.to_thread(self.ranker.select, unique_entries, budget)
+                await asyncio.to_thread(self.story_index.remember, new_entries)
+
+            # URL отмечаются обработанными только после отправки на модерацию (роль publish)
+            queued_count = await asyncio.to_thread(
+                self.jobs.enqueue_many, 'generate', [(normalize_url(e['url']), e) for e in new_entries]
+            )
+            self.jobs_ready['generate'].set()
+            logger.info(f"Поставлено в очередь генерации: {queued_count}/{len(new_entries)}")
+            selected = {id(e) for e in new_entries}
+            await asyncio.to_thread(self.candidate_pool.replace,
+                                    [e for e in unique_entries if id(e) not in selected])
             
-            conn.close()
             logger.info("=== ЗАВЕРШЕНИЕ ОБРАБОТКИ НОВОСТЕЙ ===")
             
         except Exception as e:
             logger.critical(f"Критическая ошибка: {str(e)}")
+        finally:
+            # Ленты возвращаются в очередь планировщика даже после ошибки
+            for url in urls:
+                self.feed_scheduler.record(url, candidates.get(url))
 
-    async def _send_for_moderation(self, text: str, image_bytes: bytes = None, 
-                             source: str = None, url: str = None):
-        post_id = f"post-{int(time.time())}-{hash(text) % 10000}"
-        
-        keyboard = InlineKeyboardMarkup([[
+    async def _generate_jobs(self, jobs: list):
+        """Роль generate: тексты и изображения для арендованных задач.
+
+        Готовые тексты сразу уходят задачами publish, чтобы модераторы не ждали
+        изображений; изображение затем передается задачей attach.
+        """
+        completed = set()
+        # Задачи, аренду которых перехватил другой воркер: их результат отброшен
+        lost = set()
+        # Очередь изображений: задачи generate в БД плюс еще не начатые в этой пачке
+        queued = (await self._refresh_job_counts()).get(('generate', 'queued'), 0)
+        remaining = len(jobs)
+
+        async def text_stage(batch):
+            logger.info(f"Генерация текста для {len(batch)} новостей")
+            texts = await self.generate_news_texts_batch([entry['payload'] for entry in batch])
+            for entry, text in zip(batch, texts):
+                entry['text'] = text
+            # При повторе задачи generate пост уже стоит в очереди: ключ тот же
+            await asyncio.to_thread(self.jobs.enqueue_many, 'publish', [(entry['job'].key, {
+                'text': entry['text'],
+                'source': entry['payload'].get('source', 'Неизвестный источник'),
+                'url': entry['payload'].get('url'),
+                'title': entry['payload'].get('title'),
+                'image_pending': True
+            }) for entry in batch])
+            self.jobs_ready['publish'].set()
+            return batch
+
+        async def image_stage(entry):
+            nonlocal remaining
+            remaining -= 1
+            entry['image'], entry['image_profile'] = await self._generate_and_process_image(
+                entry['payload'].get('title', ''), backlog=queued + remaining
+            )
+            return entry
+
+        async def handoff_stage(entry):
+            job, payload = entry['job'], entry['payload']
+            image_path = None
+            if entry['image']:
+                image_path = await asyncio.to_thread(self.image_store.put, entry['image'])
+            # Завершение generate и постановка attach — одна транзакция
+            done = await asyncio.to_thread(self.jobs.complete, job, 'attach', {
+                'url': payload.get('url'),
+                'image_path': image_path,
+                'image_profile': entry['image_profile']
+            }, job.key)
+            if not done:
+                # Изображение без ссылок удалит обслуживание
+                logger.warning(f"Аренда задачи generate#{job.id} истекла и перешла к другому воркеру, "
+                               f"изображение не передано")
+                lost.add(job.id)
+                return entry
+            completed.add(job.id)
+            self.jobs_ready['publish'].set()
+            return entry
+
+        self.pipeline = pipeline = Pipeline([
+            Stage('text', text_stage, workers=PIPELINE_TEXT_WORKERS, batch_size=LLM_BATCH_SIZE),
+            Stage('image', image_stage, workers=PIPELINE_IMAGE_WORKERS),
+            Stage('handoff', handoff_stage, workers=PIPELINE_SEND_WORKERS),
+        ], queue_size=PIPELINE_QUEUE_SIZE)
+        await pipeline.run([{'job': job, 'payload': job.payload} for job in jobs],
+                           should_stop=self.shutdown_event.is_set)
+        for job in jobs:
+            if job.id not in completed and job.id not in lost:
+                await asyncio.to_thread(self.jobs.fail, job, "Генерация не завершена (см. лог конвейера)")
+
+    async def _publish_job(self, job):
+        """Роль publish: отправка на модерацию; URL считается обработанным только после нее.
+
+        Отправленное сообщение запоминается в данных задачи до сохранения поста:
+        если сохранение не удалось, повтор задачи только сохраняет пост, а не
+        присылает модераторам второе сообщение.
+        """
+        payload = job.payload
+        try:
+            image_bytes = None
+            if payload.get('image_path'):
+                image_bytes = await asyncio.to_thread(self.image_store.read, payload['image_path'])
+            sent = payload.get('sent')
+            if sent is None and payload.get('url') and await self.storage.get_post_by_url(payload['url']):
+                # Пост сохранила прошлая попытка, не успевшая завершить задачу
+                logger.info(f"Пост для {payload['url']} уже на модерации, повторно не отправляется")
+            else:
+                if sent is None:
+                    post_id, message_id, file_id = await self._send_for_moderation(
+                        text=payload['text'],
+                        image_bytes=image_bytes,
+                        image_pending=payload.get('image_pending', False)
+                    )
+                    # Изображение поста с image_pending попадет в кэш вместе с задачей attach
+                    self.pending_posts.put(post_id, (payload['text'], None, payload.get('source'),
+                                                     payload.get('url'), file_id))
+                    POSTS.inc(status='moderation')
+                    sent = payload['sent'] = {'post_id': post_id, 'message_id': message_id, 'file_id': file_id}
+                    await asyncio.to_thread(self.jobs.save_payload, job, payload)
+                await self._save_post(sent['post_id'], payload['text'], image_bytes, payload.get('source'),
+                                      payload.get('url'), sent['file_id'], payload.get('title'),
+                                      payload.get('image_profile'), sent['message_id'],
+                                      payload.get('image_pending', False))
+            if payload.get('url'):
+                await asyncio.to_thread(self.url_dedup.mark, [payload['url']])
+            await asyncio.to_thread(self.jobs.complete, job)
+        except Exception as e:
+            await asyncio.to_thread(self.jobs.fail, job, str(e))
+
+    async def _attach_job(self, job):
+        """Роль publish: заменяет заглушку в сообщении модерации готовым изображением.
+
+        Если пост уже одобрен, вместе с завершением задачи ставится задача channel
+        на публикацию; после дедлайна изображение не прикрепляется — пост
+        остается с fallback.
+        """
+        payload = job.payload
+        try:
+            post = await self.storage.get_post_by_url(payload['url'])
+            if post is None:
+                # Задача publish еще не выполнена: повторим с паузой
+                raise RuntimeError("Пост еще не отправлен на модерацию")
+            post_id, status, text, message_id, image_pending = post
+            if not image_pending:
+                if status != 'approved':
+                    logger.info(f"Изображение для поста {post_id} опоздало, пост остается с fallback")
+                await self._complete_with_channel_job(job, post_id, message_id, status)
+                return
+
+            image_bytes = None
+            if payload.get('image_path'):
+                image_bytes = await asyncio.to_thread(self.image_store.read, payload['image_path'])
+            file_id = None
+            # Для fallback (профиль не задан) заглушка в сообщении уже подходящая
+            if status == 'pending' and message_id and image_bytes and payload.get('image_profile'):
+                admin_chat_id = os.getenv("TELEGRAM_ADMIN_CHAT_ID")
+                message = await self._telegram_call(
+                    admin_chat_id,
+                    self.bot.edit_message_media,
+                    chat_id=admin_chat_id,
+                    message_id=message_id,
+                    media=InputMediaPhoto(image_bytes, caption=text[:1024], parse_mode='HTML'),
+                    reply_markup=self._moderation_keyboard(post_id)
+                )
+                if message and getattr(message, 'photo', None):
+                    file_id = message.photo[-1].file_id
+
+            status = await self.storage.attach_image(post_id, payload.get('image_path'),
+                                                     payload.get('image_profile'), file_id)
+            self._update_pending_post(post_id, payload.get('image_path'), file_id)
+            logger.info(f"Изображение прикреплено к посту {post_id}")
+            await self._complete_with_channel_job(job, post_id, message_id, status)
+        except Exception as e:
+            await asyncio.to_thread(self.jobs.fail, job, str(e))
+
+    async def _complete_with_channel_job(self, job, post_id: str, message_id: Optional[int],
+                                         status: Optional[str]):
+        """Завершает задачу attach; одобренный пост в той же транзакции ставится на публикацию"""
+        if status == 'approved':
+            await asyncio.to_thread(self.jobs.complete, job, 'channel',
+                                    {'post_id': post_id, 'message_id': message_id}, post_id)
+            self.jobs_ready['publish'].set()
+        else:
+            await asyncio.to_thread(self.jobs.complete, job)
+
+    async def _channel_job(self, job):
+        """Роль publish: публикация в канал поста, одобренного до готовности изображения.
+
+        Ошибки повторяются очередью с паузой, после JOB_MAX_ATTEMPTS попыток
+        задача уходит в dead, а пост остается в approved.
+        """
+        try:
+            await self._publish_approved(job.payload['post_id'], job.payload.get('message_id'))
+            await asyncio.to_thread(self.jobs.complete, job)
+        except Exception as e:
+            await asyncio.to_thread(self.jobs.fail, job, str(e))
+
+    async def _expire_pending_images(self):
+        """Посты, не дождавшиеся изображения за IMAGE_ATTACH_DEADLINE, получают fallback.
+
+        Одобренные посты, которые дождались изображения, ставятся задачами
+        channel: и после дедлайна, и если задачу attach не удалось завершить.
+        Ключ задачи — id поста, поэтому пост с задачей в любом статусе (в том
+        числе dead) повторно не ставится.
+        """
+        if time.monotonic() < self.next_image_expiry:
+            return
+        self.next_image_expiry = time.monotonic() + IMAGE_EXPIRY_INTERVAL
+        created_before = datetime.fromtimestamp(time.time() - IMAGE_ATTACH_DEADLINE).isoformat()
+        image_path = None
+        if self.fallback_image:
+            image_path = await asyncio.to_thread(self.image_store.put, self.fallback_image)
+        expired = await self.storage.expire_pending_images(created_before, image_path)
+        for post_id, status, message_id in expired:
+            self._update_pending_post(post_id, image_path, None)
+            FALLBACKS.inc(kind='image_deadline')
+            logger.warning(f"Изображение для поста {post_id} не готово за {IMAGE_ATTACH_DEADLINE} сек, "
+                           f"используем fallback")
+
+        approved = await self.storage.approved_ready()
+        if approved:
+            queued = await asyncio.to_thread(self.jobs.enqueue_many, 'channel', [
+                (post_id, {'post_id': post_id, 'message_id': message_id}) for post_id, message_id in approved
+            ])
+            if queued:
+                logger.info(f"Одобренных постов поставлено на публикацию: {queued}")
+                self.jobs_ready['publish'].set()
+
+    def _update_pending_post(self, post_id: str, image_path: Optional[str], file_id: Optional[str]):
+        """Подставляет прикрепленное изображение в закэшированный пост"""
+        post = self.pending_posts.get(post_id)
+        if post:
+            text, _, source, url, _ = post
+            self.pending_posts.put(post_id, (text, image_path, source, url, file_id))
+
+    async def _publish_jobs(self, jobs: list):
+        await asyncio.gather(*(self._publish_job(job) for job in jobs))
+
+    async def process_jobs(self, kind: str) -> int:
+        """Арендует и обрабатывает одну пачку задач; возвращает их число"""
+        if kind == 'generate':
+            jobs = await asyncio.to_thread(self.jobs.lease, kind, self.worker_id,
+                                           LLM_BATCH_SIZE * PIPELINE_TEXT_WORKERS, GENERATE_LEASE_SECONDS)
+            if jobs:
+                await self._generate_jobs(jobs)
+        else:
+            jobs = await asyncio.to_thread(self.jobs.lease, kind, self.worker_id,
+                                           PIPELINE_SEND_WORKERS, PUBLISH_LEASE_SECONDS)
+            if jobs:
+                await self._publish_jobs(jobs)
+            # Изображения прикрепляются после отправки текстов, которых они ждут
+            attach_jobs = await asyncio.to_thread(self.jobs.lease, 'attach', self.worker_id,
+                                                  PIPELINE_SEND_WORKERS, PUBLISH_LEASE_SECONDS)
+            if attach_jobs:
+                await asyncio.gather(*(self._attach_job(job) for job in attach_jobs))
+            channel_jobs = await asyncio.to_thread(self.jobs.lease, 'channel', self.worker_id,
+                                                   PIPELINE_SEND_WORKERS, PUBLISH_LEASE_SECONDS)
+            if channel_jobs:
+                await asyncio.gather(*(self._channel_job(job) for job in channel_jobs))
+            await self._expire_pending_images()
+            jobs += attach_jobs + channel_jobs
+        return len(jobs)
+
+    async def drain_jobs(self):
+        """Обрабатывает задачи generate и publish, пока есть готовые"""
+        while await self.process_jobs('generate') + await self.process_jobs('publish'):
+            pass
+
+    async def _job_worker(self, kind: str):
+        """Воркер роли generate/publish: обрабатывает задачи, пока бот работает"""
+        ready = self.jobs_ready[kind]
+        while not self.shutdown_event.is_set():
+            try:
+                ready.clear()
+                processed = await self.process_jobs(kind)
+                if time.monotonic() - self.job_counts_at >= JOB_POLL_INTERVAL:
+                    await self._refresh_job_counts()
+                if not processed:
+                    try:
+                        await asyncio.wait_for(ready.wait(), JOB_POLL_INTERVAL)
+                    except asyncio.TimeoutError:
+                        pass
+            except Exception as e:
+                logger.error(f"Ошибка воркера {kind}: {str(e)}")
+                await asyncio.sleep(JOB_POLL_INTERVAL)
+        logger.info(f"Воркер {kind} остановлен")
+
+    async def _telegram_call(self, limit_chat_id, func, *args, **kwargs):
+        """Запрос к Telegram через общий лимитер (глобальный и по чату)"""
+        try:
+            with STAGE_SECONDS.time(stage='telegram'):
+                return await self.limiter.call(['telegram', f"telegram:{limit_chat_id}"], func, *args, **kwargs)
+        except Exception:
+            API_ERRORS.inc(api='telegram')
+            raise
+
+    def _moderation_keyboard(self, post_id: str) -> InlineKeyboardMarkup:
+        return InlineKeyboardMarkup([[
             InlineKeyboardButton("✅ Опубликовать", callback_data=f"approve:{post_id}"),
             InlineKeyboardButton("❌ Отклонить", callback_data=f"reject:{post_id}")
         ]])
+
+    async def _send_for_moderation(self, text: str, image_bytes: bytes = None,
+                                   image_pending: bool = False) -> tuple:
+        """Отправка поста на модерацию; возвращает (post_id, message_id, file_id).
+
+        С image_pending пост уходит с заглушкой, а изображение позже
+        подставляет задача attach (edit_message_media). Пост сохраняет
+        вызывающий код, ошибки отправки передаются ему же.
+        """
+        post_id = f"post-{int(time.time())}-{hash(text) % 10000}"
+        
+        keyboard = self._moderation_keyboard(post_id)
         
         caption = f"{text}"
         
+        admin_chat_id = os.getenv("TELEGRAM_ADMIN_CHAT_ID")
+        file_id = None
         try:
-            if image_bytes:
-                await self.bot.send_photo(
-                    chat_id=os.getenv("TELEGRAM_ADMIN_CHAT_ID"),
+            if image_pending:
+                message = await self._telegram_call(
+                    admin_chat_id,
+                    self.bot.send_photo,
+                    chat_id=admin_chat_id,
+                    photo=self.placeholder_file_id or self.placeholder_image,
+                    caption=caption[:1024],
+                    reply_markup=keyboard,
+                    parse_mode='HTML'
+                )
+                if message and message.photo:
+                    self.placeholder_file_id = message.photo[-1].file_id
+            elif image_bytes:
+                message = await self._telegram_call(
+                    admin_chat_id,
+                    self.bot.send_photo,
+                    chat_id=admin_chat_id,
                     photo=image_bytes,
                     caption=caption[:1024],
                     reply_markup=keyboard,
                     parse_mode='HTML'
                 )
+                # Telegram уже хранит фото: при публикации достаточно file_id
+                if message and message.photo:
+                    file_id = message.photo[-1].file_id
             else:
-                await self.bot.send_message(
-                    chat_id=os.getenv("TELEGRAM_ADMIN_CHAT_ID"),
+                message = await self._telegram_call(
+                    admin_chat_id,
+                    self.bot.send_message,
+                    chat_id=admin_chat_id,
                     text=caption,
                     reply_markup=keyboard,
                     parse_mode='HTML',
                     disable_web_page_preview=True
                 )
-            
-            self.db_queue.put(('save_post', post_id, text, image_bytes, source, url))
-            logger.info(f"Пост {post_id} отправлен на модерацию")
         except Exception as e:
             logger.error(f"Ошибка отправки на модерацию: {str(e)}")
+            raise
+        
+        logger.info(f"Пост {post_id} отправлен на модерацию")
+        return post_id, message.message_id if message else None, file_id
+
+    async def _publish_to_channel(self, post: tuple):
+        """Публикует пост (text, image_path, source, url, file_id) в канал"""
+        text, image_path, source, url, file_id = post
+        caption = f"{source}\n\n{text}\n\n{url}" if url else f"{source}\n\n{text}"
+        
+        channel_id = os.getenv("TELEGRAM_CHANNEL_ID")
+        if file_id:
+            photo = file_id
+        else:
+            # Байты, а не файл: при повторе после RetryAfter файл был бы прочитан
+            photo = await asyncio.to_thread(self.image_store.read, image_path)
+        if photo:
+            await self._telegram_call(
+                channel_id,
+                self.bot.send_photo,
+                chat_id=channel_id,
+                photo=photo,
+                caption=caption[:1000],
+                parse_mode='HTML'
+            )
+        else:
+            await self._telegram_call(
+                channel_id,
+                self.bot.send_message,
+                chat_id=channel_id,
+                text=caption,
+                parse_mode='HTML',
+                disable_web_page_preview=True
+            )
+
+    async def _publish_approved(self, post_id: str, message_id: Optional[int]):
+        """Публикует пост, одобренный до готовности изображения.
+
+        Пост сначала переводится в published, чтобы его не опубликовали дважды;
+        если отправка в канал не удалась, он возвращается в approved, а
+        исключение передается задаче channel для повтора.
+        """
+        if not await self.storage.claim_approved(post_id):
+            return
+        try:
+            post = await self.storage.get_post(post_id)
+            await self._publish_to_channel(post)
+        except Exception as e:
+            logger.error(f"Ошибка публикации в канал: {str(e)}")
+            await self.storage.update_status(post_id, 'approved')
+            raise
+        POSTS.inc(status='published')
+        logger.info(f"Пост {post_id} опубликован после готовности изображения")
+        if message_id:
+            admin_chat_id = os.getenv("TELEGRAM_ADMIN_CHAT_ID")
+            try:
+                await self._telegram_call(
+                    admin_chat_id,
+                    self.bot.edit_message_caption,
+                    chat_id=admin_chat_id,
+                    message_id=message_id,
+                    caption=f"✅ Опубликовано\n\n{post[0]}"[:1024],
+                    parse_mode='HTML',
+                    reply_markup=None
+                )
+            except Exception as e:
+                logger.error(f"Ошибка редактирования сообщения: {str(e)}")
 
     async def handle_button(self, update, context):
         query = update.callback_query
-        await query.answer()
         
         try:
             action, post_id = query.data.split(':', 1)
             logger.info(f"Обработка: {action} для поста {post_id}")
             
             if action == 'approve':
-                # Обновляем статус в БД
-                self.db_queue.put(('update_status', post_id, 'published'))
-                
-                # Получаем данные поста из БД
-                conn = sqlite3.connect('posts.db')
-                cursor = conn.cursor()
-                cursor.execute(
-                    "SELECT text, image_path, source, url FROM posts WHERE id=?",
-                    (post_id,)
-                )
-                post = cursor.fetchone()
-                conn.close()
+                # Обновляем статус в БД; чтение идет после коммита обновления.
+                # Одобрение и прикрепление изображения выполняет один пишущий поток,
+                # поэтому пост публикует ровно один из них
+                status = await self.storage.approve(post_id)
+                if status is None:
+                    # Повторное нажатие, другой модератор или пост еще не сохранен
+                    logger.warning(f"Пост {post_id} уже обработан или не найден, одобрение пропущено")
+                    await query.answer("⚠️ Пост уже обработан или не найден", show_alert=True)
+                    return
+                post = None
+                if status == 'approved':
+                    # Изображение еще генерируется: пост опубликует задача attach
+                    await query.answer()
+                    self.pending_posts.pop(post_id)
+                    try:
+                        new_text = f"⏳ Одобрено, будет опубликовано с изображением\n\n{query.message.caption}"
+                        await self._telegram_call(
+                            query.message.chat_id,
+                            query.edit_message_caption,
+                            caption=new_text[:1024],
+                            reply_markup=None
+                        )
+                    except Exception as e:
+                        logger.error(f"Ошибка редактирования сообщения: {str(e)}")
+                else:
+                    # Данные поста берем из памяти, а после перезапуска — из БД.
+                    # Кэш без изображения мог устареть, если его прикрепил другой процесс
+                    post = self.pending_posts.pop(post_id)
+                    if not post or not (post[1] or post[4]):
+                        post = await self.storage.get_post(post_id)
                 
                 if post:
-                    text, image_path, source, url = post
-                    caption = f"{source}\n\n{text}\n\n{url}" if url else f"{source}\n\n{text}"
-                    
                     try:
-                        if image_path and os.path.exists(image_path):
-                            with open(image_path, 'rb') as f:
-                                await self.bot.send_photo(
-                                    chat_id=os.getenv("TELEGRAM_CHANNEL_ID"),
-                                    photo=f,
-                                    caption=caption[:1000],
-                                    parse_mode='HTML'
-                                )
-                        else:
-                            await self.bot.send_message(
-                                chat_id=os.getenv("TELEGRAM_CHANNEL_ID"),
-                                text=caption,
-                                parse_mode='HTML',
-                                disable_web_page_preview=True
-                            )
+                        await self._publish_to_channel(post)
+                        POSTS.inc(status='published')
+                        await query.answer()
                         
                         # Редактируем сообщение с кнопками
                         try:
                             if hasattr(query.message, 'caption'):
                                 new_text = f"✅ Опубликовано\n\n{query.message.caption}"
-                                await query.edit_message_caption(
+                                await self._telegram_call(
+                                    query.message.chat_id,
+                                    query.edit_message_caption,
                                     caption=new_text[:1024],
                                     reply_markup=None
                                 )
                             else:
                                 new_text = f"✅ Опубликовано\n\n{query.message.text}"
-                                await query.edit_message_text(
+                                await self._telegram_call(
+                                    query.message.chat_id,
+                                    query.edit_message_text,
                                     text=new_text,
                                     reply_markup=None,
                                     parse_mode='HTML',
@@ -444,21 +1108,33 @@ class NewsBot:
                             
                     except Exception as e:
                         logger.error(f"Ошибка публикации в канал: {str(e)}")
+                        # Возвращаем пост на модерацию, чтобы его можно было одобрить повторно
+                        self.pending_posts.put(post_id, post)
+                        await self.storage.update_status(post_id, 'pending')
                         await query.answer("⚠️ Ошибка публикации", show_alert=True)
-                else:
-                    await query.answer("⚠️ Пост не найден", show_alert=True)
             
             elif action == 'reject':
+                if not await self.storage.reject(post_id):
+                    logger.warning(f"Пост {post_id} уже обработан или не найден, отклонение пропущено")
+                    await query.answer("⚠️ Пост уже обработан или не найден", show_alert=True)
+                    return
+                await query.answer()
+                self.pending_posts.pop(post_id)
+                POSTS.inc(status='rejected')
                 try:
                     if hasattr(query.message, 'caption'):
                         new_text = f"❌ Отклонено\n\n{query.message.caption}"
-                        await query.edit_message_caption(
+                        await self._telegram_call(
+                            query.message.chat_id,
+                            query.edit_message_caption,
                             caption=new_text[:1024],
                             reply_markup=None
                         )
                     else:
                         new_text = f"❌ Отклонено\n\n{query.message.text}"
-                        await query.edit_message_text(
+                        await self._telegram_call(
+                            query.message.chat_id,
+                            query.edit_message_text,
                             text=new_text,
                             reply_markup=None,
                             parse_mode='HTML',
@@ -471,21 +1147,67 @@ class NewsBot:
             logger.error(f"Ошибка обработки кнопки: {str(e)}")
             await query.answer("⚠️ Произошла ошибка", show_alert=True)
 
-    def run(self):
-        """Запуск бота с проверкой новостей каждые 2 часа"""
+    async def _handle_webhook(self, request: Request, application) -> Response:
+        """Прием обновления от Telegram с проверкой секретного токена"""
+        # Заголовки декодированы как latin-1: сравниваем байты, иначе не-ASCII ломает compare_digest
+        token = request.headers.get('x-telegram-bot-api-secret-token', '').encode('latin-1')
+        if not hmac.compare_digest(token, os.getenv("WEBHOOK_SECRET", "").encode('utf-8')):
+            logger.warning("Вебхук: неверный секретный токен")
+            return Response(403, 'Forbidden')
+        try:
+            data = json.loads(request.body)
+        except ValueError:
+            return Response(400, 'Bad Request')
+        # Update.de_json ожидает объект; массив или число — ошибка клиента, а не сервера
+        if not isinstance(data, dict):
+            return Response(400, 'Bad Request')
+        await application.update_queue.put(Update.de_json(data, application.bot))
+        return Response(200, 'OK')
+
+    def _build_application(self) -> Application:
+        """Application для приема нажатий кнопок модерации"""
+        application = Application.builder() \
+            .token(os.getenv("TELEGRAM_BOT_TOKEN")) \
+            .base_url(TELEGRAM_API_URL) \
+            .build()
+        application.add_handler(CallbackQueryHandler(self.handle_button))
+        return application
+
+    async def _start_webhook(self, application):
+        async def handler(request):
+            return await self._handle_webhook(request, application)
+
+        self._http_server_for(WEBHOOK_LISTEN, WEBHOOK_PORT).route('POST', WEBHOOK_PATH, handler)
+        webhook_url = os.getenv("WEBHOOK_URL")
+        if webhook_url:
+            await application.bot.set_webhook(
+                url=webhook_url.rstrip('/') + WEBHOOK_PATH,
+                secret_token=os.getenv("WEBHOOK_SECRET"),
+                allowed_updates=['callback_query']
+            )
+            logger.info(f"Вебхук зарегистрирован: {webhook_url.rstrip('/')}{WEBHOOK_PATH}")
+        else:
+            logger.info("WEBHOOK_URL не задан: вебхук не регистрируется, сервер принимает обновления локально")
+
+    def run(self, roles=None):
+        """Запуск ролей бота; fetch опрашивает каждую ленту по ее расписанию"""
+        roles = set(roles or ALL_ROLES)
         try:
-            CHECK_INTERVAL = 60 * 60 * 2  # 2 часа
-            
             async def news_loop():
                 while not self.shutdown_event.is_set():
                     try:
-                        start_time = time.time()
-                        logger.info("=== ЗАПУСК ПРОВЕРКИ НОВОСТЕЙ ===")
-                        
-                        await self.process_news()
-                        
-                        elapsed = time.time() - start_time
-                        sleep_time = max(CHECK_INTERVAL - elapsed, 0)
+                        # В обработку попадают только ленты, время опроса которых наступило
+                        due_urls = self.feed_scheduler.due()
+                        if due_urls:
+                            start_time = time.time()
+                            logger.info(f"=== ЗАПУСК ПРОВЕРКИ НОВОСТЕЙ "
+                                        f"({len(due_urls)}/{len(RSS_URLS)} лент) ===")
+                            
+                            await self.process_news(due_urls)
+                            
+                            elapsed = time.time() - start_time
+                            CYCLE_SECONDS.observe(elapsed)
+                        sleep_time = self.feed_scheduler.seconds_until_next()
                         logger.info(f"Следующая проверка через {sleep_time/60:.1f} минут")
                         
                         await asyncio.sleep(sleep_time)
@@ -499,30 +1221,61 @@ class NewsBot:
             loop = asyncio.new_event_loop()
             asyncio.set_event_loop(loop)
             
-            application = Application.builder() \
-                .token(os.getenv("TELEGRAM_BOT_TOKEN")) \
-                .build()
-            
-            application.add_handler(CallbackQueryHandler(self.handle_button))
+            # Кнопки модерации обрабатывает тот же процесс, что отправляет посты
+            application = self._build_application() if 'publish' in roles else None
             
             async def main():
-                news_task = asyncio.create_task(news_loop())
-                await application.initialize()
-                await application.start()
-                await application.updater.start_polling()
+                self.loop = asyncio.get_running_loop()
+                self.stop_event = asyncio.Event()
+                if self.shutdown_event.is_set():
+                    self.stop_event.set()
+
+                # background — проверки идут параллельно с работой бота, skip — не выполняются
+                if HEALTH_CHECKS == 'background':
+                    asyncio.create_task(self._run_health_checks())
+                logger.info(f"Роли процесса {self.worker_id}: {', '.join(sorted(roles))}")
+                tasks = []
+                if 'fetch' in roles:
+                    tasks.append(asyncio.create_task(news_loop()))
+                    tasks.append(asyncio.create_task(self._maintenance_loop()))
+                for kind in ('generate', 'publish'):
+                    if kind in roles:
+                        tasks.append(asyncio.create_task(self._job_worker(kind)))
+                if application is not None:
+                    await application.initialize()
+                    await application.start()
+                    if BOT_MODE == 'webhook':
+                        await self._start_webhook(application)
+                    else:
+                        await application.updater.start_polling()
+                if METRICS_PORT:
+                    self._http_server_for(WEBHOOK_LISTEN, METRICS_PORT).route('GET', '/metrics', self._handle_metrics)
+                for server in self.http_servers.values():
+                    await server.start()
+                metrics_task = asyncio.create_task(self._log_metrics_summary())
                 
-                while not self.shutdown_event.is_set():
-                    await asyncio.sleep(1)
+                await self.stop_event.wait()
                 
-                await application.stop()
-                await application.shutdown()
-                news_task.cancel()
+                metrics_task.cancel()
+                for server in self.http_servers.values():
+                    await server.stop()
+                if application is not None:
+                    if application.updater and application.updater.running:
+                        await application.updater.stop()
+                    await application.stop()
+                    await application.shutdown()
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                await close_http_client()
             
             try:
                 loop.run_until_complete(main())
             except (asyncio.CancelledError, KeyboardInterrupt):
                 pass
             finally:
+                self.watermarker.shutdown()
+                self.storage.close()
                 loop.close()
             
             logger.info("Бот успешно остановлен")
@@ -530,5 +1283,18 @@ class NewsBot:
             logger.critical(f"Фатальная ошибка при запуске: {str(e)}")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Бот AI-новостей")
+    parser.add_argument('--roles', default=BOT_ROLES,
+                        help="роли процесса через запятую: fetch, generate, publish")
+    parser.add_argument('--vacuum', action='store_true',
+                        help="перевести posts.db на инкрементальный VACUUM и выйти (бот должен быть остановлен)")
+    args = parser.parse_args()
+    if args.vacuum:
+        enable_incremental_vacuum('posts.db')
+        raise SystemExit(0)
+    roles = [role.strip() for role in args.roles.split(',') if role.strip()]
+    unknown = set(roles) - set(ALL_ROLES)
+    if unknown:
+        parser.error(f"Неизвестные роли: {', '.join(sorted(unknown))}")
     bot = NewsBot()
-    bot.run()
\ No newline at end of file
+    bot.run(roles)
\ No newline at end of file
@@ -1,48 +1,283 @@
+import asyncio
+import queue
 import sqlite3
-import os
 import logging
 from datetime import datetime
+from typing import Callable, Optional
+from utils.db_worker import DBWorker
 
 logger = logging.getLogger(__name__)
 
-class Database:
-    def __init__(self):
-        self.conn = sqlite3.connect('posts.db')
-        self.create_tables()
-        
-    def create_tables(self):
-        """Создание таблиц с логированием"""
-        try:
-            cursor = self.conn.cursor()
-            cursor.execute('''CREATE TABLE IF NOT EXISTS posts
-                           (id TEXT PRIMARY KEY,
-                            text TEXT,
-                            image_path TEXT,
-                            status TEXT,
-                            created_at TIMESTAMP)''')
-            self.conn.commit()
-            logger.info("Таблицы БД инициализированы")
-        except Exception as e:
-            logger.error(f"Ошибка БД: {str(e)}")
-            raise
-
-    def save_post(self, post_id, text, image_bytes=None):
-        """Сохранение поста с логированием"""
+DEFAULT_POOL_SIZE = 4
+
+# Запросы к posts; sqlite3 кэширует скомпилированные выражения по тексту
+SQL_INSERT_POST = ("INSERT OR IGNORE INTO posts "
+                   "(id, text, image_path, status, source, url, created_at, file_id, title, image_profile, "
+                   "message_id, image_pending) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)")
+SQL_UPDATE_STATUS = "UPDATE posts SET status=? WHERE id=?"
+SQL_GET_POST = "SELECT text, image_path, source, url, file_id FROM posts WHERE id=?"
+# Изображения постов на модерации и задач attach, которые их еще не прикрепили
+SQL_PENDING_IMAGES = ("SELECT image_path FROM posts WHERE status IN ('pending', 'approved') "
+                      "AND image_path IS NOT NULL "
+                      "UNION SELECT json_extract(payload, '$.image_path') FROM jobs "
+                      "WHERE kind='attach' AND status IN ('queued', 'leased') "
+                      "AND json_extract(payload, '$.image_path') IS NOT NULL")
+SQL_GET_POST_BY_URL = "SELECT id, status, text, message_id, image_pending FROM posts WHERE url=?"
+# Пост, изображение которого еще генерируется, при одобрении ждет его в статусе approved.
+# Решение принимается один раз: уже обработанный пост повторное нажатие не меняет
+SQL_APPROVE = ("UPDATE posts SET status=CASE WHEN image_pending=1 THEN 'approved' ELSE 'published' END "
+               "WHERE id=? AND status='pending' RETURNING status")
+SQL_REJECT = "UPDATE posts SET status='rejected' WHERE id=? AND status='pending' RETURNING id"
+SQL_ATTACH_IMAGE = ("UPDATE posts SET image_path=?, image_profile=?, file_id=?, image_pending=0 "
+                    "WHERE id=? AND image_pending=1 RETURNING status")
+SQL_EXPIRE_IMAGES = ("UPDATE posts SET image_path=?, image_pending=0 WHERE image_pending=1 AND created_at<? "
+                     "RETURNING id, status, message_id")
+# Одобренный пост с готовым изображением публикует тот, кто первым переведет его в published
+SQL_CLAIM_APPROVED = ("UPDATE posts SET status='published' WHERE id=? AND status='approved' AND image_pending=0 "
+                      "RETURNING id")
+SQL_APPROVED_READY = "SELECT id, message_id FROM posts WHERE status='approved' AND image_pending=0"
+
+def _migration_base_schema(conn):
+    """Все таблицы бота в одной схеме"""
+    conn.execute('''CREATE TABLE IF NOT EXISTS posts
+                 (id TEXT PRIMARY KEY,
+                  text TEXT,
+                  image_path TEXT,
+                  status TEXT,
+                  source TEXT,
+                  url TEXT UNIQUE,
+                  created_at TEXT)''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS processed_urls
+                 (url TEXT PRIMARY KEY,
+                  processed_at TEXT)''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS feed_cache
+                 (url TEXT PRIMARY KEY,
+                  etag TEXT,
+                  last_modified TEXT,
+                  body_hash TEXT,
+                  entry_ids TEXT,
+                  checked_at TEXT)''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS llm_cache
+                 (key TEXT PRIMARY KEY,
+                  model TEXT,
+                  completion TEXT,
+                  size INTEGER,
+                  created_at REAL,
+                  used_at REAL)''')
+    # signature — подписи заголовка, текста и названий из utils.similarity.story_signature
+    conn.execute('''CREATE TABLE IF NOT EXISTS story_signatures
+                 (url TEXT PRIMARY KEY,
+                  signature BLOB,
+                  created_at TEXT)''')
+    conn.execute('''CREATE TABLE IF NOT EXISTS story_bands
+                 (band INTEGER,
+                  hash INTEGER,
+                  url TEXT)''')
+
+def _migration_posts_columns_and_indexes(conn):
+    """Приводит старую 5-колоночную таблицу posts к общей схеме и добавляет индексы"""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(posts)")}
+    if 'source' not in columns:
+        conn.execute("ALTER TABLE posts ADD COLUMN source TEXT")
+    if 'url' not in columns:
+        conn.execute("ALTER TABLE posts ADD COLUMN url TEXT")
+        conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_posts_url ON posts(url)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_posts_status ON posts(status)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_posts_created_at ON posts(created_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_posts_source ON posts(source)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_processed_urls_processed_at ON processed_urls(processed_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_used_at ON llm_cache(used_at)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_story_bands ON story_bands(band, hash)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_story_bands_url ON story_bands(url)")
+
+def _migration_posts_file_id(conn):
+    """file_id фото в Telegram для публикации без повторной загрузки"""
+    conn.execute("ALTER TABLE posts ADD COLUMN file_id TEXT")
+
+def _migration_feed_schedule(conn):
+    """Расписание опроса лент по частоте публикаций"""
+    conn.execute('''CREATE TABLE IF NOT EXISTS feed_schedule
+                 (url TEXT PRIMARY KEY,
+                  rate REAL,
+                  interval REAL,
+                  last_poll_at REAL,
+                  next_poll_at REAL)''')
+
+def _migration_posts_title(conn):
+    """Исходный заголовок новости для профиля ранжирования"""
+    conn.execute("ALTER TABLE posts ADD COLUMN title TEXT")
+
+def _migration_jobs(conn):
+    """Очередь задач с арендой для воркеров fetch/generate/publish"""
+    conn.execute('''CREATE TABLE IF NOT EXISTS jobs
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  kind TEXT NOT NULL,
+                  key TEXT,
+                  payload TEXT,
+                  status TEXT,
+                  attempts INTEGER DEFAULT 0,
+                  available_at REAL,
+                  owner TEXT,
+                  lease_expires REAL,
+                  last_error TEXT,
+                  created_at REAL,
+                  updated_at REAL,
+                  UNIQUE (kind, key))''')
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_ready ON jobs(kind, status, available_at)")
+
+def _migration_posts_image_profile(conn):
+    """Профиль качества, с которым сгенерировано изображение поста"""
+    conn.execute("ALTER TABLE posts ADD COLUMN image_profile TEXT")
+
+def _migration_posts_deferred_image(conn):
+    """Сообщение модерации и признак изображения, которое еще генерируется"""
+    conn.execute("ALTER TABLE posts ADD COLUMN message_id INTEGER")
+    conn.execute("ALTER TABLE posts ADD COLUMN image_pending INTEGER NOT NULL DEFAULT 0")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_posts_image_pending ON posts(image_pending) WHERE image_pending=1")
+
+def _migration_candidates(conn):
+    """Новости, ожидающие бюджета API до следующих циклов отбора"""
+    conn.execute('''CREATE TABLE IF NOT EXISTS candidates
+                 (url TEXT PRIMARY KEY,
+                  payload TEXT,
+                  created_at REAL)''')
+
+# Миграции применяются по порядку; номер последней хранится в PRAGMA user_version
+MIGRATIONS = [
+    _migration_base_schema,
+    _migration_posts_columns_and_indexes,
+    _migration_posts_file_id,
+    _migration_feed_schedule,
+    _migration_posts_title,
+    _migration_jobs,
+    _migration_posts_image_profile,
+    _migration_posts_deferred_image,
+    _migration_candidates,
+]
+
+def migrate(conn):
+    """Применяет недостающие миграции схемы"""
+    # Воркеры в других процессах могут стартовать одновременно: версию читаем под блокировкой записи
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for number, migration in enumerate(MIGRATIONS[version:], version + 1):
+            migration(conn)
+            conn.execute(f"PRAGMA user_version={number}")
+            logger.info(f"Применена миграция БД {number}: {migration.__doc__}")
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+class Storage:
+    """Единый слой доступа к posts.db.
+
+    Запись идет через один поток с групповым коммитом (DBWorker), чтение —
+    через небольшой пул соединений. Асинхронные методы не блокируют event
+    loop; *_sync-варианты предназначены для кода, уже работающего в потоках.
+    """
+
+    def __init__(self, db_path: str = 'posts.db', pool_size: int = DEFAULT_POOL_SIZE):
+        self.db_path = db_path
+        self.pool_size = pool_size
+        self.writer = DBWorker(db_path, init=migrate)
+        self.readers = queue.Queue()
+
+    def open(self):
+        self.writer.start()
+        for _ in range(self.pool_size):
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, cached_statements=256)
+            conn.execute("PRAGMA query_only=1")
+            self.readers.put(conn)
+        logger.info("Таблицы БД инициализированы")
+
+    def close(self):
+        self.writer.stop()
+        while not self.readers.empty():
+            self.readers.get_nowait().close()
+
+    def read_sync(self, fn: Callable, *args):
+        """Выполняет fn(conn, *args) на соединении из пула чтения"""
+        conn = self.readers.get()
         try:
-            image_path = None
-            if image_bytes:
-                os.makedirs("images", exist_ok=True)
-                image_path = f"images/{post_id}.png"
-                with open(image_path, 'wb') as f:
-                    f.write(image_bytes)
-            
-            cursor = self.conn.cursor()
-            cursor.execute(
-                "INSERT INTO posts VALUES (?, ?, ?, ?, ?)",
-                (post_id, text, image_path, 'pending', datetime.now())
-            )
-            self.conn.commit()
-            logger.info(f"Сохранен пост {post_id}")
-        except Exception as e:
-            logger.error(f"Ошибка сохранения: {str(e)}")
-            raise
\ No newline at end of file
+            return fn(conn, *args)
+        finally:
+            self.readers.put(conn)
+
+    def write_sync(self, fn: Callable, *args):
+        """Выполняет fn(conn, *args) в пишущем потоке и ждет коммита"""
+        return self.writer.submit(fn, *args).result()
+
+    def write_nowait(self, fn: Callable, *args):
+        """Ставит запись в очередь, не дожидаясь коммита"""
+        return self.writer.submit(fn, *args)
+
+    async def read(self, fn: Callable, *args):
+        return await asyncio.to_thread(self.read_sync, fn, *args)
+
+    async def write(self, fn: Callable, *args):
+        return await self.writer.run(fn, *args)
+
+    def queue_size(self) -> int:
+        return self.writer.queue_size()
+
+    async def save_post(self, post_id: str, text: str, image_path: Optional[str],
+                        source: str, url: str, file_id: Optional[str] = None, title: Optional[str] = None,
+                        image_profile: Optional[str] = None, message_id: Optional[int] = None,
+                        image_pending: bool = False):
+        def save(conn):
+            conn.execute(SQL_INSERT_POST, (post_id, text, image_path, 'pending', source, url,
+                                           datetime.now().isoformat(), file_id, title, image_profile,
+                                           message_id, int(image_pending)))
+        await self.write(save)
+        logger.info(f"Сохранен пост {post_id}")
+
+    async def update_status(self, post_id: str, status: str):
+        await self.write(lambda conn: conn.execute(SQL_UPDATE_STATUS, (status, post_id)))
+
+    async def get_post(self, post_id: str) -> Optional[tuple]:
+        return await self.read(lambda conn: conn.execute(SQL_GET_POST, (post_id,)).fetchone())
+
+    async def get_post_by_url(self, url: str) -> Optional[tuple]:
+        """(id, status, text, message_id, image_pending) поста по ссылке на новость"""
+        return await self.read(lambda conn: conn.execute(SQL_GET_POST_BY_URL, (url,)).fetchone())
+
+    async def approve(self, post_id: str) -> Optional[str]:
+        """Одобряет пост: published или approved, если изображение еще не готово.
+
+        None, если поста нет или он уже не на модерации.
+        """
+        row = await self.write(lambda conn: conn.execute(SQL_APPROVE, (post_id,)).fetchone())
+        return row[0] if row else None
+
+    async def reject(self, post_id: str) -> bool:
+        """Отклоняет пост на модерации; False, если поста нет или он уже обработан"""
+        row = await self.write(lambda conn: conn.execute(SQL_REJECT, (post_id,)).fetchone())
+        return row is not None
+
+    async def attach_image(self, post_id: str, image_path: Optional[str], image_profile: Optional[str],
+                           file_id: Optional[str]) -> Optional[str]:
+        """Прикрепляет готовое изображение; None, если пост его уже не ждет"""
+        row = await self.write(lambda conn: conn.execute(
+            SQL_ATTACH_IMAGE, (image_path, image_profile, file_id, post_id)
+        ).fetchone())
+        return row[0] if row else None
+
+    async def expire_pending_images(self, created_before: str, image_path: Optional[str]) -> list:
+        """Посты, не дождавшиеся изображения: им назначается image_path (fallback)"""
+        return await self.write(lambda conn: conn.execute(
+            SQL_EXPIRE_IMAGES, (image_path, created_before)
+        ).fetchall())
+
+    async def claim_approved(self, post_id: str) -> bool:
+        """Переводит одобренный пост с готовым изображением в published; False, если его уже забрали"""
+        row = await self.write(lambda conn: conn.execute(SQL_CLAIM_APPROVED, (post_id,)).fetchone())
+        return row is not None
+
+    async def approved_ready(self) -> list:
+        """(id, message_id) одобренных постов, которые дождались изображения, но не опубликованы"""
+        return await self.read(lambda conn: conn.execute(SQL_APPROVED_READY).fetchall())
+
+    async def pending_image_paths(self) -> set:
+        return await self.read(lambda conn: {row[0] for row in conn.execute(SQL_PENDING_IMAGES)})
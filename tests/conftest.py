@@ -0,0 +1,9 @@
+import pytest
+from storage import Storage
+
+@pytest.fixture
+def storage(tmp_path):
+    storage = Storage(str(tmp_path / 'posts.db'), pool_size=2)
+    storage.open()
+    yield storage
+    storage.close()
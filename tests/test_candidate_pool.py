@@ -0,0 +1,31 @@
+import time
+from utils.candidate_pool import CandidatePool
+
+def entry(n):
+    return {'title': f"Story {n}", 'url': f"https://example.com/{n}", 'source': 'example.com'}
+
+def test_replace_keeps_first_seen_time(storage):
+    pool = CandidatePool(storage)
+    pool.replace([entry(1)])
+    first_seen = storage.read_sync(lambda conn: conn.execute("SELECT created_at FROM candidates").fetchone()[0])
+    time.sleep(0.01)
+    pool.replace([entry(1), entry(2)])
+    rows = dict(storage.read_sync(lambda conn: conn.execute("SELECT url, created_at FROM candidates").fetchall()))
+    assert rows[entry(1)['url']] == first_seen
+    assert rows[entry(2)['url']] > first_seen
+
+def test_replace_drops_selected_entries(storage):
+    pool = CandidatePool(storage)
+    pool.replace([entry(1), entry(2)])
+    pool.replace([entry(2)])
+    assert pool.load() == [entry(2)]
+
+def test_load_skips_expired_and_limits_count(storage):
+    pool = CandidatePool(storage, max_age=60, max_count=2)
+    pool.replace([entry(n) for n in range(4)])
+    storage.write_sync(lambda conn: conn.execute(
+        "UPDATE candidates SET created_at=created_at-120 WHERE url=?", (entry(0)['url'],)
+    ))
+    loaded = pool.load()
+    assert len(loaded) == 2
+    assert entry(0) not in loaded
@@ -0,0 +1,128 @@
+import asyncio
+import hashlib
+from xml.etree.ElementTree import ParseError
+import pytest
+from utils.feed_stream import StreamParser, parse_stream
+
+RSS = b"""<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0" xmlns:content="http://purl.org/rss/1.0/modules/content/" xmlns:dc="http://purl.org/dc/elements/1.1/">
+<channel>
+  <title>MIT Technology Review</title>
+  <link>https://www.technologyreview.com/</link>
+  <item>
+    <title>The AI lab waging a guerrilla war over exploitative AI</title>
+    <link>https://www.technologyreview.com/2024/11/13/ai-lab/</link>
+    <guid isPermaLink="false">https://www.technologyreview.com/?p=1106729</guid>
+    <pubDate>Wed, 13 Nov 2024 10:00:00 +0000</pubDate>
+    <description><![CDATA[<p>Researchers built tools to <b>protect</b> artists.</p>]]></description>
+    <content:encoded><![CDATA[<p>Full article text</p>]]></content:encoded>
+  </item>
+  <item>
+    <title>Item without a link</title>
+    <description>Skipped</description>
+  </item>
+  <item>
+    <title>Google DeepMind has a new way to look inside an AI's mind</title>
+    <link>https://www.technologyreview.com/2024/11/14/deepmind/</link>
+    <pubDate>Thu, 14 Nov 2024 09:00:00 +0000</pubDate>
+    <content:encoded>Only full text</content:encoded>
+  </item>
+</channel>
+</rss>"""
+
+ATOM = b"""<?xml version="1.0" encoding="utf-8"?>
+<feed xmlns="http://www.w3.org/2005/Atom">
+  <title>The Verge - AI</title>
+  <link rel="self" href="https://www.theverge.com/rss/ai/index.xml"/>
+  <entry>
+    <id>https://www.theverge.com/2024/11/14/1</id>
+    <title type="html">OpenAI launches ChatGPT search</title>
+    <link rel="replies" href="https://www.theverge.com/2024/11/14/1#comments"/>
+    <link rel="alternate" type="text/html" href="https://www.theverge.com/2024/11/14/openai-search"/>
+    <updated>2024-11-14T12:00:00-05:00</updated>
+    <summary type="html">Search is now built into ChatGPT.</summary>
+  </entry>
+  <entry>
+    <id>https://www.theverge.com/2024/11/14/2</id>
+    <title>Anthropic adds computer use</title>
+    <link href="https://www.theverge.com/2024/11/14/anthropic"/>
+    <published>2024-11-14T08:00:00Z</published>
+    <updated>2024-11-14T09:00:00Z</updated>
+    <content type="html">Claude can now use a computer.</content>
+  </entry>
+</feed>"""
+
+RDF = b"""<?xml version="1.0" encoding="UTF-8"?>
+<rdf:RDF xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#" xmlns="http://purl.org/rss/1.0/"
+         xmlns:dc="http://purl.org/dc/elements/1.1/">
+  <channel rdf:about="http://arxiv.org/">
+    <title>cs.AI updates on arXiv.org</title>
+    <link>http://arxiv.org/</link>
+  </channel>
+  <item rdf:about="http://arxiv.org/abs/2411.01234">
+    <title>Scaling Laws for Agents</title>
+    <link>http://arxiv.org/abs/2411.01234</link>
+    <description>We study scaling of agentic systems.</description>
+    <dc:date>2024-11-14T00:00:00-05:00</dc:date>
+  </item>
+</rdf:RDF>"""
+
+def _parse(data: bytes, max_items: int = 10, exclude_link=None, chunk_size: int = 64):
+    async def chunks():
+        for i in range(0, len(data), chunk_size):
+            yield data[i:i + chunk_size]
+    return asyncio.run(parse_stream(chunks(), max_items, exclude_link))
+
+def test_rss_items():
+    entries, body_hash = _parse(RSS)
+    assert body_hash == hashlib.sha256(RSS).hexdigest()
+    assert entries == [{
+        'title': 'The AI lab waging a guerrilla war over exploitative AI',
+        'link': 'https://www.technologyreview.com/2024/11/13/ai-lab/',
+        'id': 'https://www.technologyreview.com/?p=1106729',
+        'published': 'Wed, 13 Nov 2024 10:00:00 +0000',
+        'summary': '<p>Researchers built tools to <b>protect</b> artists.</p>',
+    }, {
+        'title': "Google DeepMind has a new way to look inside an AI's mind",
+        'link': 'https://www.technologyreview.com/2024/11/14/deepmind/',
+        'published': 'Thu, 14 Nov 2024 09:00:00 +0000',
+        'summary': 'Only full text',
+    }]
+
+def test_atom_entries():
+    entries, _ = _parse(ATOM)
+    assert entries[0]['link'] == 'https://www.theverge.com/2024/11/14/openai-search'
+    assert entries[0]['id'] == 'https://www.theverge.com/2024/11/14/1'
+    assert entries[0]['published'] == '2024-11-14T12:00:00-05:00'
+    assert entries[0]['summary'] == 'Search is now built into ChatGPT.'
+    assert entries[1]['link'] == 'https://www.theverge.com/2024/11/14/anthropic'
+    assert entries[1]['published'] == '2024-11-14T08:00:00Z'
+    assert entries[1]['summary'] == 'Claude can now use a computer.'
+
+def test_rdf_items():
+    entries, _ = _parse(RDF)
+    assert entries == [{
+        'title': 'Scaling Laws for Agents',
+        'link': 'http://arxiv.org/abs/2411.01234',
+        'summary': 'We study scaling of agentic systems.',
+        'published': '2024-11-14T00:00:00-05:00',
+        'id': 'http://arxiv.org/abs/2411.01234',
+    }]
+
+def test_stops_after_max_items():
+    entries, body_hash = _parse(RSS, max_items=1, chunk_size=256)
+    assert [e['link'] for e in entries] == ['https://www.technologyreview.com/2024/11/13/ai-lab/']
+    # Хэш считается только по прочитанной части ленты
+    assert body_hash != hashlib.sha256(RSS).hexdigest()
+
+def test_excluded_link_is_skipped():
+    parser = StreamParser(max_items=10, exclude_link='https://www.technologyreview.com/2024/11/13/ai-lab/')
+    parser.feed(RSS)
+    parser.close()
+    assert [e['link'] for e in parser.entries] == ['https://www.technologyreview.com/2024/11/14/deepmind/']
+
+def test_malformed_xml_keeps_received_body():
+    data = b"<rss><channel><item><title>Broken & unescaped</title></item></channel></rss>"
+    with pytest.raises(ParseError) as info:
+        _parse(data, chunk_size=16)
+    assert data.startswith(info.value.body)
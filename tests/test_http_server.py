@@ -0,0 +1,36 @@
+import asyncio
+from utils.http_server import HTTPServer, Response
+
+async def _exchange(raw: bytes) -> bytes:
+    server = HTTPServer('127.0.0.1', 0)
+
+    async def echo(request):
+        return Response(200, request.body)
+
+    server.route('POST', '/hook', echo)
+    await server.start()
+    port = server.server.sockets[0].getsockname()[1]
+    try:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(raw)
+        await writer.drain()
+        response = await asyncio.wait_for(reader.read(), 5)
+        writer.close()
+        return response
+    finally:
+        await server.stop()
+
+def test_post_body_is_passed_to_handler():
+    response = asyncio.run(_exchange(
+        b"POST /hook HTTP/1.1\r\nContent-Length: 2\r\nConnection: close\r\n\r\nok"
+    ))
+    assert response.startswith(b"HTTP/1.1 200 ")
+    assert response.endswith(b"\r\n\r\nok")
+
+def test_negative_content_length_is_rejected():
+    response = asyncio.run(_exchange(b"POST /hook HTTP/1.1\r\nContent-Length: -1\r\n\r\n"))
+    assert response.startswith(b"HTTP/1.1 400 ")
+
+def test_oversized_body_is_rejected():
+    response = asyncio.run(_exchange(b"POST /hook HTTP/1.1\r\nContent-Length: 99999999\r\n\r\n"))
+    assert response.startswith(b"HTTP/1.1 413 ")
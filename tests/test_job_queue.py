@@ -0,0 +1,66 @@
+import time
+from utils.job_queue import JobQueue
+
+def test_expired_lease_is_leased_again(storage):
+    jobs = JobQueue(storage)
+    jobs.enqueue_many('generate', [('a', {'n': 1})])
+    first = jobs.lease('generate', 'worker-1', lease_seconds=-1)
+    assert [job.key for job in first] == ['a']
+
+    second = jobs.lease('generate', 'worker-2')
+    assert [job.key for job in second] == ['a']
+    assert second[0].attempts == 2
+    assert second[0].payload == {'n': 1}
+
+def test_active_lease_is_not_leased_again(storage):
+    jobs = JobQueue(storage)
+    jobs.enqueue_many('generate', [('a', {})])
+    assert jobs.lease('generate', 'worker-1')
+    assert jobs.lease('generate', 'worker-2') == []
+
+def test_complete_after_lost_lease_is_rejected(storage):
+    jobs = JobQueue(storage)
+    jobs.enqueue_many('generate', [('a', {})])
+    [stale] = jobs.lease('generate', 'worker-1', lease_seconds=-1)
+    [current] = jobs.lease('generate', 'worker-2')
+
+    assert not jobs.complete(stale, 'attach', {'url': 'a'}, 'a')
+    assert jobs.counts() == {('generate', 'leased'): 1}
+    assert jobs.complete(current, 'attach', {'url': 'a'}, 'a')
+    assert jobs.counts() == {('generate', 'done'): 1, ('attach', 'queued'): 1}
+
+def test_enqueue_ignores_known_keys(storage):
+    jobs = JobQueue(storage)
+    assert jobs.enqueue_many('publish', [('a', {}), ('b', {})]) == 2
+    assert jobs.enqueue_many('publish', [('a', {}), ('c', {})]) == 1
+    assert jobs.known_keys('publish', ['a', 'c', 'd']) == {'a', 'c'}
+
+def test_failed_job_is_retried_after_backoff(storage):
+    jobs = JobQueue(storage, max_attempts=3)
+    jobs.enqueue_many('publish', [('a', {})])
+    [job] = jobs.lease('publish', 'worker-1')
+
+    assert jobs.fail(job, 'timeout') == 'queued'
+    assert jobs.lease('publish', 'worker-1') == []
+    available_at = storage.read_sync(lambda conn: conn.execute("SELECT available_at FROM jobs").fetchone()[0])
+    assert available_at > time.time()
+
+def test_job_goes_dead_after_max_attempts(storage):
+    jobs = JobQueue(storage, max_attempts=2)
+    jobs.enqueue_many('publish', [('a', {})])
+    for expected in ('queued', 'dead'):
+        [job] = jobs.lease('publish', 'worker-1')
+        assert jobs.fail(job, 'error') == expected
+        storage.write_sync(lambda conn: conn.execute("UPDATE jobs SET available_at=0 WHERE status='queued'"))
+    assert jobs.lease('publish', 'worker-1') == []
+    assert jobs.counts() == {('publish', 'dead'): 1}
+
+def test_save_payload_survives_retry(storage):
+    jobs = JobQueue(storage)
+    jobs.enqueue_many('publish', [('a', {'text': 'post'})])
+    [job] = jobs.lease('publish', 'worker-1')
+    assert jobs.save_payload(job, {'text': 'post', 'sent': {'message_id': 7}})
+    jobs.fail(job, 'db error')
+    storage.write_sync(lambda conn: conn.execute("UPDATE jobs SET available_at=0"))
+    [retry] = jobs.lease('publish', 'worker-1')
+    assert retry.payload['sent'] == {'message_id': 7}
@@ -0,0 +1,104 @@
+import pytest
+from utils.similarity import StoryIndex, story_signature
+
+def entry(title, description='', url=None):
+    return {'title': title, 'description': description, 'url': url or f"https://example.com/{hash(title)}"}
+
+HN_BOILERPLATE = "Article URL: https://github.com/{0} Comments URL: https://news.ycombinator.com/item?id={1} Points: 3"
+
+# Одна история в пересказе разных изданий
+SAME_STORY = [
+    (entry("🤖 OpenAI releases GPT-5 with improved reasoning",
+           "OpenAI today released GPT-5, its new flagship model with better reasoning and coding."),
+     entry("🌐 OpenAI launches GPT-5, its most capable model yet",
+           "GPT-5 is rolling out to ChatGPT users today; OpenAI says the model is better at reasoning and code.")),
+    (entry("Google DeepMind unveils Gemini 2.0",
+           "Gemini 2.0 brings agentic capabilities and native image output, Google DeepMind said."),
+     entry("Google launches Gemini 2.0 with agent features",
+           "Google announced Gemini 2.0, a model built for the agentic era with native tool use.")),
+    (entry("Anthropic launches Claude 3.5 Sonnet",
+           "Claude 3.5 Sonnet outperforms Claude 3 Opus on most benchmarks."),
+     entry("Claude 3.5 Sonnet is Anthropic's new best model",
+           "Anthropic released Claude 3.5 Sonnet, which beats GPT-4o on several evals.")),
+    (entry("Stability AI releases Stable Diffusion 3.5",
+           "Stable Diffusion 3.5 Large and Large Turbo are available today."),
+     entry("Stable Diffusion 3.5 launches with three model sizes",
+           "Stability AI released Stable Diffusion 3.5 in Large, Turbo and Medium variants.")),
+    # Один пресс-релиз в двух лентах
+    (entry("Nvidia acquires Run:ai",
+           "Nvidia said it would acquire Run:ai, a Kubernetes-based GPU orchestration startup, "
+           "to help customers make more efficient use of their compute resources."),
+     entry("Nvidia to acquire Run:ai",
+           "Nvidia said it would acquire Run:ai, a Kubernetes-based GPU orchestration startup, "
+           "to help customers make more efficient use of their AI compute resources.")),
+]
+
+# Разные новости с похожими короткими заголовками
+DIFFERENT_STORIES = [
+    (entry("Microsoft launches Copilot for Excel",
+           "Copilot in Excel helps analyze spreadsheet data with natural language."),
+     entry("Microsoft launches Copilot for Word",
+           "Copilot in Word drafts documents and rewrites paragraphs.")),
+    (entry("New benchmark for LLM reasoning",
+           "We introduce a benchmark of 5,000 math problems to evaluate reasoning."),
+     entry("New dataset for LLM reasoning",
+           "A dataset of chain-of-thought traces collected from human annotators.")),
+    (entry("Show HN: An open source LLM agent framework", HN_BOILERPLATE.format('a/agentkit', 1)),
+     entry("Show HN: Open source framework for LLM agents", HN_BOILERPLATE.format('b/rig', 2))),
+    (entry("Apple releases new AI features in iOS 18",
+           "Apple Intelligence arrives on iPhone with writing tools and a new Siri."),
+     entry("Apple releases new AI features for Mac",
+           "macOS Sequoia gets Apple Intelligence, including image playground.")),
+    (entry("OpenAI makes GPT-4o free for all ChatGPT users",
+           "Free users get access to GPT-4o with usage limits."),
+     entry("OpenAI brings GPT-4o voice mode to the Mac app",
+           "The ChatGPT desktop app for macOS gets advanced voice with GPT-4o.")),
+    (entry("OpenAI releases o1-mini", "A cost-efficient reasoning model for coding and math."),
+     entry("OpenAI releases o1-preview", "A preview of the new reasoning model series.")),
+    # Разные новости об одном продукте с версией
+    (entry("Google sued over Gemini 2.0",
+           "A class action filed in California says Google trained Gemini 2.0 on pirated books without permission."),
+     entry("Google releases Gemini 2.0",
+           "Gemini 2.0 brings agentic capabilities and native image output, Google DeepMind said.")),
+    (entry("GPT-5 launch delayed",
+           "OpenAI has pushed back the release of GPT-5 to next year, CEO Sam Altman said, citing compute shortages."),
+     entry("GPT-5 launched",
+           "OpenAI today released GPT-5, its new flagship model with better reasoning and coding.")),
+    (entry("Meta releases Llama 3",
+           "Meta has released Llama 3 in 8B and 70B sizes, with open weights for developers."),
+     entry("Meta Llama 3 jailbroken within hours",
+           "Security researchers bypassed the safety guardrails of Llama 3 with a simple prompt trick.")),
+    (entry("Apple iOS 18 gets ChatGPT",
+           "iOS 18.2 integrates ChatGPT into Siri and writing tools for iPhone users."),
+     entry("Apple delays iOS 18 Siri features",
+           "Apple says some of the new Siri capabilities in iOS 18 will not ship until next year.")),
+]
+
+@pytest.mark.parametrize('a, b', SAME_STORY, ids=[a['title'] for a, _ in SAME_STORY])
+def test_same_story_is_similar(a, b):
+    index = StoryIndex(None)
+    assert index.is_similar(story_signature(a), story_signature(b))
+
+@pytest.mark.parametrize('a, b', DIFFERENT_STORIES, ids=[a['title'] for a, _ in DIFFERENT_STORIES])
+def test_different_stories_are_not_similar(a, b):
+    index = StoryIndex(None)
+    assert not index.is_similar(story_signature(a), story_signature(b))
+
+def test_title_only_entries_have_no_text_signature():
+    signature = story_signature(entry("Show HN: A tiny LLM agent", HN_BOILERPLATE.format('c/tiny', 3)))
+    assert signature[1] is None
+    assert signature[2] is None
+
+def test_cluster_matches_stories_from_previous_cycles(storage):
+    index = StoryIndex(storage)
+    first, rewrite = SAME_STORY[0]
+    assert index.cluster([first]) == [first]
+    other = DIFFERENT_STORIES[0][0]
+    # Пересказ запомненной истории пропускается, другая история проходит
+    assert index.cluster([rewrite, other]) == [other]
+
+def test_cluster_keeps_first_of_similar_entries_in_one_cycle(storage):
+    index = StoryIndex(storage)
+    first, rewrite = SAME_STORY[1]
+    different = DIFFERENT_STORIES[3]
+    assert index.cluster([first, rewrite, *different], remember=False) == [first, *different]
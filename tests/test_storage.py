@@ -0,0 +1,102 @@
+import asyncio
+import sqlite3
+import pytest
+from storage import MIGRATIONS, Storage
+
+def _open(path):
+    storage = Storage(str(path), pool_size=1)
+    storage.open()
+    return storage
+
+def _columns(path):
+    conn = sqlite3.connect(str(path))
+    try:
+        return [row[1] for row in conn.execute("PRAGMA table_info(posts)")], \
+            conn.execute("PRAGMA user_version").fetchone()[0]
+    finally:
+        conn.close()
+
+@pytest.fixture
+def legacy_db(tmp_path):
+    """posts.db старой storage.Database: 5 колонок, created_at как TIMESTAMP"""
+    path = tmp_path / 'posts.db'
+    conn = sqlite3.connect(str(path))
+    conn.execute('''CREATE TABLE posts
+                 (id TEXT PRIMARY KEY, text TEXT, image_path TEXT, status TEXT, created_at TIMESTAMP)''')
+    conn.execute("INSERT INTO posts VALUES ('post-1', 'old', 'images/post-1.png', 'published', "
+                 "'2024-01-01 10:00:00')")
+    conn.commit()
+    conn.close()
+    return path
+
+@pytest.fixture
+def baseline_db(tmp_path):
+    """posts.db бота до миграций: 7 колонок posts и processed_urls"""
+    path = tmp_path / 'posts.db'
+    conn = sqlite3.connect(str(path))
+    conn.execute('''CREATE TABLE posts
+                 (id TEXT PRIMARY KEY, text TEXT, image_path TEXT, status TEXT, source TEXT,
+                  url TEXT UNIQUE, created_at TEXT)''')
+    conn.execute("CREATE TABLE processed_urls (url TEXT PRIMARY KEY, processed_at TEXT)")
+    conn.execute("INSERT INTO posts VALUES ('post-1', 'old', NULL, 'pending', 'arXiv', "
+                 "'https://arxiv.org/abs/2401.01234', '2024-01-01T10:00:00')")
+    conn.execute("INSERT INTO processed_urls VALUES ('https://arxiv.org/abs/2401.01234', '2024-01-01T10:00:00')")
+    conn.commit()
+    conn.close()
+    return path
+
+EXPECTED_COLUMNS = ['id', 'text', 'image_path', 'status', 'created_at', 'source', 'url', 'file_id', 'title',
+                    'image_profile', 'message_id', 'image_pending']
+
+def test_legacy_five_column_db_is_migrated(legacy_db):
+    storage = _open(legacy_db)
+    storage.close()
+    columns, version = _columns(legacy_db)
+    assert sorted(columns) == sorted(EXPECTED_COLUMNS)
+    assert version == len(MIGRATIONS)
+
+def test_legacy_posts_are_kept_and_new_posts_saved(legacy_db):
+    storage = _open(legacy_db)
+    try:
+        asyncio.run(storage.save_post('post-2', 'new', None, 'arXiv', 'https://arxiv.org/abs/1', title='T'))
+        assert asyncio.run(storage.get_post('post-1')) == ('old', 'images/post-1.png', None, None, None)
+        assert asyncio.run(storage.get_post('post-2')) == ('new', None, 'arXiv', 'https://arxiv.org/abs/1', None)
+        # Уникальность url добавлена миграцией
+        asyncio.run(storage.save_post('post-3', 'dup', None, 'arXiv', 'https://arxiv.org/abs/1'))
+        assert asyncio.run(storage.get_post('post-3')) is None
+    finally:
+        storage.close()
+
+def test_baseline_seven_column_db_is_migrated(baseline_db):
+    storage = _open(baseline_db)
+    try:
+        assert asyncio.run(storage.get_post_by_url('https://arxiv.org/abs/2401.01234')) == \
+            ('post-1', 'pending', 'old', None, 0)
+        processed = storage.read_sync(lambda conn: conn.execute("SELECT url FROM processed_urls").fetchall())
+        assert processed == [('https://arxiv.org/abs/2401.01234',)]
+        tables = storage.read_sync(lambda conn: {row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type='table'")})
+        assert {'feed_cache', 'llm_cache', 'story_signatures', 'jobs', 'feed_schedule', 'candidates'} <= tables
+    finally:
+        storage.close()
+    columns, version = _columns(baseline_db)
+    assert sorted(columns) == sorted(EXPECTED_COLUMNS)
+    assert version == len(MIGRATIONS)
+
+def test_migrations_are_applied_once(tmp_path):
+    path = tmp_path / 'posts.db'
+    _open(path).close()
+    # Повторный запуск не применяет миграции заново (ALTER TABLE упал бы)
+    _open(path).close()
+    assert _columns(path)[1] == len(MIGRATIONS)
+
+def test_post_is_moderated_once(storage):
+    asyncio.run(storage.save_post('post-1', 'text', None, 'arXiv', 'https://arxiv.org/abs/1'))
+    asyncio.run(storage.save_post('post-2', 'text', None, 'arXiv', 'https://arxiv.org/abs/2', image_pending=True))
+    assert asyncio.run(storage.approve('post-1')) == 'published'
+    # Повторное нажатие и отклонение уже опубликованного поста ничего не меняют
+    assert asyncio.run(storage.approve('post-1')) is None
+    assert asyncio.run(storage.reject('post-1')) is False
+    assert asyncio.run(storage.approve('post-2')) == 'approved'
+    assert asyncio.run(storage.approve('post-2')) is None
+    assert asyncio.run(storage.approve('missing')) is None
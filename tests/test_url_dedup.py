@@ -0,0 +1,46 @@
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+import pytest
+from utils.url_dedup import UrlDeduplicator, normalize_url
+
+def entry(url, days_old=0):
+    published = datetime.now(timezone.utc) - timedelta(days=days_old)
+    return {'url': url, 'date': format_datetime(published)}
+
+def test_filter_new_skips_processed_urls(storage):
+    dedup = UrlDeduplicator(storage)
+    dedup.mark(["https://example.com/a?utm_source=rss"])
+    entries = [entry("http://www.example.com/a/"), entry("https://example.com/b")]
+    assert dedup.filter_new(entries) == [entries[1]]
+
+def test_filter_new_skips_duplicates_within_batch(storage):
+    dedup = UrlDeduplicator(storage)
+    entries = [entry("https://example.com/a"), entry("https://example.com/a#comments")]
+    assert dedup.filter_new(entries) == [entries[0]]
+
+def test_entries_older_than_retention_are_dropped(storage):
+    dedup = UrlDeduplicator(storage, retention_days=90)
+    old, recent = entry("https://example.com/old", days_old=120), entry("https://example.com/new", days_old=10)
+    undated = {'url': "https://example.com/undated", 'date': ''}
+    assert dedup.filter_new([old, recent, undated]) == [recent, undated]
+
+def test_pruned_url_of_old_entry_stays_filtered(storage):
+    dedup = UrlDeduplicator(storage, retention_days=90)
+    dedup.mark(["https://example.com/old"])
+    storage.write_sync(lambda conn: conn.execute(
+        "UPDATE processed_urls SET processed_at=?", ((datetime.now() - timedelta(days=100)).isoformat(),)
+    ))
+    dedup.prune()
+    assert dedup.filter_new([entry("https://example.com/old", days_old=100)]) == []
+
+@pytest.mark.parametrize('url, expected', [
+    ("http://www.Example.com/post/?utm_source=rss&utm_medium=feed", "https://example.com/post"),
+    ("https://example.com/post?id=2&fbclid=abc&a=1#comments", "https://example.com/post?a=1&id=2"),
+    ("https://arxiv.org/abs/2401.01234v2", "https://arxiv.org/abs/2401.01234"),
+    ("http://arxiv.org/pdf/2401.01234v3.pdf", "https://arxiv.org/abs/2401.01234"),
+    ("https://export.arxiv.org/abs/2312.12345v1", "https://export.arxiv.org/abs/2312.12345"),
+    ("https://news.ycombinator.com/item?id=41234567", "https://news.ycombinator.com/item?id=41234567"),
+    ("https://example.com", "https://example.com/"),
+])
+def test_normalize_url(url, expected):
+    assert normalize_url(url) == expected
@@ -0,0 +1,49 @@
+import json
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Сколько новость может ждать бюджета и сколько ожидающих новостей берется в цикл
+CANDIDATE_MAX_AGE = 3 * 24 * 60 * 60
+CANDIDATE_MAX_COUNT = 200
+
+class CandidatePool:
+    """Новости, не прошедшие отбор из-за бюджета API.
+
+    Ленты с неизменившимся содержимым не разбираются повторно, поэтому
+    такие новости сами в следующий цикл не вернутся: они хранятся в
+    таблице candidates (создается миграциями storage) и ранжируются
+    заново вместе с новыми. Время первого появления сохраняется между
+    циклами; новости старше max_age отбрасываются.
+    """
+
+    def __init__(self, storage, max_age: float = CANDIDATE_MAX_AGE, max_count: int = CANDIDATE_MAX_COUNT):
+        self.storage = storage
+        self.max_age = max_age
+        self.max_count = max_count
+
+    def load(self) -> list:
+        """Ожидающие новости, самые новые сначала"""
+        rows = self.storage.read_sync(lambda conn: conn.execute(
+            "SELECT payload FROM candidates WHERE created_at>=? ORDER BY created_at DESC LIMIT ?",
+            (time.time() - self.max_age, self.max_count)
+        ).fetchall())
+        return [json.loads(payload) for (payload,) in rows]
+
+    def replace(self, entries: list):
+        """Заменяет ожидающие новости списком entries, сохраняя время их первого появления"""
+        now = time.time()
+
+        def save(conn):
+            created = dict(conn.execute("SELECT url, created_at FROM candidates"))
+            conn.execute("DELETE FROM candidates")
+            conn.executemany(
+                "INSERT OR IGNORE INTO candidates (url, payload, created_at) VALUES (?, ?, ?)",
+                [(entry['url'], json.dumps(entry, ensure_ascii=False), created.get(entry['url'], now))
+                 for entry in entries if entry.get('url')]
+            )
+
+        self.storage.write_sync(save)
+        if entries:
+            logger.info(f"Новостей ждут бюджета: {len(entries)}")
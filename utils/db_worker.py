@@ -0,0 +1,132 @@
+import asyncio
+import queue
+import sqlite3
+import threading
+import logging
+from concurrent.futures import Future
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Настройки SQLite для одного пишущего потока и параллельных читателей
+PRAGMAS = (
+    # Действует только для новой БД; существующую переводит python bot.py --vacuum
+    "PRAGMA auto_vacuum=INCREMENTAL",
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA busy_timeout=5000",
+)
+
+MAX_BATCH = 100
+
+class DBWorker:
+    """Поток записи в SQLite с групповым коммитом.
+
+    Задачи из очереди выбираются пачками и выполняются в одной транзакции;
+    каждая задача получает Future, который завершается после COMMIT.
+    Задачи вызываются как fn(conn, *args) в потоке воркера.
+    """
+
+    def __init__(self, db_path: str = 'posts.db', init: Optional[Callable] = None,
+                 max_batch: int = MAX_BATCH):
+        self.db_path = db_path
+        self.init = init
+        self.max_batch = max_batch
+        self.tasks = queue.Queue()
+        self.thread = None
+
+    def start(self):
+        ready = Future()
+        self.thread = threading.Thread(target=self._run, args=(ready,), daemon=True)
+        self.thread.start()
+        # Схема должна быть готова до первого обращения к БД
+        ready.result()
+
+    def stop(self, timeout: float = 10):
+        if self.thread is None:
+            return
+        self.tasks.put(None)
+        self.thread.join(timeout)
+        self.thread = None
+
+    def submit(self, fn: Callable, *args) -> Future:
+        """Ставит функцию fn(conn, *args) в очередь и возвращает Future с ее результатом"""
+        future = Future()
+        self.tasks.put((fn, args, future))
+        return future
+
+    async def run(self, fn: Callable, *args):
+        """Асинхронный вариант submit: ждет коммита и возвращает результат"""
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+    def queue_size(self) -> int:
+        return self.tasks.qsize()
+
+    def _connect(self) -> sqlite3.Connection:
+        # Транзакциями управляем вручную
+        conn = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False,
+                               cached_statements=256)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        return conn
+
+    def _run(self, ready: Future):
+        try:
+            conn = self._connect()
+            if self.init:
+                self.init(conn)
+            ready.set_result(True)
+        except Exception as e:
+            logger.error(f"Ошибка инициализации БД: {str(e)}")
+            ready.set_exception(e)
+            return
+
+        stopping = False
+        while not stopping:
+            batch = [self.tasks.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self.tasks.get_nowait())
+                except queue.Empty:
+                    break
+            if None in batch:
+                stopping = True
+                batch = [task for task in batch if task is not None]
+            if batch:
+                self._execute_batch(conn, batch)
+
+        conn.close()
+        logger.info("Рабочий поток БД остановлен")
+
+    def _execute_batch(self, conn: sqlite3.Connection, batch: list):
+        outcomes = []
+        try:
+            # IMMEDIATE: блокировку записи берем сразу, иначе при записи из других
+            # процессов транзакция может не получить ее посреди пачки
+            conn.execute("BEGIN IMMEDIATE")
+            for handler, args, future in batch:
+                # Точка сохранения изолирует ошибку одной задачи от остальных
+                conn.execute("SAVEPOINT task")
+                try:
+                    outcomes.append((future, handler(conn, *args), None))
+                    conn.execute("RELEASE task")
+                except Exception as e:
+                    conn.execute("ROLLBACK TO task")
+                    conn.execute("RELEASE task")
+                    name = getattr(handler, '__name__', 'task')
+                    logger.error(f"Ошибка задачи БД {name}: {str(e)}")
+                    outcomes.append((future, None, e))
+            conn.execute("COMMIT")
+        except Exception as e:
+            logger.error(f"Ошибка в рабочем потоке БД: {str(e)}")
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            outcomes = [(future, None, e) for _, _, future in batch]
+
+        for future, result, error in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
@@ -0,0 +1,51 @@
+import json
+import logging
+from datetime import datetime
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Сколько идентификаторов записей храним для каждой ленты
+MAX_ENTRY_IDS = 50
+
+class FeedCache:
+    """Кэш HTTP-валидаторов (ETag / Last-Modified) для RSS-лент.
+
+    Таблица feed_cache создается миграциями storage; методы синхронные,
+    загрузчик лент вызывает их через asyncio.to_thread.
+    """
+
+    def __init__(self, storage):
+        self.storage = storage
+
+    def get(self, url: str) -> Optional[dict]:
+        """Возвращает сохраненные валидаторы ленты"""
+        row = self.storage.read_sync(lambda conn: conn.execute(
+            "SELECT etag, last_modified, body_hash, entry_ids FROM feed_cache WHERE url=?",
+            (url,)
+        ).fetchone())
+        if not row:
+            return None
+        etag, last_modified, body_hash, entry_ids = row
+        return {
+            'etag': etag,
+            'last_modified': last_modified,
+            'body_hash': body_hash,
+            'entry_ids': json.loads(entry_ids) if entry_ids else []
+        }
+
+    def update(self, url: str, etag: Optional[str], last_modified: Optional[str],
+               body_hash: str, entry_ids: list):
+        """Сохраняет валидаторы после успешной загрузки"""
+        row = (url, etag, last_modified, body_hash,
+               json.dumps(entry_ids[:MAX_ENTRY_IDS]), datetime.now().isoformat())
+        self.storage.write_sync(lambda conn: conn.execute(
+            "INSERT OR REPLACE INTO feed_cache VALUES (?, ?, ?, ?, ?, ?)", row
+        ))
+
+    def touch(self, url: str):
+        """Отмечает время проверки неизменившейся ленты"""
+        checked_at = datetime.now().isoformat()
+        self.storage.write_nowait(lambda conn: conn.execute(
+            "UPDATE feed_cache SET checked_at=? WHERE url=?", (checked_at, url)
+        ))
@@ -0,0 +1,117 @@
+import heapq
+import logging
+import random
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Границы интервала опроса одной ленты, секунды
+MIN_POLL_INTERVAL = 10 * 60
+MAX_POLL_INTERVAL = 24 * 60 * 60
+DEFAULT_POLL_INTERVAL = 2 * 60 * 60
+# Разброс времени опроса, чтобы ленты не совпадали по фазе
+POLL_JITTER = 0.1
+# Вес нового наблюдения в экспоненциальном сглаживании частоты публикаций
+RATE_SMOOTHING = 0.3
+# Сколько новых записей ожидаем застать за один опрос
+TARGET_NEW_ITEMS = 1
+
+class FeedScheduler:
+    """Планировщик опроса лент по наблюдаемой частоте публикаций.
+
+    Для каждой ленты хранится сглаженная частота новых записей; следующий
+    опрос назначается так, чтобы в среднем застать TARGET_NEW_ITEMS новых
+    записей, в пределах [min_interval, max_interval]. Очередь — куча по
+    времени следующего опроса; состояние сохраняется в таблице
+    feed_schedule, чтобы переживать перезапуски.
+    """
+
+    def __init__(self, storage, urls: list, min_interval: float = MIN_POLL_INTERVAL,
+                 max_interval: float = MAX_POLL_INTERVAL, default_interval: float = DEFAULT_POLL_INTERVAL,
+                 jitter: float = POLL_JITTER):
+        self.storage = storage
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.default_interval = default_interval
+        self.jitter = jitter
+        self.state = {}
+        self.heap = []
+        self._load(urls)
+
+    def _load(self, urls: list):
+        rows = self.storage.read_sync(lambda conn: conn.execute(
+            "SELECT url, rate, interval, last_poll_at, next_poll_at FROM feed_schedule"
+        ).fetchall())
+        saved = {row[0]: row[1:] for row in rows}
+        now = time.time()
+        for url in urls:
+            rate, interval, last_poll_at, next_poll_at = saved.get(url, (None, None, None, now))
+            self.state[url] = {
+                'rate': rate,
+                'interval': interval or self.default_interval,
+                'last_poll_at': last_poll_at,
+                'next_poll_at': next_poll_at,
+                'seen': set()
+            }
+            heapq.heappush(self.heap, (next_poll_at, url))
+
+    def due(self, now: Optional[float] = None) -> list:
+        """Забирает из очереди ленты, время опроса которых наступило"""
+        now = time.time() if now is None else now
+        urls = []
+        while self.heap and self.heap[0][0] <= now:
+            next_poll_at, url = heapq.heappop(self.heap)
+            # Устаревшие элементы кучи после перепланирования пропускаем
+            if self.state[url]['next_poll_at'] == next_poll_at:
+                urls.append(url)
+        return urls
+
+    def seconds_until_next(self, now: Optional[float] = None) -> float:
+        now = time.time() if now is None else now
+        if not self.heap:
+            return self.default_interval
+        return max(self.heap[0][0] - now, 0.0)
+
+    def _next_interval(self, state: dict) -> float:
+        if state['rate']:
+            interval = TARGET_NEW_ITEMS / state['rate']
+        else:
+            # Новых записей еще не видели: опрашиваем все реже
+            interval = state['interval'] * 2
+        return min(max(interval, self.min_interval), self.max_interval)
+
+    def record(self, url: str, entry_urls: Optional[list], now: Optional[float] = None):
+        """Учитывает результат опроса и назначает следующий.
+
+        entry_urls — необработанные записи ленты; новыми считаются те, что
+        не встречались при прошлом опросе (кандидаты, не прошедшие отбор,
+        остаются в ленте и повторно не учитываются). None — лента не
+        вернула записей.
+        """
+        now = time.time() if now is None else now
+        state = self.state.get(url)
+        if state is None:
+            return
+        new_items = 0
+        if entry_urls is not None:
+            new_items = len(set(entry_urls) - state['seen'])
+            state['seen'] = set(entry_urls)
+        elapsed = now - state['last_poll_at'] if state['last_poll_at'] else state['interval']
+        observed = new_items / max(elapsed, 1.0)
+        if state['rate'] is None:
+            state['rate'] = observed
+        else:
+            state['rate'] = (1 - RATE_SMOOTHING) * state['rate'] + RATE_SMOOTHING * observed
+        state['interval'] = self._next_interval(state)
+        state['last_poll_at'] = now
+        state['next_poll_at'] = now + state['interval'] * random.uniform(1 - self.jitter, 1 + self.jitter)
+        heapq.heappush(self.heap, (state['next_poll_at'], url))
+
+        row = (url, state['rate'], state['interval'], now, state['next_poll_at'])
+        self.storage.write_nowait(lambda conn: conn.execute(
+            "INSERT OR REPLACE INTO feed_schedule (url, rate, interval, last_poll_at, next_poll_at) "
+            "VALUES (?, ?, ?, ?, ?)", row
+        ))
+        logger.info(f"Лента {url}: новых записей {new_items}, "
+                    f"следующий опрос через {state['interval'] / 60:.0f} мин")
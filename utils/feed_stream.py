@@ -0,0 +1,121 @@
+import asyncio
+import hashlib
+import logging
+from typing import AsyncIterable, Optional
+from xml.etree.ElementTree import ParseError, XMLPullParser
+from utils.http_client import ResponseTooLarge
+
+logger = logging.getLogger(__name__)
+
+ITEM_TAGS = {'item', 'entry'}
+# Поля записи по локальному имени тега (RSS 2.0, RSS 1.0/RDF, Atom, Dublin Core)
+FIELD_TAGS = {
+    'title': 'title',
+    'guid': 'id',
+    'id': 'id',
+    'description': 'summary',
+    'summary': 'summary',
+    'encoded': 'content',
+    'content': 'content',
+    'pubDate': 'published',
+    'published': 'published',
+    'date': 'published',
+    'updated': 'updated',
+}
+
+def _local_name(tag: str) -> str:
+    return tag.rsplit('}', 1)[-1]
+
+def _item_fields(item) -> dict:
+    """Поля записи в именах feedparser: title, link, id, summary, published"""
+    fields = {}
+    for child in item:
+        name = _local_name(child.tag)
+        if name == 'link':
+            # Atom: <link rel="alternate" href="..."/>, RSS: <link>...</link>
+            href = child.get('href')
+            if href is not None:
+                if child.get('rel', 'alternate') == 'alternate' and 'link' not in fields:
+                    fields['link'] = href.strip()
+            elif child.text:
+                fields['link'] = child.text.strip()
+            continue
+        key = FIELD_TAGS.get(name)
+        if key and key not in fields:
+            fields[key] = ''.join(child.itertext()).strip()
+    # Как в feedparser: без описания берем полный текст, без даты публикации — дату обновления
+    if 'summary' not in fields and 'content' in fields:
+        fields['summary'] = fields['content']
+    if 'published' not in fields and 'updated' in fields:
+        fields['published'] = fields['updated']
+    if 'id' not in fields:
+        # RSS 1.0: идентификатор записи в атрибуте rdf:about
+        about = [value for name, value in item.attrib.items() if _local_name(name) == 'about']
+        if about:
+            fields['id'] = about[0]
+    fields.pop('content', None)
+    fields.pop('updated', None)
+    return fields
+
+class StreamParser:
+    """Потоковый разбор RSS/Atom с остановкой после первых max_items записей.
+
+    Данные подаются кусками через feed(); дерево документа не строится
+    целиком: обработанные записи сразу очищаются. Некорректный XML
+    вызывает ParseError — тогда вызывающий код разбирает ленту feedparser.
+    """
+
+    def __init__(self, max_items: int, exclude_link: Optional[str] = None):
+        self.max_items = max_items
+        self.exclude_link = exclude_link
+        self.parser = XMLPullParser(events=('end',))
+        self.entries = []
+        self.done = False
+
+    def feed(self, chunk: bytes):
+        self.parser.feed(chunk)
+        for _, elem in self.parser.read_events():
+            if _local_name(elem.tag) not in ITEM_TAGS:
+                continue
+            fields = _item_fields(elem)
+            elem.clear()
+            # Записи без ссылки бот все равно пропустит, в лимит они не входят
+            if fields.get('link') and fields['link'] != self.exclude_link:
+                self.entries.append(fields)
+                if len(self.entries) >= self.max_items:
+                    self.done = True
+                    return
+
+    def close(self):
+        if not self.done:
+            self.parser.close()
+
+async def parse_stream(chunks: AsyncIterable[bytes], max_items: int, exclude_link: Optional[str] = None):
+    """Разбирает ленту по мере загрузки и прекращает чтение после max_items записей.
+
+    Возвращает (записи, sha256 прочитанной части). Куски разбираются в
+    потоке: лента без ссылок в записях не останавливается рано, и разбор
+    до MAX_FEED_BYTES занял бы event loop. При ParseError прочитанные байты
+    передаются в атрибуте body исключения, чтобы дочитать ленту и разобрать
+    ее feedparser. Размер ответа ограничивает HTTP-клиент (ResponseTooLarge).
+    """
+    parser = StreamParser(max_items, exclude_link)
+    digest = hashlib.sha256()
+    received = []
+    try:
+        async for chunk in chunks:
+            digest.update(chunk)
+            received.append(chunk)
+            await asyncio.to_thread(parser.feed, chunk)
+            if parser.done:
+                break
+        await asyncio.to_thread(parser.close)
+    except ParseError as e:
+        e.body = b''.join(received)
+        raise
+    except ResponseTooLarge as e:
+        # Уже найденных записей достаточно, хвост огромной ленты не нужен
+        if not parser.entries:
+            raise
+        logger.warning(f"{str(e)}: лента обрезана, записей: {len(parser.entries)}")
+    return parser.entries, digest.hexdigest()
@@ -0,0 +1,62 @@
+import asyncio
+import time
+import logging
+from typing import Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 300
+DEFAULT_TIMEOUT = 5
+
+class HealthChecker:
+    """Ленивые проверки внешних сервисов с кэшированием результата.
+
+    Проверки выполняются только по запросу, параллельно и с таймаутом;
+    результат хранится ttl секунд, а одновременные запросы одной проверки
+    ждут общий вызов.
+    """
+
+    def __init__(self, ttl: float = DEFAULT_TTL, timeout: float = DEFAULT_TIMEOUT):
+        self.ttl = ttl
+        self.timeout = timeout
+        self.probes = {}
+        self.results = {}
+        self.inflight = {}
+
+    def register(self, name: str, probe: Callable[[], Awaitable[bool]]):
+        self.probes[name] = probe
+
+    async def _run_probe(self, name: str) -> bool:
+        try:
+            ok = bool(await asyncio.wait_for(self.probes[name](), timeout=self.timeout))
+        except asyncio.TimeoutError:
+            logger.warning(f"✗ {name}: таймаут проверки ({self.timeout} сек)")
+            ok = False
+        except Exception as e:
+            logger.warning(f"✗ {name}: {str(e)}")
+            ok = False
+        self.results[name] = (ok, time.monotonic())
+        return ok
+
+    async def check(self, name: str, force: bool = False) -> bool:
+        """Результат проверки из кэша или новый, если кэш устарел"""
+        cached = self.results.get(name)
+        if cached and not force and time.monotonic() - cached[1] < self.ttl:
+            return cached[0]
+        if name not in self.inflight:
+            task = asyncio.ensure_future(self._run_probe(name))
+            self.inflight[name] = task
+            task.add_done_callback(lambda _: self.inflight.pop(name, None))
+        return await asyncio.shield(self.inflight[name])
+
+    async def check_all(self, force: bool = False) -> dict:
+        names = list(self.probes)
+        results = await asyncio.gather(*(self.check(name, force) for name in names))
+        status = dict(zip(names, results))
+        for name, ok in status.items():
+            if ok:
+                logger.info(f"✓ {name}")
+            else:
+                logger.warning(f"✗ {name} недоступен")
+        logger.info(f"Итого: {sum(status.values())}/{len(status)} сервисов доступны")
+        return status
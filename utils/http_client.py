@@ -0,0 +1,198 @@
+import asyncio
+import json
+import logging
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Пул соединений: всего, сколько держать открытыми и как долго
+MAX_CONNECTIONS = 32
+MAX_KEEPALIVE_CONNECTIONS = 16
+KEEPALIVE_EXPIRY = 60
+# Одновременных запросов к одному хосту
+MAX_PER_HOST = 4
+DEFAULT_TIMEOUT = 15
+CONNECT_TIMEOUT = 5
+# Повторы: пауза RETRY_BACKOFF * 2^попытка со случайным разбросом
+MAX_RETRIES = 2
+RETRY_BACKOFF = 0.5
+RETRY_STATUSES = {502, 503, 504}
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS'}
+# Ошибки, при которых запрос заведомо не ушел на сервер: их можно повторять для любого метода
+NOT_SENT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+# Ограничение на размер тела ответа по умолчанию
+MAX_RESPONSE_BYTES = 10 * 1024 * 1024
+
+# HTTP/2 включается, только если установлен пакет h2 (pip install httpx[http2])
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+class ResponseTooLarge(Exception):
+    """Тело ответа больше допустимого размера"""
+
+class StreamingResponse:
+    """Ответ, тело которого читается по кускам с проверкой размера"""
+
+    def __init__(self, response: httpx.Response, max_bytes: int, started: float = 0.0):
+        self.response = response
+        # Начало последней попытки запроса (time.monotonic)
+        self.started = started
+        self.status_code = response.status_code
+        self.headers = response.headers
+        self.max_bytes = max_bytes
+
+    async def aiter_bytes(self, chunk_size: Optional[int] = None):
+        # Content-Length не проверяем заранее: из начала большой ленты еще можно взять записи
+        total = 0
+        async for chunk in self.response.aiter_bytes(chunk_size):
+            total += len(chunk)
+            if total > self.max_bytes:
+                raise ResponseTooLarge(f"Ответ {self.response.url} больше {self.max_bytes} байт")
+            yield chunk
+
+    async def read(self) -> bytes:
+        return b''.join([chunk async for chunk in self.aiter_bytes()])
+
+class HTTPResponse:
+    """Прочитанный ответ: код, заголовки, тело и время самого запроса в секундах"""
+
+    def __init__(self, status_code: int, headers, content: bytes, elapsed: float = 0.0):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.elapsed = elapsed
+
+    @property
+    def text(self) -> str:
+        return self.content.decode('utf-8', errors='replace')
+
+    def json(self):
+        return json.loads(self.content)
+
+class HTTPClient:
+    """Общий асинхронный HTTP-клиент с пулом соединений.
+
+    Соединения переиспользуются между запросами (keep-alive), поэтому
+    повторные обращения к тем же лентам и API обходятся без TLS-рукопожатия.
+    Число одновременных запросов к одному хосту ограничено, сетевые ошибки
+    и ответы 502/503/504 повторяются с экспоненциальной паузой (для
+    неидемпотентных методов — только если запрос не был отправлен), а
+    размер тела ответа ограничен. 429 не повторяется: паузу выбирает
+    общий лимитер.
+    """
+
+    def __init__(self, max_connections: int = MAX_CONNECTIONS,
+                 max_keepalive_connections: int = MAX_KEEPALIVE_CONNECTIONS,
+                 max_per_host: int = MAX_PER_HOST, timeout: float = DEFAULT_TIMEOUT,
+                 max_retries: int = MAX_RETRIES, max_response_bytes: int = MAX_RESPONSE_BYTES):
+        self.client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections,
+                keepalive_expiry=KEEPALIVE_EXPIRY
+            ),
+            timeout=httpx.Timeout(timeout, connect=CONNECT_TIMEOUT),
+            http2=HTTP2_AVAILABLE,
+            follow_redirects=True
+        )
+        self.max_per_host = max_per_host
+        self.max_retries = max_retries
+        self.max_response_bytes = max_response_bytes
+        self.hosts = {}
+        self.loop = None
+
+    def _host_slot(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc
+        if host not in self.hosts:
+            self.hosts[host] = asyncio.Semaphore(self.max_per_host)
+        return self.hosts[host]
+
+    async def _send(self, method: str, url: str, retries: Optional[int], **kwargs) -> tuple:
+        """Отправляет запрос с повторами; тело ответа остается непрочитанным.
+
+        Возвращает ответ и время начала последней попытки.
+        """
+        retries = self.max_retries if retries is None else retries
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        attempt = 0
+        while True:
+            try:
+                started = time.monotonic()
+                request = self.client.build_request(method, url, **kwargs)
+                response = await self.client.send(request, stream=True)
+            except httpx.TransportError as e:
+                if attempt >= retries or not (idempotent or isinstance(e, NOT_SENT_ERRORS)):
+                    raise
+                reason = f"{type(e).__name__}: {str(e)}"
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt >= retries or not idempotent:
+                    return response, started
+                await response.aclose()
+                reason = f"код {response.status_code}"
+            delay = RETRY_BACKOFF * 2 ** attempt * random.uniform(0.8, 1.2)
+            attempt += 1
+            logger.warning(f"{method} {url}: {reason}, повтор {attempt}/{retries} через {delay:.1f} сек")
+            await asyncio.sleep(delay)
+
+    @asynccontextmanager
+    async def stream(self, method: str, url: str, *, headers: Optional[dict] = None,
+                     json_body=None, timeout: Optional[float] = None, retries: Optional[int] = None,
+                     max_bytes: Optional[int] = None):
+        """Запрос с потоковым чтением тела; соединение возвращается в пул при выходе"""
+        kwargs = {'headers': headers, 'json': json_body}
+        if timeout is not None:
+            kwargs['timeout'] = httpx.Timeout(timeout, connect=min(timeout, CONNECT_TIMEOUT))
+        async with self._host_slot(url):
+            response, started = await self._send(method, url, retries, **kwargs)
+            try:
+                yield StreamingResponse(response, max_bytes or self.max_response_bytes, started)
+            finally:
+                await response.aclose()
+
+    async def request(self, method: str, url: str, **kwargs) -> HTTPResponse:
+        """Запрос с чтением всего тела (не больше max_bytes)"""
+        async with self.stream(method, url, **kwargs) as response:
+            content = await response.read()
+        # Только последняя попытка: без ожидания слота хоста и пауз между повторами
+        elapsed = time.monotonic() - response.started
+        return HTTPResponse(response.status_code, response.headers, content, elapsed)
+
+    async def get(self, url: str, **kwargs) -> HTTPResponse:
+        return await self.request('GET', url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> HTTPResponse:
+        return await self.request('POST', url, **kwargs)
+
+    async def head(self, url: str, **kwargs) -> HTTPResponse:
+        return await self.request('HEAD', url, **kwargs)
+
+    async def aclose(self):
+        await self.client.aclose()
+
+# Общий клиент создается при первом использовании в текущем event loop
+http_client: Optional[HTTPClient] = None
+
+def get_http_client() -> HTTPClient:
+    """Общий клиент; соединения пула привязаны к event loop, в котором созданы"""
+    global http_client
+    loop = asyncio.get_running_loop()
+    if http_client is None or http_client.loop is not loop:
+        http_client = HTTPClient()
+        http_client.loop = loop
+    return http_client
+
+async def close_http_client():
+    """Закрывает соединения общего клиента; вызывается при остановке бота"""
+    global http_client
+    if http_client is not None and http_client.loop is asyncio.get_running_loop():
+        await http_client.aclose()
+    http_client = None
@@ -0,0 +1,163 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional
+from urllib.parse import parse_qs, urlsplit
+
+logger = logging.getLogger(__name__)
+
+MAX_BODY_SIZE = 1024 * 1024
+HEADER_TIMEOUT = 10
+KEEPALIVE_TIMEOUT = 30
+
+REASONS = {200: 'OK', 304: 'Not Modified', 400: 'Bad Request', 403: 'Forbidden', 404: 'Not Found',
+           405: 'Method Not Allowed', 413: 'Payload Too Large', 429: 'Too Many Requests',
+           500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+class HTTPError(Exception):
+    def __init__(self, status: int):
+        super().__init__(REASONS.get(status, 'Error'))
+        self.status = status
+
+class Request:
+    def __init__(self, method: str, target: str, headers: dict, body: bytes):
+        parts = urlsplit(target)
+        self.method = method
+        self.path = parts.path
+        self.query = parse_qs(parts.query)
+        self.headers = headers
+        self.body = body
+
+class Response:
+    def __init__(self, status: int = 200, body=b'', content_type: str = 'text/plain; charset=utf-8',
+                 headers: Optional[dict] = None):
+        self.status = status
+        self.body = body.encode('utf-8') if isinstance(body, str) else body
+        self.content_type = content_type
+        self.headers = headers or {}
+
+class HTTPServer:
+    """Минимальный встроенный HTTP/1.1-сервер на asyncio.
+
+    Нужен для вебхука Telegram и служебных эндпоинтов, поэтому умеет только
+    маршруты по точному пути, keep-alive и корректную остановку.
+    """
+
+    def __init__(self, host: str = '0.0.0.0', port: int = 8080, max_body: int = MAX_BODY_SIZE):
+        self.host = host
+        self.port = port
+        self.max_body = max_body
+        self.routes = {}
+        self.server: Optional[asyncio.AbstractServer] = None
+        # Открытые соединения и те из них, что сейчас обрабатывают запрос
+        self.connections = {}
+        self.busy = set()
+
+    def route(self, method: str, path: str, handler: Callable[[Request], Awaitable[Response]]):
+        self.routes[(method.upper(), path)] = handler
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        logger.info(f"HTTP-сервер слушает {self.host}:{self.port}")
+
+    async def stop(self, timeout: float = 10):
+        """Прекращает прием соединений и дожидается текущих запросов"""
+        if self.server is None:
+            return
+        server, self.server = self.server, None
+        server.close()
+        # Простаивающие keep-alive соединения закрываем сразу, активные дорабатывают
+        for task, writer in list(self.connections.items()):
+            if task not in self.busy:
+                writer.close()
+        if self.connections:
+            await asyncio.wait(list(self.connections), timeout=timeout)
+        try:
+            await asyncio.wait_for(server.wait_closed(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        logger.info("HTTP-сервер остановлен")
+
+    async def _read_request(self, reader: asyncio.StreamReader, timeout: float) -> Optional[Request]:
+        request_line = await asyncio.wait_for(reader.readline(), timeout)
+        if not request_line:
+            return None
+        try:
+            method, target, _ = request_line.decode('latin-1').split(' ', 2)
+        except ValueError:
+            raise HTTPError(400)
+        headers = {}
+        while True:
+            line = await asyncio.wait_for(reader.readline(), HEADER_TIMEOUT)
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            raise HTTPError(400)
+        if length < 0:
+            raise HTTPError(400)
+        if length > self.max_body:
+            raise HTTPError(413)
+        body = await asyncio.wait_for(reader.readexactly(length), HEADER_TIMEOUT) if length else b''
+        return Request(method.upper(), target, headers, body)
+
+    async def _dispatch(self, request: Request) -> Response:
+        handler = self.routes.get((request.method, request.path))
+        if handler is None:
+            if any(path == request.path for _, path in self.routes):
+                return Response(405, 'Method Not Allowed')
+            return Response(404, 'Not Found')
+        try:
+            return await handler(request)
+        except Exception as e:
+            logger.error(f"Ошибка обработки {request.method} {request.path}: {str(e)}")
+            return Response(500, 'Internal Server Error')
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        self.connections[task] = writer
+        try:
+            timeout = HEADER_TIMEOUT
+            while self.server is not None:
+                try:
+                    request = await self._read_request(reader, timeout)
+                except HTTPError as e:
+                    await self._write(writer, Response(e.status, str(e)), False)
+                    break
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    break
+                if request is None:
+                    break
+                self.busy.add(task)
+                try:
+                    response = await self._dispatch(request)
+                    keep_alive = (request.headers.get('connection', '').lower() != 'close'
+                                  and self.server is not None)
+                    await self._write(writer, response, keep_alive)
+                finally:
+                    self.busy.discard(task)
+                if not keep_alive:
+                    break
+                timeout = KEEPALIVE_TIMEOUT
+        except ConnectionError:
+            pass
+        finally:
+            self.connections.pop(task, None)
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def _write(self, writer: asyncio.StreamWriter, response: Response, keep_alive: bool):
+        head = (
+            f"HTTP/1.1 {response.status} {REASONS.get(response.status, 'OK')}\r\n"
+            f"Content-Type: {response.content_type}\r\n"
+            f"Content-Length: {len(response.body)}\r\n"
+            + ''.join(f"{name}: {value}\r\n" for name, value in response.headers.items()) +
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode('latin-1') + response.body)
+        await writer.drain()
@@ -1,19 +1,91 @@
 import os
 import base64
-import requests
 import logging
 from dotenv import load_dotenv
 from typing import Optional
-import time
+from utils.http_client import get_http_client
+from utils.rate_limiter import RateLimitExceeded, retry_after_from_headers
 
 load_dotenv()
 logger = logging.getLogger(__name__)
 
+# Ответ с изображением 1024x1024 в base64 занимает несколько мегабайт
+MAX_RESPONSE_BYTES = 32 * 1024 * 1024
+
+# Очередь изображений, с которой качество снижается до balanced и до fast
+BUSY_BACKLOG = 4
+OVERLOAD_BACKLOG = 12
+# Генерация медленнее ожидаемой во столько раз считается перегрузкой API
+SLOW_LATENCY_RATIO = 1.5
+# Вес нового замера в сглаженной задержке
+LATENCY_SMOOTHING = 0.3
+
+class ImageProfile:
+    """Параметры генерации: движок, размер, число шагов и ожидаемое время"""
+
+    def __init__(self, name: str, engine_id: str, width: int, height: int, steps: int,
+                 timeout: float, expected_seconds: float):
+        self.name = name
+        self.engine_id = engine_id
+        self.width = width
+        self.height = height
+        self.steps = steps
+        self.timeout = timeout
+        self.expected_seconds = expected_seconds
+
+# От лучшего качества к самому дешевому и быстрому
+IMAGE_PROFILES = [
+    ImageProfile('full', "stable-diffusion-xl-1024-v1-0", 1024, 1024, 30, 30, 10),
+    ImageProfile('balanced', "stable-diffusion-xl-1024-v1-0", 1024, 1024, 20, 25, 7),
+    ImageProfile('fast', "stable-diffusion-v1-6", 512, 512, 15, 15, 3),
+]
+
+class ProfileController:
+    """Выбор профиля изображения по нагрузке.
+
+    Уровень задается очередью изображений (busy_backlog — balanced,
+    overload_backlog — fast); если Stability отвечает медленнее ожидаемого
+    для профиля, качество снижается еще на ступень. Пустая очередь всегда
+    возвращает полное качество.
+    """
+
+    def __init__(self, busy_backlog: int = BUSY_BACKLOG, overload_backlog: int = OVERLOAD_BACKLOG,
+                 slow_ratio: float = SLOW_LATENCY_RATIO):
+        self.busy_backlog = busy_backlog
+        self.overload_backlog = overload_backlog
+        self.slow_ratio = slow_ratio
+        # Сглаженное отношение фактического времени генерации к ожидаемому
+        self.latency_ratio = None
+        self.current = IMAGE_PROFILES[0]
+
+    def record(self, profile: ImageProfile, seconds: float):
+        """Учитывает время генерации изображения"""
+        ratio = seconds / profile.expected_seconds
+        if self.latency_ratio is None:
+            self.latency_ratio = ratio
+        else:
+            self.latency_ratio = (1 - LATENCY_SMOOTHING) * self.latency_ratio + LATENCY_SMOOTHING * ratio
+
+    def choose(self, backlog: int) -> ImageProfile:
+        """Профиль для следующего изображения; backlog — изображения, ожидающие генерации"""
+        if backlog <= 0:
+            level = 0
+        else:
+            level = 2 if backlog >= self.overload_backlog else 1 if backlog >= self.busy_backlog else 0
+            if self.latency_ratio is not None and self.latency_ratio > self.slow_ratio:
+                level += 1
+        profile = IMAGE_PROFILES[min(level, len(IMAGE_PROFILES) - 1)]
+        if profile is not self.current:
+            latency = f"{self.latency_ratio:.1f}" if self.latency_ratio is not None else "нет данных"
+            logger.info(f"Профиль изображений: {self.current.name} -> {profile.name} "
+                        f"(очередь {backlog}, задержка x{latency})")
+            self.current = profile
+        return profile
+
 class ImageGenerator:
     def __init__(self):
         self.api_key = os.getenv("STABILITY_API_KEY")
-        self.api_host = "https://api.stability.ai"
-        self.engine_id = "stable-diffusion-xl-1024-v1-0"
+        self.api_host = os.getenv("STABILITY_API_HOST", "https://api.stability.ai")
         
         if not self.api_key:
             logger.error("STABILITY_API_KEY не найден в .env")
@@ -38,14 +110,20 @@ class ImageGenerator:
         
         return f"{clean_prompt[:200]}, {base_prompt}"
 
-    def generate_image(self, original_prompt: str) -> Optional[bytes]:
-        """Генерирует изображение через REST API"""
+    async def generate_image(self, original_prompt: str, profile: Optional[ImageProfile] = None,
+                             controller: Optional[ProfileController] = None) -> Optional[bytes]:
+        """Генерирует изображение через REST API; по умолчанию — в полном качестве.
+
+        controller получает время самого HTTP-запроса; ошибка или таймаут
+        учитываются как не меньше profile.timeout.
+        """
         if not original_prompt:
             logger.error("Получен пустой промпт")
             return None
 
+        profile = profile or IMAGE_PROFILES[0]
         safe_prompt = self._make_safe_prompt(original_prompt)
-        logger.info(f"Генерация изображения по промпту: {safe_prompt}")
+        logger.info(f"Генерация изображения ({profile.name}) по промпту: {safe_prompt}")
 
         headers = {
             "Authorization": f"Bearer {self.api_key}",
@@ -58,37 +136,70 @@ class ImageGenerator:
                 "weight": 1
             }],
             "cfg_scale": 7,
-            "height": 1024,
-            "width": 1024,
+            "height": profile.height,
+            "width": profile.width,
             "samples": 1,
-            "steps": 30,
+            "steps": profile.steps,
             "style_preset": "digital-art"
         }
 
         try:
-            response = requests.post(
-                f"{self.api_host}/v1/generation/{self.engine_id}/text-to-image",
+            response = await get_http_client().post(
+                f"{self.api_host}/v1/generation/{profile.engine_id}/text-to-image",
                 headers=headers,
-                json=payload,
-                timeout=30
+                json_body=payload,
+                timeout=profile.timeout,
+                max_bytes=MAX_RESPONSE_BYTES
             )
 
             if response.status_code == 200:
                 data = response.json()
+                if controller:
+                    controller.record(profile, response.elapsed)
                 for image in data["artifacts"]:
                     return base64.b64decode(image["base64"])
+            elif response.status_code == 429:
+                # Решение о паузе и повторе принимает общий лимитер; на задержку 429 не влияет
+                raise RateLimitExceeded(retry_after_from_headers(response.headers) or 10.0)
             else:
+                if controller:
+                    controller.record(profile, max(response.elapsed, profile.timeout))
                 error_msg = response.text
                 logger.error(f"Ошибка API: {response.status_code} - {error_msg}")
                 return None
 
+        except RateLimitExceeded:
+            raise
         except Exception as e:
+            if controller:
+                controller.record(profile, profile.timeout)
             logger.error(f"Ошибка запроса: {str(e)}")
             return None
 
-# Глобальный экземпляр генератора
-image_generator = ImageGenerator()
+    async def check_balance(self, timeout: float = 5) -> bool:
+        """Дешевая проверка ключа и доступности API без генерации"""
+        response = await get_http_client().get(
+            f"{self.api_host}/v1/user/balance",
+            headers={"Authorization": f"Bearer {self.api_key}"},
+            timeout=timeout,
+            retries=0
+        )
+        if response.status_code != 200:
+            logger.warning(f"Stability API: код {response.status_code}")
+            return False
+        logger.info(f"Stability API доступен, баланс: {response.json().get('credits')}")
+        return True
+
+# Глобальный экземпляр генератора создается при первом использовании
+image_generator: Optional[ImageGenerator] = None
+
+def get_image_generator() -> ImageGenerator:
+    global image_generator
+    if image_generator is None:
+        image_generator = ImageGenerator()
+    return image_generator
 
-def generate_image(prompt: str) -> bytes:
+async def generate_image(prompt: str, profile: Optional[ImageProfile] = None,
+                         controller: Optional[ProfileController] = None) -> Optional[bytes]:
     """Обертка для совместимости"""
-    return image_generator.generate_image(prompt)
\ No newline at end of file
+    return await get_image_generator().generate_image(prompt, profile, controller)
\ No newline at end of file
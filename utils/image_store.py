@@ -0,0 +1,142 @@
+import hashlib
+import os
+import threading
+import time
+import logging
+from typing import Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Лимит на размер каталога изображений по умолчанию
+DEFAULT_BUDGET_BYTES = 500 * 1024 * 1024
+
+def guess_extension(data: bytes) -> str:
+    """Расширение файла по сигнатуре изображения"""
+    if data.startswith(b'\xff\xd8'):
+        return 'jpg'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'webp'
+    return 'png'
+
+class ImageStore:
+    """Хранилище изображений по хэшу содержимого с вытеснением LRU.
+
+    Одинаковые изображения (например, fallback.png) записываются на диск
+    один раз, а посты хранят только путь к файлу.
+    """
+
+    def __init__(self, root: str = 'images', budget_bytes: int = DEFAULT_BUDGET_BYTES):
+        self.root = root
+        self.budget_bytes = budget_bytes
+        self.lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self.total_bytes = sum(size for _, size, _ in self._scan())
+
+    def _scan(self):
+        """Все файлы хранилища: (путь, размер, время последнего доступа)"""
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime
+
+    def path_for(self, digest: str, ext: str) -> str:
+        return os.path.join(self.root, digest[:2], f"{digest}.{ext}")
+
+    def put(self, data: bytes) -> str:
+        """Сохраняет изображение и возвращает путь к нему"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path_for(digest, guess_extension(data))
+        with self.lock:
+            if os.path.exists(path):
+                os.utime(path)
+                return path
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            self.total_bytes += len(data)
+        return path
+
+    def read(self, path: str) -> Optional[bytes]:
+        """Читает изображение и отмечает его как недавно использованное"""
+        if not path or not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            data = f.read()
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def over_budget(self) -> bool:
+        return self.total_bytes > self.budget_bytes
+
+    def evict(self, protected: Iterable[str] = ()) -> int:
+        """Удаляет давно не использованные файлы сверх лимита.
+
+        protected — пути изображений, которые удалять нельзя (посты на модерации).
+        """
+        with self.lock:
+            if self.total_bytes <= self.budget_bytes:
+                return 0
+            protected = {os.path.normpath(p) for p in protected if p}
+            files = sorted(self._scan(), key=lambda item: item[2])
+            self.total_bytes = sum(size for _, size, _ in files)
+            removed = 0
+            for path, size, _ in files:
+                if self.total_bytes <= self.budget_bytes:
+                    break
+                if os.path.normpath(path) in protected:
+                    continue
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    logger.warning(f"Не удалось удалить {path}: {str(e)}")
+                    continue
+                self.total_bytes -= size
+                removed += 1
+        if removed:
+            logger.info(f"Хранилище изображений: удалено {removed} файлов, занято {self.total_bytes} байт")
+        return removed
+
+    def shards(self) -> list:
+        """Подкаталоги хранилища по первым символам хэша"""
+        try:
+            return sorted(entry.name for entry in os.scandir(self.root) if entry.is_dir())
+        except OSError:
+            return []
+
+    def remove_orphans(self, shard: str, referenced: Iterable[str], min_age: float) -> int:
+        """Удаляет из подкаталога shard файлы, на которые нет ссылок.
+
+        Файлы моложе min_age секунд не трогаем: изображение могло быть
+        сохранено, а пост или задача с ним еще не записаны.
+        """
+        referenced = {os.path.normpath(p) for p in referenced if p}
+        now = time.time()
+        removed = 0
+        with self.lock:
+            try:
+                entries = list(os.scandir(os.path.join(self.root, shard)))
+            except OSError:
+                return 0
+            for entry in entries:
+                if os.path.normpath(entry.path) in referenced:
+                    continue
+                try:
+                    stat = entry.stat()
+                    if now - stat.st_mtime < min_age:
+                        continue
+                    os.remove(entry.path)
+                except OSError as e:
+                    logger.warning(f"Не удалось удалить {entry.path}: {str(e)}")
+                    continue
+                self.total_bytes -= stat.st_size
+                removed += 1
+        return removed
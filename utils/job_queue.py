@@ -0,0 +1,152 @@
+import json
+import logging
+import random
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Сколько попыток дается задаче до перевода в dead
+MAX_ATTEMPTS = 5
+# Пауза перед повтором: BACKOFF_BASE * 2^(попытка-1), но не больше BACKOFF_MAX
+BACKOFF_BASE = 30
+BACKOFF_MAX = 60 * 60
+# Время аренды по умолчанию; по его истечении задачу может забрать другой воркер
+LEASE_SECONDS = 10 * 60
+
+class Job:
+    def __init__(self, job_id: int, kind: str, key: Optional[str], payload: dict, attempts: int, owner: str):
+        self.id = job_id
+        self.kind = kind
+        self.key = key
+        self.payload = payload
+        self.attempts = attempts
+        self.owner = owner
+
+class JobQueue:
+    """Надежная очередь задач в таблице jobs (posts.db).
+
+    Воркер арендует задачу (lease) на время lease_seconds; если он упал,
+    не успев вызвать complete или fail, задача снова становится доступной
+    после истечения аренды. Ошибки повторяются с экспоненциальной паузой,
+    после max_attempts попыток задача переходит в статус dead. Ключ задачи
+    (key) уникален в пределах вида, поэтому повторная постановка той же
+    работы игнорируется. Несколько процессов могут работать с одной БД:
+    аренда выполняется одним UPDATE ... RETURNING.
+    """
+
+    def __init__(self, storage, max_attempts: int = MAX_ATTEMPTS):
+        self.storage = storage
+        self.max_attempts = max_attempts
+
+    def enqueue_many(self, kind: str, items: list) -> int:
+        """Ставит пачку задач одной транзакцией: список пар (key, payload)"""
+        now = time.time()
+        rows = [(kind, key, json.dumps(payload, ensure_ascii=False), now, now, now) for key, payload in items]
+
+        def insert(conn):
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO jobs (kind, key, payload, status, attempts, available_at, "
+                "created_at, updated_at) VALUES (?, ?, ?, 'queued', 0, ?, ?, ?)", rows
+            )
+            return conn.total_changes - before
+
+        return self.storage.write_sync(insert) if rows else 0
+
+    def lease(self, kind: str, owner: str, limit: int = 1, lease_seconds: float = LEASE_SECONDS) -> list:
+        """Арендует до limit готовых задач, включая задачи с истекшей арендой"""
+        now = time.time()
+        rows = self.storage.write_sync(lambda conn: conn.execute(
+            "UPDATE jobs SET status='leased', owner=?, lease_expires=?, attempts=attempts+1, updated_at=? "
+            "WHERE id IN (SELECT id FROM jobs WHERE kind=? AND "
+            "((status='queued' AND available_at<=?) OR (status='leased' AND lease_expires<=?)) "
+            "ORDER BY available_at, id LIMIT ?) "
+            "RETURNING id, key, payload, attempts",
+            (owner, now + lease_seconds, now, kind, now, now, limit)
+        ).fetchall())
+        return [Job(job_id, kind, key, json.loads(payload), attempts, owner)
+                for job_id, key, payload, attempts in rows]
+
+    def complete(self, job: Job, next_kind: Optional[str] = None, next_payload: Optional[dict] = None,
+                 next_key: Optional[str] = None) -> bool:
+        """Завершает задачу и, если задано, в той же транзакции ставит следующую.
+
+        Возвращает False, если аренда уже перешла к другому воркеру.
+        """
+        now = time.time()
+
+        def finish(conn):
+            updated = conn.execute(
+                "UPDATE jobs SET status='done', owner=NULL, lease_expires=NULL, last_error=NULL, updated_at=? "
+                "WHERE id=? AND status='leased' AND owner=?", (now, job.id, job.owner)
+            ).rowcount
+            if updated and next_kind:
+                conn.execute(
+                    "INSERT OR IGNORE INTO jobs (kind, key, payload, status, attempts, available_at, "
+                    "created_at, updated_at) VALUES (?, ?, ?, 'queued', 0, ?, ?, ?)",
+                    (next_kind, next_key, json.dumps(next_payload, ensure_ascii=False), now, now, now)
+                )
+            return bool(updated)
+
+        done = self.storage.write_sync(finish)
+        if not done:
+            logger.warning(f"Задача {job.kind}#{job.id}: аренда потеряна, результат не сохранен")
+        return done
+
+    def save_payload(self, job: Job, payload: dict) -> bool:
+        """Сохраняет промежуточный результат в данных задачи, чтобы повтор его не переделывал"""
+        job.payload = payload
+        return bool(self.storage.write_sync(lambda conn: conn.execute(
+            "UPDATE jobs SET payload=?, updated_at=? WHERE id=? AND status='leased' AND owner=?",
+            (json.dumps(payload, ensure_ascii=False), time.time(), job.id, job.owner)
+        ).rowcount))
+
+    def fail(self, job: Job, error: str) -> str:
+        """Возвращает задачу в очередь с паузой или переводит в dead"""
+        now = time.time()
+        if job.attempts >= self.max_attempts:
+            status, available_at = 'dead', now
+        else:
+            delay = min(BACKOFF_BASE * 2 ** (job.attempts - 1), BACKOFF_MAX)
+            status, available_at = 'queued', now + delay * random.uniform(0.8, 1.2)
+        self.storage.write_sync(lambda conn: conn.execute(
+            "UPDATE jobs SET status=?, available_at=?, owner=NULL, lease_expires=NULL, last_error=?, "
+            "updated_at=? WHERE id=? AND status='leased' AND owner=?",
+            (status, available_at, error[:1000], now, job.id, job.owner)
+        ))
+        if status == 'dead':
+            logger.error(f"Задача {job.kind}#{job.id} отправлена в dead после {job.attempts} попыток: {error}")
+        else:
+            logger.warning(f"Задача {job.kind}#{job.id}: попытка {job.attempts} не удалась, "
+                           f"повтор через {available_at - now:.0f} сек: {error}")
+        return status
+
+    def known_keys(self, kind: str, keys: list) -> set:
+        """Ключи из списка, для которых уже есть задача этого вида"""
+        keys = [key for key in keys if key]
+
+        def query(conn):
+            known = set()
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                known.update(row[0] for row in conn.execute(
+                    f"SELECT key FROM jobs WHERE kind=? AND key IN ({','.join('?' * len(chunk))})",
+                    [kind] + chunk
+                ))
+            return known
+
+        return self.storage.read_sync(query) if keys else set()
+
+    def created_since(self, kind: str, since: float) -> int:
+        """Число задач вида kind, поставленных после since (в любом статусе)"""
+        return self.storage.read_sync(lambda conn: conn.execute(
+            "SELECT COUNT(*) FROM jobs WHERE kind=? AND created_at>=?", (kind, since)
+        ).fetchone()[0])
+
+    def counts(self) -> dict:
+        """Число задач по (вид, статус)"""
+        rows = self.storage.read_sync(lambda conn: conn.execute(
+            "SELECT kind, status, COUNT(*) FROM jobs GROUP BY kind, status"
+        ).fetchall())
+        return {(kind, status): count for kind, status, count in rows}
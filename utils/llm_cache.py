@@ -0,0 +1,71 @@
+import hashlib
+import time
+import logging
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Срок жизни записи и общий объем кэша по умолчанию
+DEFAULT_TTL = 7 * 24 * 60 * 60
+DEFAULT_MAX_BYTES = 20 * 1024 * 1024
+
+def make_key(model: str, system_prompt: str, title: str, description: str) -> str:
+    """Ключ кэша: модель, хэш системного промпта и входные данные"""
+    prompt_hash = hashlib.sha256(system_prompt.encode('utf-8')).hexdigest()
+    payload = '\x00'.join([model, prompt_hash, title, description])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class CompletionCache:
+    """Постоянный кэш ответов LLM в таблице llm_cache с TTL и вытеснением по объему"""
+
+    def __init__(self, storage, ttl: int = DEFAULT_TTL, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.storage = storage
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+    def get(self, key: str) -> Optional[str]:
+        """Возвращает сохраненный ответ, если он не устарел"""
+        now = time.time()
+        row = self.storage.read_sync(lambda conn: conn.execute(
+            "SELECT completion, created_at FROM llm_cache WHERE key=?", (key,)
+        ).fetchone())
+        if not row:
+            return None
+        completion, created_at = row
+        if now - created_at > self.ttl:
+            self.storage.write_nowait(lambda conn: conn.execute(
+                "DELETE FROM llm_cache WHERE key=?", (key,)))
+            return None
+        # Время использования для LRU обновляем без ожидания коммита
+        self.storage.write_nowait(lambda conn: conn.execute(
+            "UPDATE llm_cache SET used_at=? WHERE key=?", (now, key)))
+        return completion
+
+    def put(self, key: str, model: str, completion: str):
+        """Сохраняет ответ и вытесняет старые записи сверх лимита"""
+        now = time.time()
+        size = len(completion.encode('utf-8'))
+
+        def save(conn):
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, completion, size, now, now)
+            )
+            conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl,))
+            self._evict(conn)
+
+        self.storage.write_sync(save)
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Удаляем давно не использованные записи, пока не уложимся в лимит
+        evicted = 0
+        for key, size in conn.execute("SELECT key, size FROM llm_cache ORDER BY used_at").fetchall():
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM llm_cache WHERE key=?", (key,))
+            total -= size
+            evicted += 1
+        logger.info(f"Кэш LLM: вытеснено {evicted} записей")
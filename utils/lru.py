@@ -0,0 +1,31 @@
+import threading
+from collections import OrderedDict
+
+class LRUCache:
+    """Простой потокобезопасный LRU-кэш фиксированного размера"""
+
+    def __init__(self, max_size: int = 256):
+        self.max_size = max_size
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key not in self.items:
+                return default
+            self.items.move_to_end(key)
+            return self.items[key]
+
+    def put(self, key, value):
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            while len(self.items) > self.max_size:
+                self.items.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self.lock:
+            return self.items.pop(key, default)
+
+    def __len__(self):
+        return len(self.items)
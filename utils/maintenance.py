@@ -0,0 +1,180 @@
+import gzip
+import json
+import logging
+import os
+import sqlite3
+import time
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+# Сколько дней хранить опубликованные и отклоненные посты
+POST_RETENTION_DAYS = 30
+# archive — перенос в archive/posts-ГГГГ-ММ.jsonl.gz перед удалением, delete — просто удаление
+RETENTION_MODES = ('archive', 'delete')
+# Сколько дней хранить завершенные и мертвые задачи
+DONE_JOB_RETENTION_DAYS = 7
+DEAD_JOB_RETENTION_DAYS = 30
+# Объем работы за один запуск: строк, подкаталогов изображений, страниц БД
+BATCH_SIZE = 500
+IMAGE_SHARDS_PER_RUN = 16
+VACUUM_PAGES = 2000
+# Строк индекса, просматриваемых ANALYZE (PRAGMA analysis_limit)
+ANALYSIS_LIMIT = 400
+# Более свежие файлы изображений не считаются осиротевшими
+ORPHAN_MIN_AGE = 60 * 60
+
+POST_COLUMNS = ('id', 'text', 'image_path', 'status', 'source', 'url', 'created_at',
+                'file_id', 'title', 'image_profile')
+
+class Maintenance:
+    """Обслуживание posts.db и каталога изображений.
+
+    Один вызов run() выполняет ограниченную порцию работы: не больше
+    batch_size постов и задач, image_shards_per_run подкаталогов
+    изображений и vacuum_pages страниц инкрементального VACUUM, плюс
+    ANALYZE с analysis_limit. Незавершенная работа продолжается при
+    следующем запуске. Посты на модерации не удаляются никогда.
+    Архив пишется до удаления: при сбое между ними пост может попасть
+    в архив дважды, но не потеряется.
+    """
+
+    def __init__(self, storage, image_store, retention_days: int = POST_RETENTION_DAYS,
+                 mode: str = 'archive', archive_dir: str = 'archive', batch_size: int = BATCH_SIZE,
+                 image_shards_per_run: int = IMAGE_SHARDS_PER_RUN, vacuum_pages: int = VACUUM_PAGES):
+        if mode not in RETENTION_MODES:
+            raise ValueError(f"Неизвестный режим хранения постов: {mode}")
+        self.storage = storage
+        self.image_store = image_store
+        self.retention_days = retention_days
+        self.mode = mode
+        self.archive_dir = archive_dir
+        self.batch_size = batch_size
+        self.image_shards_per_run = image_shards_per_run
+        self.vacuum_pages = vacuum_pages
+        self.shard_cursor = 0
+        self.vacuum_warned = False
+
+    def run(self) -> dict:
+        """Один проход обслуживания; выполняется вне event loop"""
+        stats = {}
+        for name, step in (('posts', self._prune_posts), ('jobs', self._prune_jobs),
+                           ('images', self._remove_orphan_images), ('vacuum_pages', self._vacuum)):
+            try:
+                stats[name] = step()
+            except Exception as e:
+                logger.error(f"Ошибка обслуживания ({name}): {str(e)}")
+        logger.info(f"Обслуживание БД и изображений: {stats}")
+        return stats
+
+    def _prune_posts(self) -> int:
+        cutoff = (datetime.now() - timedelta(days=self.retention_days)).isoformat()
+        rows = self.storage.read_sync(lambda conn: conn.execute(
+            f"SELECT {', '.join(POST_COLUMNS)} FROM posts WHERE status IN ('published', 'rejected') "
+            "AND created_at < ? ORDER BY created_at LIMIT ?", (cutoff, self.batch_size)
+        ).fetchall())
+        if not rows:
+            return 0
+        if self.mode == 'archive':
+            self._archive(rows)
+        ids = [(row[0],) for row in rows]
+        self.storage.write_sync(lambda conn: conn.executemany("DELETE FROM posts WHERE id=?", ids))
+        return len(rows)
+
+    def _archive(self, rows: list):
+        """Дописывает посты в сжатые JSONL-файлы по месяцам создания"""
+        os.makedirs(self.archive_dir, exist_ok=True)
+        by_month = {}
+        for row in rows:
+            post = dict(zip(POST_COLUMNS, row))
+            by_month.setdefault((post['created_at'] or '')[:7] or 'unknown', []).append(post)
+        for month, posts in by_month.items():
+            # Каждая дозапись — отдельный член gzip; такие файлы читаются целиком
+            path = os.path.join(self.archive_dir, f"posts-{month}.jsonl.gz")
+            with gzip.open(path, 'at', encoding='utf-8') as f:
+                for post in posts:
+                    f.write(json.dumps(post, ensure_ascii=False) + '\n')
+
+    def _prune_jobs(self) -> int:
+        now = time.time()
+        done_before = now - DONE_JOB_RETENTION_DAYS * 86400
+        dead_before = now - DEAD_JOB_RETENTION_DAYS * 86400
+        return self.storage.write_sync(lambda conn: conn.execute(
+            "DELETE FROM jobs WHERE id IN (SELECT id FROM jobs WHERE "
+            "(status='done' AND updated_at<?) OR (status='dead' AND updated_at<?) LIMIT ?)",
+            (done_before, dead_before, self.batch_size)
+        ).rowcount)
+
+    def _referenced_images(self) -> set:
+        """Пути изображений из постов и незавершенных задач"""
+        def query(conn):
+            paths = {row[0] for row in conn.execute(
+                "SELECT image_path FROM posts WHERE image_path IS NOT NULL"
+            )}
+            paths.update(row[0] for row in conn.execute(
+                "SELECT json_extract(payload, '$.image_path') FROM jobs "
+                "WHERE status IN ('queued', 'leased') AND json_extract(payload, '$.image_path') IS NOT NULL"
+            ))
+            return paths
+
+        return self.storage.read_sync(query)
+
+    def _remove_orphan_images(self) -> int:
+        shards = self.image_store.shards()
+        if not shards:
+            return 0
+        # Каталог обходится по частям: курсор продолжает с места прошлого запуска
+        start = self.shard_cursor % len(shards)
+        batch = (shards[start:] + shards[:start])[:self.image_shards_per_run]
+        self.shard_cursor = start + len(batch)
+        referenced = self._referenced_images()
+        return sum(self.image_store.remove_orphans(shard, referenced, ORPHAN_MIN_AGE) for shard in batch)
+
+    def _vacuum(self) -> int:
+        """Инкрементальный VACUUM и ANALYZE на отдельном соединении вне транзакции"""
+        conn = sqlite3.connect(self.storage.db_path, isolation_level=None, timeout=5)
+        try:
+            conn.execute("PRAGMA busy_timeout=5000")
+            pages = 0
+            # 2 — INCREMENTAL; без него освобожденные страницы не возвращаются файловой системе.
+            # Полный VACUUM для перехода блокирует БД надолго, поэтому здесь его не делаем
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                if not self.vacuum_warned:
+                    logger.warning(f"{self.storage.db_path} без auto_vacuum=INCREMENTAL: место не "
+                                   f"возвращается, остановите бота и выполните python bot.py --vacuum")
+                    self.vacuum_warned = True
+            else:
+                pages = min(conn.execute("PRAGMA freelist_count").fetchone()[0], self.vacuum_pages)
+            if pages:
+                # executescript прогоняет прагму до конца; execute освободил бы одну страницу
+                conn.executescript(f"PRAGMA incremental_vacuum({pages});")
+            conn.execute(f"PRAGMA analysis_limit={ANALYSIS_LIMIT}")
+            conn.execute("ANALYZE")
+            # Переносим изменения из WAL в файл БД, не дожидаясь читателей
+            conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+            return pages
+        finally:
+            conn.close()
+
+def enable_incremental_vacuum(db_path: str) -> bool:
+    """Переводит БД на auto_vacuum=INCREMENTAL однократным полным VACUUM.
+
+    VACUUM держит исключительную блокировку, пока переписывает файл,
+    поэтому запускается отдельно при остановленном боте. Возвращает
+    False, если БД нет или она уже переведена.
+    """
+    if not os.path.exists(db_path):
+        logger.warning(f"БД {db_path} не найдена")
+        return False
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            logger.info(f"{db_path} уже использует auto_vacuum=INCREMENTAL")
+            return False
+        logger.info(f"Полный VACUUM {db_path} ({os.path.getsize(db_path)} байт)...")
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("VACUUM")
+        logger.info(f"{db_path} переведена на auto_vacuum=INCREMENTAL, размер {os.path.getsize(db_path)} байт")
+        return True
+    finally:
+        conn.close()
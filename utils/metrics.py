@@ -0,0 +1,201 @@
+import bisect
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+# Границы корзин гистограмм по умолчанию, секунды
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+# Сколько последних значений хранить для процентилей в сводке
+RECENT_SAMPLES = 1024
+
+def _format_labels(names, values, extra: dict = None) -> str:
+    pairs = list(zip(names, values)) + list((extra or {}).items())
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, help_text: str, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def _header(self) -> list:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    """Монотонно растущий счетчик"""
+    kind = 'counter'
+
+    def __init__(self, name: str, help_text: str, labelnames=()):
+        super().__init__(name, help_text, labelnames)
+        self.values = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self.values.get(self._key(labels), 0)
+
+    def render(self) -> list:
+        with self.lock:
+            items = sorted(self.values.items())
+        return self._header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in items
+        ]
+
+class Gauge(_Metric):
+    """Текущее значение; callback вычисляет его в момент чтения"""
+    kind = 'gauge'
+
+    def __init__(self, name: str, help_text: str, labelnames=(), callback: Optional[Callable] = None):
+        super().__init__(name, help_text, labelnames)
+        self.values = {}
+        self.callback = callback
+
+    def set(self, value: float, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+    def collect(self) -> dict:
+        if self.callback is None:
+            with self.lock:
+                return dict(self.values)
+        try:
+            result = self.callback()
+        except Exception:
+            return {}
+        # Callback возвращает число или словарь {значения меток: число}
+        return result if isinstance(result, dict) else {(): result}
+
+    def render(self) -> list:
+        return self._header() + [
+            f"{self.name}{_format_labels(self.labelnames, key if isinstance(key, tuple) else (key,))} "
+            f"{_format_value(value)}"
+            for key, value in sorted(self.collect().items())
+        ]
+
+class Histogram(_Metric):
+    """Гистограмма длительностей с корзинами Prometheus и окном последних значений"""
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.series = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = {
+                    'counts': [0] * (len(self.buckets) + 1),
+                    'sum': 0.0,
+                    'count': 0,
+                    'recent': deque(maxlen=RECENT_SAMPLES)
+                }
+            series['counts'][bisect.bisect_left(self.buckets, value)] += 1
+            series['sum'] += value
+            series['count'] += 1
+            series['recent'].append(value)
+
+    @contextmanager
+    def time(self, **labels):
+        """Замеряет длительность блока with (в том числе с await внутри)"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def percentile(self, q: float, **labels) -> Optional[float]:
+        """Процентиль по последним RECENT_SAMPLES значениям"""
+        series = self.series.get(self._key(labels))
+        if not series or not series['recent']:
+            return None
+        with self.lock:
+            values = sorted(series['recent'])
+        return values[min(len(values) - 1, int(q / 100 * len(values)))]
+
+    def render(self) -> list:
+        lines = self._header()
+        with self.lock:
+            items = sorted((key, dict(s, counts=list(s['counts']))) for key, s in self.series.items())
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series['counts']):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, {'le': _format_value(bound)})
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series['sum'])}")
+            lines.append(f"{self.name}_count{labels} {series['count']}")
+        return lines
+
+class Registry:
+    """Набор метрик с выводом в текстовом формате Prometheus"""
+
+    def __init__(self):
+        self.metrics = {}
+
+    def _register(self, metric):
+        if metric.name in self.metrics:
+            return self.metrics[metric.name]
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames=()) -> Counter:
+        return self._register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name: str, help_text: str, labelnames=(), callback=None) -> Gauge:
+        return self._register(Gauge(name, help_text, labelnames, callback))
+
+    def histogram(self, name: str, help_text: str, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def summary(self) -> str:
+        """Короткая сводка для периодического лога"""
+        parts = []
+        for metric in self.metrics.values():
+            if isinstance(metric, Histogram):
+                for key, series in sorted(metric.series.items()):
+                    labels = dict(zip(metric.labelnames, key))
+                    p50 = metric.percentile(50, **labels)
+                    p95 = metric.percentile(95, **labels)
+                    parts.append(f"{metric.name}{_format_labels(metric.labelnames, key)}: "
+                                 f"n={series['count']} p50={p50:.3f}s p95={p95:.3f}s")
+            elif isinstance(metric, Counter):
+                for key, value in sorted(metric.values.items()):
+                    parts.append(f"{metric.name}{_format_labels(metric.labelnames, key)}={value:g}")
+            else:
+                for key, value in sorted(metric.collect().items()):
+                    key = key if isinstance(key, tuple) else (key,)
+                    parts.append(f"{metric.name}{_format_labels(metric.labelnames, key)}={value:g}")
+        return '; '.join(parts)
+
+# Общий реестр метрик процесса
+REGISTRY = Registry()
@@ -0,0 +1,108 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+class Stage:
+    """Этап конвейера: асинхронный обработчик и число параллельных воркеров.
+
+    Обработчик получает элемент и возвращает результат для следующего
+    этапа; None означает, что элемент дальше не передается. При
+    batch_size > 1 обработчик получает список до batch_size элементов,
+    собранных за linger секунд, и возвращает список результатов.
+    """
+
+    def __init__(self, name: str, handler: Callable[..., Awaitable], workers: int = 1,
+                 batch_size: int = 1, linger: float = 0.5):
+        self.name = name
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.linger = linger
+
+class Pipeline:
+    """Конвейер из этапов, связанных ограниченными очередями asyncio"""
+
+    def __init__(self, stages: list, queue_size: int = 4):
+        if not stages:
+            raise ValueError("Конвейер должен содержать хотя бы один этап")
+        self.stages = stages
+        self.queue_size = max(1, queue_size)
+        self.queues = []
+
+    async def _next_batch(self, stage: Stage, inbox: asyncio.Queue) -> list:
+        batch = [await inbox.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + stage.linger
+        while len(batch) < stage.batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(inbox.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _worker(self, stage: Stage, inbox: asyncio.Queue,
+                      outbox: Optional[asyncio.Queue], results: list):
+        while True:
+            if stage.batch_size > 1:
+                items = await self._next_batch(stage, inbox)
+            else:
+                items = [await inbox.get()]
+            try:
+                if stage.batch_size > 1:
+                    stage_results = await stage.handler(items)
+                else:
+                    stage_results = [await stage.handler(items[0])]
+                for result in stage_results:
+                    if result is None:
+                        continue
+                    if outbox is not None:
+                        await outbox.put(result)
+                    else:
+                        results.append(result)
+            except Exception as e:
+                logger.error(f"Ошибка на этапе {stage.name}: {str(e)}")
+            finally:
+                for _ in items:
+                    inbox.task_done()
+
+    def queue_depths(self) -> dict:
+        """Число элементов, ожидающих каждого этапа"""
+        return {stage.name: queue.qsize() for stage, queue in zip(self.stages, self.queues)}
+
+    async def run(self, items, should_stop: Callable[[], bool] = None) -> list:
+        """Прогоняет элементы через все этапы и возвращает результаты последнего"""
+        queues = [asyncio.Queue(maxsize=self.queue_size) for _ in self.stages]
+        self.queues = queues
+        results = []
+        workers = []
+        for i, stage in enumerate(self.stages):
+            outbox = queues[i + 1] if i + 1 < len(queues) else None
+            workers.append([
+                asyncio.create_task(self._worker(stage, queues[i], outbox, results))
+                for _ in range(stage.workers)
+            ])
+
+        try:
+            for item in items:
+                if should_stop and should_stop():
+                    break
+                # Ограниченная очередь дает обратное давление на источник
+                await queues[0].put(item)
+
+            # Этапы закрываются по порядку: очередь пуста -> воркеры не нужны
+            for queue, stage_workers in zip(queues, workers):
+                await queue.join()
+                for task in stage_workers:
+                    task.cancel()
+        finally:
+            for stage_workers in workers:
+                for task in stage_workers:
+                    task.cancel()
+            await asyncio.gather(*(t for w in workers for t in w), return_exceptions=True)
+
+        return results
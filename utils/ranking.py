@@ -0,0 +1,142 @@
+import logging
+import math
+import re
+import time
+from collections import Counter
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Темы канала: базовый профиль релевантности
+DEFAULT_KEYWORDS = (
+    "ai artificial intelligence machine learning deep learning neural network llm language model "
+    "gpt openai anthropic claude gemini deepmind llama mistral transformer diffusion agent agents "
+    "reasoning multimodal benchmark dataset training inference open source release research "
+    "robotics vision alignment safety regulation chip gpu nvidia"
+)
+# Сколько одобренных постов учитывать в профиле истории
+HISTORY_SIZE = 200
+# Вес истории одобренных постов относительно ключевых слов
+HISTORY_WEIGHT = 0.5
+# Множитель релевантности для совсем старой новости (у свежей он равен 1)
+FRESHNESS_FLOOR = 0.3
+# За сколько часов свежесть новости падает вдвое
+FRESHNESS_HALF_LIFE_HOURS = 12
+# Не больше стольких новостей одного источника за цикл
+MAX_PER_SOURCE = 3
+
+TOKEN_RE = re.compile(r'[^\W\d_]{3,}')
+STOP_WORDS = frozenset(
+    "the and for with that this from are was were has have had not but its their they you your "
+    "our will can new how why what when who into about more than over after also just one two "
+    "says said via using use".split()
+)
+
+def tokenize(text: str) -> list:
+    return [t for t in TOKEN_RE.findall((text or '').lower()) if t not in STOP_WORDS]
+
+def parse_entry_date(value) -> Optional[float]:
+    """Дата записи ленты (RFC 822 или ISO 8601) в секундах эпохи"""
+    if not value:
+        return None
+    try:
+        parsed = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        try:
+            parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    # Дата без часового пояса считается локальной
+    return parsed.timestamp()
+
+def _tfidf(tokens: list, idf: dict) -> dict:
+    if not tokens:
+        return {}
+    counts = Counter(tokens)
+    vector = {term: count / len(tokens) * idf.get(term, 0.0) for term, count in counts.items()}
+    norm = math.sqrt(sum(v * v for v in vector.values()))
+    return {term: v / norm for term, v in vector.items()} if norm else {}
+
+def _cosine(a: dict, b: dict) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(v * b.get(term, 0.0) for term, v in a.items())
+
+class ArticleRanker:
+    """Отбор лучших новостей цикла в пределах бюджета API.
+
+    Оценка — косинусная близость TF-IDF вектора заголовка и описания к
+    профилю (ключевые слова канала плюс заголовки одобренных постов),
+    умноженная на экспоненциально убывающую свежесть. IDF считается по кандидатам цикла
+    и истории, поэтому слова, встречающиеся везде, почти не влияют.
+    """
+
+    def __init__(self, storage, keywords: str = DEFAULT_KEYWORDS, history_size: int = HISTORY_SIZE,
+                 half_life_hours: float = FRESHNESS_HALF_LIFE_HOURS, max_per_source: int = MAX_PER_SOURCE):
+        self.storage = storage
+        self.keywords = tokenize(keywords)
+        self.history_size = history_size
+        self.half_life = half_life_hours * 3600
+        self.max_per_source = max_per_source
+
+    def _history(self) -> list:
+        """Заголовки последних одобренных постов"""
+        rows = self.storage.read_sync(lambda conn: conn.execute(
+            "SELECT title FROM posts WHERE status='published' AND title IS NOT NULL "
+            "ORDER BY created_at DESC LIMIT ?", (self.history_size,)
+        ).fetchall())
+        return [tokenize(row[0]) for row in rows]
+
+    def score(self, entries: list, now: Optional[float] = None) -> list:
+        now = time.time() if now is None else now
+        docs = [tokenize(f"{e.get('title', '')} {e.get('description', '')}") for e in entries]
+        history = self._history()
+
+        corpus = docs + history
+        df = Counter(term for doc in corpus for term in set(doc))
+        idf = {term: math.log((1 + len(corpus)) / (1 + count)) + 1 for term, count in df.items()}
+        for term in self.keywords:
+            idf.setdefault(term, math.log(1 + len(corpus)) + 1)
+
+        profile = _tfidf(self.keywords, idf)
+        if history:
+            # Средний вектор истории, подмешанный с весом HISTORY_WEIGHT
+            mixed = {term: v * (1 - HISTORY_WEIGHT) for term, v in profile.items()}
+            for doc in history:
+                for term, v in _tfidf(doc, idf).items():
+                    mixed[term] = mixed.get(term, 0.0) + v * HISTORY_WEIGHT / len(history)
+            norm = math.sqrt(sum(v * v for v in mixed.values()))
+            profile = {term: v / norm for term, v in mixed.items()} if norm else profile
+
+        scores = []
+        for entry, doc in zip(entries, docs):
+            relevance = _cosine(_tfidf(doc, idf), profile)
+            published = parse_entry_date(entry.get('date'))
+            age = max(now - published, 0.0) if published else self.half_life
+            freshness = 0.5 ** (age / self.half_life)
+            # Свежесть не поднимает нерелевантную новость, а только снижает устаревшую
+            scores.append(relevance * (FRESHNESS_FLOOR + (1 - FRESHNESS_FLOOR) * freshness))
+        return scores
+
+    def select(self, entries: list, limit: int) -> list:
+        """Лучшие limit новостей, не больше max_per_source из одного источника"""
+        if len(entries) <= limit and self.max_per_source >= len(entries):
+            return list(entries)
+        scores = self.score(entries)
+        ranked = sorted(zip(scores, range(len(entries))), reverse=True)
+        selected = []
+        per_source = Counter()
+        for score, i in ranked:
+            if len(selected) >= limit:
+                break
+            source = entries[i].get('source')
+            if per_source[source] >= self.max_per_source:
+                continue
+            per_source[source] += 1
+            entries[i]['score'] = round(score, 4)
+            selected.append(entries[i])
+        logger.info(f"Отобрано {len(selected)}/{len(entries)} новостей, "
+                    f"оценки: {', '.join(str(e['score']) for e in selected)}")
+        return selected
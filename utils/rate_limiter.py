@@ -0,0 +1,142 @@
+import asyncio
+import logging
+import re
+import time
+from datetime import timedelta
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Лимиты по умолчанию: (запросов в секунду, размер всплеска)
+DEFAULT_LIMITS = {
+    'groq': (30 / 60, 5),            # llama3-70b: 30 запросов в минуту
+    'stability': (150 / 10, 10),     # 150 запросов за 10 секунд
+    'telegram': (30, 30),            # глобальный лимит Bot API
+    'telegram:': (20 / 60, 3),       # на один чат/канал
+}
+
+# Сколько раз повторяем запрос после 429 / RetryAfter
+MAX_RETRIES = 3
+
+class RateLimitExceeded(Exception):
+    """Сервис ответил 429; retry_after — пауза в секундах"""
+
+    def __init__(self, retry_after: float, message: str = ''):
+        super().__init__(message or f"Превышен лимит запросов, повтор через {retry_after} сек")
+        self.retry_after = retry_after
+
+def parse_duration(value) -> Optional[float]:
+    """Разбор длительности из заголовков: '12', '7.66s', '2m59.56s', '500ms'"""
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = re.findall(r'(\d+(?:\.\d+)?)(ms|h|m|s)', value)
+    if not parts:
+        return None
+    scale = {'h': 3600, 'm': 60, 's': 1, 'ms': 0.001}
+    return sum(float(number) * scale[unit] for number, unit in parts)
+
+def retry_after_from_headers(headers) -> Optional[float]:
+    """Пауза, которую требуют заголовки ответа (Retry-After или исчерпанный лимит)"""
+    if not headers:
+        return None
+    retry_after = parse_duration(headers.get('retry-after'))
+    if retry_after is not None:
+        return retry_after
+    for kind in ('requests', 'tokens'):
+        remaining = headers.get(f'x-ratelimit-remaining-{kind}')
+        if remaining is not None and remaining.strip() in ('0', '0.0'):
+            return parse_duration(headers.get(f'x-ratelimit-reset-{kind}'))
+    return None
+
+def retry_after_from_error(error: Exception) -> Optional[float]:
+    """Пауза для ошибок 429: наши, telegram.error.RetryAfter, groq.RateLimitError"""
+    retry_after = getattr(error, 'retry_after', None)
+    if isinstance(retry_after, timedelta):
+        return retry_after.total_seconds()
+    if retry_after is not None:
+        return float(retry_after)
+    response = getattr(error, 'response', None)
+    if getattr(response, 'status_code', None) == 429:
+        return retry_after_from_headers(response.headers) or 1.0
+    return None
+
+class TokenBucket:
+    """Корзина токенов с возможностью принудительной паузы"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self):
+        # Лок сохраняет порядок ожидающих и не дает обогнать очередь
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    continue
+                self._refill(now)
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def block_for(self, seconds: float):
+        """Запрещает запросы на указанное время и обнуляет запас токенов"""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0
+        self.updated_at = self.blocked_until
+
+class RateLimiter:
+    """Общий планировщик исходящих запросов с корзинами по API и по чатам"""
+
+    def __init__(self, limits: dict = None, max_retries: int = MAX_RETRIES):
+        self.limits = dict(DEFAULT_LIMITS, **(limits or {}))
+        self.max_retries = max_retries
+        self.buckets = {}
+
+    def bucket(self, key: str) -> TokenBucket:
+        if key not in self.buckets:
+            # 'telegram:-100123' использует шаблон лимита 'telegram:'
+            limit = self.limits.get(key) or self.limits.get(key.split(':', 1)[0] + ':')
+            if limit is None:
+                raise KeyError(f"Не задан лимит для {key}")
+            self.buckets[key] = TokenBucket(*limit)
+        return self.buckets[key]
+
+    def update_from_headers(self, key: str, headers):
+        """Учитывает заголовки лимитов из успешного ответа"""
+        retry_after = retry_after_from_headers(headers)
+        if retry_after:
+            logger.info(f"Лимит {key} исчерпан, пауза {retry_after:.1f} сек")
+            self.bucket(key).block_for(retry_after)
+
+    async def call(self, keys, func, *args, **kwargs):
+        """Выполняет запрос через корзины keys, повторяя его после 429"""
+        keys = [keys] if isinstance(keys, str) else list(keys)
+        for attempt in range(self.max_retries + 1):
+            for key in keys:
+                await self.bucket(key).acquire()
+            try:
+                return await func(*args, **kwargs)
+            except Exception as e:
+                retry_after = retry_after_from_error(e)
+                if retry_after is None or attempt == self.max_retries:
+                    raise
+                logger.warning(f"Лимит {keys[-1]}: повтор через {retry_after:.1f} сек "
+                               f"(попытка {attempt + 1}/{self.max_retries})")
+                for key in keys:
+                    self.bucket(key).block_for(retry_after)
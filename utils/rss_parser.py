@@ -1,11 +1,24 @@
+import asyncio
 import feedparser
 from datetime import datetime
 import re
+import hashlib
 import logging
-import requests
+from xml.etree.ElementTree import ParseError
+from utils.feed_stream import parse_stream
+from utils.http_client import close_http_client, get_http_client
 
 logger = logging.getLogger(__name__)
 
+# Ограничения для параллельной загрузки лент
+MAX_CONCURRENT_FEEDS = 8
+FEED_TIMEOUT = 15
+# Кандидатов с каждого источника; что из них публиковать, решает ранжирование
+MAX_ENTRIES_PER_FEED = 10
+# Размер куска при потоковом чтении ленты и ограничение на объем ленты
+FEED_CHUNK_SIZE = 16 * 1024
+MAX_FEED_BYTES = 5 * 1024 * 1024
+
 def clean_html(raw_html):
     """Очистка текста от HTML-тегов"""
     return re.sub(r'<[^>]+>', '', str(raw_html or ''))
@@ -32,61 +45,155 @@ def get_source_meta(url):
         logger.warning(f"Ошибка определения источника: {str(e)}")
         return "Unknown", "❓"
 
-def parse_rss(urls):
-    """Улучшенный парсинг RSS с балансировкой источников"""
+def _entry_id(entry):
+    """Стабильный идентификатор записи ленты"""
+    return entry.get('id') or entry.get('link') or entry.get('title', '')
+
+async def _read_feed(response, url):
+    """Потоковый разбор ответа; feedparser — только для некорректного XML.
+
+    Хэш считается по прочитанной части: при ранней остановке это начало
+    ленты с нужными записями.
+    """
+    chunks = response.aiter_bytes(FEED_CHUNK_SIZE)
+    try:
+        entries, body_hash = await parse_stream(chunks, MAX_ENTRIES_PER_FEED, exclude_link=url)
+        return feedparser.FeedParserDict(entries=[feedparser.FeedParserDict(e) for e in entries]), body_hash
+    except ParseError as e:
+        logger.warning(f"Некорректный XML в {url} ({str(e)}), разбираем через feedparser")
+        body = e.body + b''.join([chunk async for chunk in chunks])
+        feed = await asyncio.to_thread(feedparser.parse, body)
+        return feed, hashlib.sha256(body).hexdigest()
+
+async def _fetch_feed(url, timeout, cache=None):
+    """Загрузка и разбор одной ленты через общий пул соединений.
+
+    Возвращает None, если лента не изменилась с прошлой загрузки.
+    """
+    # Специальные заголовки для Reddit
+    headers = {'User-Agent': 'Mozilla/5.0'} if 'reddit.com' in url else {}
+    cached = await asyncio.to_thread(cache.get, url) if cache else None
+    if cached:
+        if cached['etag']:
+            headers['If-None-Match'] = cached['etag']
+        if cached['last_modified']:
+            headers['If-Modified-Since'] = cached['last_modified']
+
+    async with get_http_client().stream('GET', url, headers=headers, timeout=timeout,
+                                        max_bytes=MAX_FEED_BYTES) as response:
+        if response.status_code == 304:
+            logger.info(f"Лента не изменилась (304): {url}")
+            cache.touch(url)
+            return None
+        if response.status_code >= 400:
+            raise RuntimeError(f"HTTP {response.status_code}")
+
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        feed, body_hash = await _read_feed(response, url)
+
+    if cached and cached['body_hash'] == body_hash:
+        logger.info(f"Содержимое ленты не изменилось: {url}")
+        await asyncio.to_thread(cache.update, url, etag, last_modified, body_hash, cached['entry_ids'])
+        return None
+
+    if cache:
+        entry_ids = [_entry_id(entry) for entry in feed.entries]
+        await asyncio.to_thread(cache.update, url, etag, last_modified, body_hash, entry_ids)
+        # Тело изменилось, но свежие записи те же (например, обновился lastBuildDate)
+        if cached and entry_ids[:MAX_ENTRIES_PER_FEED] == cached['entry_ids'][:MAX_ENTRIES_PER_FEED]:
+            logger.info(f"Новых записей нет: {url}")
+            return None
+    return feed
+
+def _extract_entries(feed, url):
+    """Преобразование записей ленты в формат бота"""
     entries = []
-    if not urls:
-        logger.warning("Получен пустой список RSS-лент")
-        return entries
+    source, emoji = get_source_meta(url)
+    logger.info(f"Обработка {source} ({url}), найдено {len(feed.entries)} записей")
 
-    successful_sources = 0
-    
-    for url in urls:
+    for entry in feed.entries[:MAX_ENTRIES_PER_FEED]:
         try:
-            if not url.startswith('http'):
-                logger.warning(f"Пропускаем неверный URL: {url}")
-                continue
-                
-            logger.info(f"Загрузка новостей из: {url}")
-            
-            # Специальные заголовки для Reddit
-            headers = {'User-Agent': 'Mozilla/5.0'} if 'reddit.com' in url else {}
-            feed = feedparser.parse(url, request_headers=headers)
-            
-            if not feed.entries:
-                logger.warning(f"Нет записей в {url}")
+            title = clean_html(entry.get('title', ''))[:200] or 'Без названия'
+            description = clean_html(entry.get('summary', entry.get('description', '')))[:500]
+            link = entry.get('link', '')
+
+            # Пропускаем записи без ссылки или с ссылкой на сам RSS
+            if not link or link == url:
                 continue
-                
-            source, emoji = get_source_meta(url)
-            successful_sources += 1
-            logger.info(f"Обработка {source} ({url}), найдено {len(feed.entries)} записей")
-            
-            # Берем по 2 новости с каждого источника для баланса
-            for entry in feed.entries[:2]:
-                try:
-                    title = clean_html(entry.get('title', ''))[:200] or 'Без названия'
-                    description = clean_html(entry.get('summary', entry.get('description', '')))[:500]
-                    link = entry.get('link', '')
-                    
-                    # Пропускаем записи без ссылки или с ссылкой на сам RSS
-                    if not link or link == url:
-                        continue
-                        
-                    pub_date = entry.get('published', '')
-                    entries.append({
-                        'title': f"{emoji} {title}",
-                        'description': description,
-                        'source': source,
-                        'url': link,
-                        'date': pub_date if pub_date else datetime.now().isoformat()
-                    })
-                except Exception as e:
-                    logger.error(f"Ошибка обработки записи из {source}: {str(e)}")
+
+            pub_date = entry.get('published', '')
+            entries.append({
+                'title': f"{emoji} {title}",
+                'description': description,
+                'source': source,
+                'url': link,
+                'feed': url,
+                'date': pub_date if pub_date else datetime.now().isoformat()
+            })
         except Exception as e:
-            logger.error(f"Ошибка парсинга {url}: {str(e)}")
-    
+            logger.error(f"Ошибка обработки записи из {source}: {str(e)}")
+    return entries
+
+async def parse_rss_async(urls, max_concurrency=MAX_CONCURRENT_FEEDS, timeout=FEED_TIMEOUT, cache=None):
+    """Параллельная загрузка RSS без блокировки event loop.
+
+    С переданным FeedCache ленты запрашиваются условным GET, а
+    неизменившиеся ленты не разбираются повторно.
+    """
+    if not urls:
+        logger.warning("Получен пустой список RSS-лент")
+        return []
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def load(url):
+        if not url.startswith('http'):
+            logger.warning(f"Пропускаем неверный URL: {url}")
+            return None, False
+
+        async with semaphore:
+            logger.info(f"Загрузка новостей из: {url}")
+            try:
+                feed = await asyncio.wait_for(_fetch_feed(url, timeout, cache), timeout=timeout)
+            except asyncio.TimeoutError:
+                logger.error(f"Таймаут загрузки {url} ({timeout} сек)")
+                return None, False
+            except Exception as e:
+                logger.error(f"Ошибка парсинга {url}: {str(e)}")
+                return None, False
+
+        if feed is None:
+            return [], True
+        if not feed.entries:
+            logger.warning(f"Нет записей в {url}")
+            return None, False
+        return _extract_entries(feed, url), False
+
+    results = await asyncio.gather(*(load(url) for url in urls))
+
+    entries = []
+    successful_sources = 0
+    unchanged_sources = 0
+    for feed_entries, unchanged in results:
+        if feed_entries is None:
+            continue
+        successful_sources += 1
+        unchanged_sources += unchanged
+        entries.extend(feed_entries)
+
     # Сортируем новости по дате (свежие сначала)
     entries.sort(key=lambda x: x.get('date', ''), reverse=True)
-    
-    logger.info(f"Успешно обработано {successful_sources}/{len(urls)} источников, всего новостей: {len(entries)}")
-    return entries
\ No newline at end of file
+
+    logger.info(f"Успешно обработано {successful_sources}/{len(urls)} источников "
+                f"(без изменений: {unchanged_sources}), всего новостей: {len(entries)}")
+    return entries
+
+def parse_rss(urls, cache=None):
+    """Синхронная обертка над parse_rss_async для кода вне event loop"""
+    async def run():
+        try:
+            return await parse_rss_async(urls, cache=cache)
+        finally:
+            await close_http_client()
+    return asyncio.run(run())
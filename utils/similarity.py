@@ -0,0 +1,284 @@
+import hashlib
+import re
+import struct
+import logging
+from datetime import datetime, timedelta
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# MinHash: NUM_BANDS полос по ROWS_PER_BAND значений в подписи
+NUM_BANDS = 32
+ROWS_PER_BAND = 2
+NUM_PERM = NUM_BANDS * ROWS_PER_BAND
+MAX_HASH = (1 << 61) - 1
+
+_PERMUTATIONS = [
+    (int.from_bytes(hashlib.blake2b(f"a{i}".encode(), digest_size=8).digest(), 'big') % MAX_HASH | 1,
+     int.from_bytes(hashlib.blake2b(f"b{i}".encode(), digest_size=8).digest(), 'big') % MAX_HASH)
+    for i in range(NUM_PERM)
+]
+
+STOP_WORDS = {
+    'a', 'an', 'the', 'and', 'or', 'of', 'to', 'in', 'on', 'for', 'with', 'at', 'by',
+    'from', 'is', 'are', 'was', 'its', 'it', 'as', 'that', 'this', 'new', 'how', 'why',
+    'be', 'has', 'have', 'will', 'can', 'now', 'says', 'said', 'after', 'into', 'about',
+    'than', 'more', 'most', 'yet', 'just', 'up', 'out', 'over', 'what', 'who', 'you',
+    'your', 'our', 'their', 'they', 'we', 'i', 'not', 'no', 'but', 'all', 'first',
+    'here', 'get', 'gets', 'another', 'make', 'makes', 'use', 'using', 'via', 'could',
+    # Лента целиком про ИИ: эти слова есть почти в каждом заголовке
+    'ai', 'artificial', 'intelligence', 'model', 'models', 'startup', 'company', 'tool', 'tools',
+    # Суммы издания пишут по-разному: $4B, $4 billion, €600M
+    'billion', 'million', 'bn'
+}
+
+# Разные издания описывают одно событие разными глаголами
+SYNONYM_GROUPS = {
+    'launch': ('launch', 'launches', 'launched', 'release', 'releases', 'released', 'unveil', 'unveils',
+               'unveiled', 'announce', 'announces', 'announced', 'introduce', 'introduces', 'introduced',
+               'debut', 'debuts', 'debuted', 'roll', 'rolls', 'rolled', 'ship', 'ships', 'shipped',
+               'reveal', 'reveals', 'revealed', 'drop', 'drops', 'dropped', 'available'),
+    'acquire': ('acquire', 'acquires', 'acquired', 'acquisition', 'buy', 'buys', 'bought', 'purchase'),
+    'funding': ('raise', 'raises', 'raised', 'funding', 'round', 'valuation'),
+    'lawsuit': ('sue', 'sues', 'sued', 'lawsuit', 'suit', 'court'),
+}
+SYNONYMS = {word: canonical for canonical, words in SYNONYM_GROUPS.items() for word in words}
+
+TOKEN_RE = re.compile(r'[^\W_]+(?:[-.][^\W_]+)*')
+VERSION_RE = re.compile(r'^v?\d+(?:\.\d+)*[a-z]?$')
+# Эмодзи источника, другие символы и метки hnrss перед заголовком
+TITLE_PREFIX_RE = re.compile(r'^(?:[^\w"\'(]+|(?:Show|Ask|Tell|Launch) HN:)+', re.I)
+# Шаблонный текст hnrss и ссылки в описаниях
+BOILERPLATE_RE = re.compile(r'(?:Article URL|Comments URL|Points|# Comments):\s*\S*|https?://\S+', re.I)
+# Вес слов заголовка с номером версии или модели (GPT-5, Llama 3.1)
+# (не больше 2: иначе одно общее название проходит порог по заголовку)
+VERSION_WEIGHT = 2
+
+def tokens(text: str) -> list:
+    """Нормализованные слова: без стоп-слов, с общими формами глаголов и версиями моделей"""
+    words = []
+    for word in TOKEN_RE.findall(text.lower()):
+        # 'llama 3.1' и 'llama-3.1' — одно название; к названию с версией числа не присоединяются
+        if words and VERSION_RE.match(word) and not any(ch.isdigit() for ch in words[-1]):
+            words[-1] = f"{words[-1]}-{word}"
+            continue
+        if word in STOP_WORDS:
+            continue
+        if word in SYNONYMS:
+            word = SYNONYMS[word]
+        elif len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+            word = word[:-1]
+        words.append(word)
+    return words
+
+def shingles(text: str) -> set:
+    """Нормализованные слова и биграммы текста"""
+    words = tokens(text)
+    result = set(words)
+    result.update(f"{a} {b}" for a, b in zip(words, words[1:]))
+    return result
+
+def title_shingles(title: str) -> set:
+    """Слова заголовка; названия с версиями весят больше (повторяются)"""
+    result = set()
+    for word in tokens(title):
+        result.add(word)
+        if any(ch.isdigit() for ch in word):
+            result.update(f"{word}#{i}" for i in range(1, VERSION_WEIGHT))
+    return result
+
+def name_tokens(title: str) -> set:
+    """Слова заголовка с цифрами: названия моделей и продуктов с версией (gpt-5, ios-18)"""
+    return {word for word in tokens(title) if any(ch.isdigit() for ch in word)}
+
+def minhash(text: str) -> Optional[list]:
+    """MinHash-подпись текста или None для пустого текста"""
+    return minhash_tokens(shingles(text))
+
+def minhash_tokens(items: set) -> Optional[list]:
+    """MinHash-подпись набора токенов или None для пустого набора"""
+    if not items:
+        return None
+    hashes = [int.from_bytes(hashlib.blake2b(t.encode(), digest_size=8).digest(), 'big') for t in items]
+    return [min((a * h + b) % MAX_HASH for h in hashes) for a, b in _PERMUTATIONS]
+
+def similarity(sig_a: list, sig_b: list) -> float:
+    """Оценка коэффициента Жаккара по двум подписям"""
+    return sum(x == y for x, y in zip(sig_a, sig_b)) / NUM_PERM
+
+def _bands(signature: list) -> list:
+    """Хэши полос LSH (знаковые 64 бита для SQLite)"""
+    result = []
+    for band in range(NUM_BANDS):
+        rows = signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]
+        digest = hashlib.blake2b(struct.pack(f'>{ROWS_PER_BAND}Q', *rows), digest_size=8).digest()
+        result.append(int.from_bytes(digest, 'big', signed=True))
+    return result
+
+def clean_title(entry: dict) -> str:
+    return TITLE_PREFIX_RE.sub('', entry.get('title', '') or '')
+
+def clean_description(entry: dict) -> str:
+    return BOILERPLATE_RE.sub(' ', entry.get('description', '') or '').strip()
+
+def story_signature(entry: dict) -> Optional[tuple]:
+    """Подписи (заголовок, заголовок с описанием, названия с версиями) или None для пустой записи.
+
+    Без описания (hnrss) подпись текста — None: она повторяла бы заголовок.
+    Подпись названий — None, если в заголовке нет слов с цифрами.
+    """
+    title = clean_title(entry)
+    description = clean_description(entry)
+    text_signature = minhash(f"{title} {description}") if description else None
+    title_signature = minhash_tokens(title_shingles(title)) or text_signature
+    if title_signature is None:
+        return None
+    return title_signature, text_signature, minhash_tokens(name_tokens(title))
+
+def _pack(signature: tuple) -> bytes:
+    # Отсутствующая подпись хранится нулями: у настоящей MinHash-подписи они невозможны
+    values = [value for part in signature for value in (part or [0] * NUM_PERM)]
+    return struct.pack(f'>{3 * NUM_PERM}Q', *values)
+
+def _unpack(blob: bytes) -> tuple:
+    values = struct.unpack(f'>{3 * NUM_PERM}Q', blob)
+    parts = [list(values[i * NUM_PERM:(i + 1) * NUM_PERM]) for i in range(3)]
+    return tuple(part if any(part) else None for part in parts)
+
+class StoryIndex:
+    """Индекс похожих историй между лентами и циклами (MinHash + LSH).
+
+    У истории три подписи: по заголовку, по заголовку с описанием и по
+    названиям с версиями из заголовка. История считается повтором, если
+    похож весь текст (threshold) или заголовок (title_threshold) при общем
+    названии с версией. Переписанные другим изданием новости о релизах
+    совпадают по заголовку сильнее, чем по описанию, поэтому при похожем
+    заголовке достаточно слабого сходства текста (title_text_threshold), но
+    без него разные новости об одном продукте («Google releases Gemini 2.0»
+    и «Google sued over Gemini 2.0») не склеиваются. Короткие заголовки разных
+    новостей одной компании («Copilot for Excel» и «Copilot for Word») без
+    общего названия с версией не склеиваются вовсе. Таблицы
+    story_signatures и story_bands создаются миграциями storage.
+    """
+
+    def __init__(self, storage, threshold: float = 0.6, title_threshold: float = 0.5,
+                 title_text_threshold: float = 0.2, retention_days: int = 14):
+        self.storage = storage
+        self.threshold = threshold
+        self.title_threshold = title_threshold
+        self.title_text_threshold = title_text_threshold
+        self.retention_days = retention_days
+
+    def is_similar(self, signature: tuple, other: tuple) -> bool:
+        title_signature, text_signature, names_signature = signature
+        other_title, other_text, other_names = other
+        text_similarity = None
+        if text_signature and other_text:
+            text_similarity = similarity(text_signature, other_text)
+            if text_similarity >= self.threshold:
+                return True
+        # Совпадение хотя бы одного значения подписей означает общее название
+        if names_signature is None or other_names is None or not similarity(names_signature, other_names):
+            return False
+        if similarity(title_signature, other_title) < self.title_threshold:
+            return False
+        # Без описания (hnrss) сравнивать больше нечего
+        return text_similarity is None or text_similarity >= self.title_text_threshold
+
+    @staticmethod
+    def _signature_bands(signature: tuple) -> list:
+        """Пары (полоса, хэш): полосы подписи заголовка — 0..NUM_BANDS-1, подписи текста — следующие"""
+        bands = list(enumerate(_bands(signature[0])))
+        if signature[1] is not None:
+            bands.extend(enumerate(_bands(signature[1]), NUM_BANDS))
+        return bands
+
+    def find_duplicate(self, signature: tuple) -> Optional[str]:
+        """URL ранее сохраненной похожей истории"""
+        bands = self._signature_bands(signature)
+        clause = ' OR '.join(['(band=? AND hash=?)'] * len(bands))
+        params = [value for pair in bands for value in pair]
+        rows = self.storage.read_sync(lambda conn: conn.execute(
+            f"SELECT DISTINCT s.url, s.signature FROM story_bands b "
+            f"JOIN story_signatures s ON s.url = b.url WHERE {clause}",
+            params
+        ).fetchall())
+        for url, blob in rows:
+            if self.is_similar(signature, _unpack(blob)):
+                return url
+        return None
+
+    def add_many(self, items: list):
+        """Сохраняет подписи историй: список пар (url, подписи из story_signature)"""
+        now = datetime.now().isoformat()
+
+        def save(conn):
+            for url, signature in items:
+                conn.execute(
+                    "INSERT OR REPLACE INTO story_signatures VALUES (?, ?, ?)",
+                    (url, _pack(signature), now)
+                )
+                conn.execute("DELETE FROM story_bands WHERE url=?", (url,))
+                conn.executemany(
+                    "INSERT INTO story_bands VALUES (?, ?, ?)",
+                    [(band, value, url) for band, value in self._signature_bands(signature)]
+                )
+
+        if items:
+            self.storage.write_sync(save)
+
+    def prune(self):
+        """Удаляет подписи старше срока хранения"""
+        cutoff = (datetime.now() - timedelta(days=self.retention_days)).isoformat()
+
+        def delete(conn):
+            conn.execute(
+                "DELETE FROM story_bands WHERE url IN "
+                "(SELECT url FROM story_signatures WHERE created_at < ?)", (cutoff,)
+            )
+            conn.execute("DELETE FROM story_signatures WHERE created_at < ?", (cutoff,))
+
+        self.storage.write_sync(delete)
+
+    def remember(self, entries: list):
+        """Запоминает истории записей, взятых в работу"""
+        items = []
+        for entry in entries:
+            signature = story_signature(entry)
+            if signature is not None and entry.get('url'):
+                items.append((entry['url'], signature))
+        self.add_many(items)
+
+    def cluster(self, entries: list, remember: bool = True) -> list:
+        """Оставляет по одной записи на историю и запоминает выбранные.
+
+        Записи сравниваются между собой и с историями прошлых циклов;
+        из группы похожих остается первая (самая свежая) запись. С
+        remember=False истории не сохраняются — это делает remember() для
+        тех записей, что прошли дальнейший отбор.
+        """
+        self.prune()
+        representatives = []
+        chosen = []
+        for entry in entries:
+            signature = story_signature(entry)
+            if signature is None or not entry.get('url'):
+                representatives.append(entry)
+                continue
+
+            duplicate_of = self.find_duplicate(signature)
+            if duplicate_of is None:
+                for other, other_signature in chosen:
+                    if self.is_similar(signature, other_signature):
+                        duplicate_of = other['url']
+                        break
+            if duplicate_of:
+                logger.info(f"Похожая история уже есть ({duplicate_of}), пропускаем: {entry['url']}")
+                continue
+
+            chosen.append((entry, signature))
+            representatives.append(entry)
+
+        if remember:
+            self.add_many([(entry['url'], signature) for entry, signature in chosen])
+        return representatives
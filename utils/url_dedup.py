@@ -0,0 +1,163 @@
+import hashlib
+import math
+import re
+import threading
+import time
+import logging
+from datetime import datetime, timedelta
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from utils.ranking import parse_entry_date
+
+logger = logging.getLogger(__name__)
+
+# Параметры, которые не меняют содержимое страницы
+TRACKING_PARAMS = {'fbclid', 'gclid', 'yclid', 'mc_cid', 'mc_eid', 'ref', 'ref_src', 'cmpid'}
+# Размер пачки для запросов WHERE url IN (...)
+QUERY_CHUNK = 500
+PRUNE_INTERVAL = 24 * 60 * 60
+
+def normalize_url(url: str) -> str:
+    """Нормализует URL: без трекинг-параметров, якоря и версии arXiv"""
+    try:
+        parts = urlsplit(url.strip())
+    except ValueError:
+        return url
+    netloc = parts.netloc.lower()
+    if netloc.startswith('www.'):
+        netloc = netloc[4:]
+    path = parts.path.rstrip('/') or '/'
+    if netloc.endswith('arxiv.org'):
+        # arxiv.org/abs/2401.01234v2 -> arxiv.org/abs/2401.01234
+        path = re.sub(r'^/pdf/', '/abs/', path)
+        path = re.sub(r'(\d{4}\.\d{4,5})v\d+(\.pdf)?$', r'\1', path)
+    query = [(k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+             if not k.lower().startswith('utm_') and k.lower() not in TRACKING_PARAMS]
+    scheme = parts.scheme.lower()
+    if scheme in ('', 'http'):
+        scheme = 'https'
+    return urlunsplit((scheme, netloc, path, urlencode(sorted(query)), ''))
+
+class BloomFilter:
+    """Компактный фильтр Блума для быстрого ответа «точно не встречался»"""
+
+    def __init__(self, capacity: int = 100000, error_rate: float = 0.01):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'big')
+        h2 = int.from_bytes(digest[8:], 'big') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hash_count))
+
+    def add(self, item: str):
+        for pos in self._positions(item):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(item))
+
+class UrlDeduplicator:
+    """Проверка уже обработанных URL точечными запросами к processed_urls.
+
+    URL хранятся retention_days дней; записи, опубликованные раньше этого
+    срока, отбрасываются по дате, иначе старая запись медленной ленты после
+    удаления ее URL снова прошла бы генерацию. Таблица и индекс по
+    processed_at создаются миграциями storage.
+    """
+
+    def __init__(self, storage, retention_days: int = 90, bloom_capacity: int = 100000):
+        self.storage = storage
+        self.retention_days = retention_days
+        self.bloom_capacity = bloom_capacity
+        self.lock = threading.Lock()
+        self.bloom = BloomFilter(bloom_capacity)
+        self.last_prune = 0.0
+        self.prune()
+
+    def _rebuild_bloom(self):
+        bloom = BloomFilter(self.bloom_capacity)
+
+        def load(conn):
+            for (url,) in conn.execute("SELECT url FROM processed_urls"):
+                bloom.add(url)
+
+        self.storage.read_sync(load)
+        with self.lock:
+            self.bloom = bloom
+
+    def prune(self):
+        """Удаляет URL старше срока хранения и перестраивает фильтр"""
+        cutoff = (datetime.now() - timedelta(days=self.retention_days)).isoformat()
+        deleted = self.storage.write_sync(lambda conn: conn.execute(
+            "DELETE FROM processed_urls WHERE processed_at < ?", (cutoff,)
+        ).rowcount)
+        self._rebuild_bloom()
+        self.last_prune = time.time()
+        if deleted:
+            logger.info(f"Удалено {deleted} устаревших обработанных URL")
+
+    def _known(self, urls: set) -> set:
+        """URL из набора, которые уже есть в processed_urls"""
+        # Фильтр Блума отсекает заведомо новые URL без запроса к БД
+        with self.lock:
+            candidates = [url for url in urls if url in self.bloom]
+
+        def query(conn):
+            known = set()
+            for i in range(0, len(candidates), QUERY_CHUNK):
+                chunk = candidates[i:i + QUERY_CHUNK]
+                rows = conn.execute(
+                    f"SELECT url FROM processed_urls WHERE url IN ({','.join('?' * len(chunk))})",
+                    chunk
+                ).fetchall()
+                known.update(row[0] for row in rows)
+            return known
+
+        return self.storage.read_sync(query) if candidates else set()
+
+    def filter_new(self, entries: list) -> list:
+        """Оставляет свежие записи с необработанными URL (и без повторов внутри пачки)"""
+        if time.time() - self.last_prune > PRUNE_INTERVAL:
+            self.prune()
+
+        # Записи без даты проверяются только по URL
+        cutoff = time.time() - self.retention_days * 24 * 60 * 60
+        fresh = []
+        for entry in entries:
+            published = parse_entry_date(entry.get('date'))
+            if published is None or published >= cutoff:
+                fresh.append(entry)
+        if len(fresh) < len(entries):
+            logger.info(f"Пропущено записей старше {self.retention_days} дней: {len(entries) - len(fresh)}")
+        entries = fresh
+
+        normalized = [normalize_url(entry['url']) if entry.get('url') else None for entry in entries]
+        # Старые записи хранились без нормализации, поэтому проверяем обе формы
+        lookup = {url for url in normalized if url}
+        lookup.update(entry['url'] for entry in entries if entry.get('url'))
+        known = self._known(lookup)
+
+        result = []
+        seen = set()
+        for entry, url in zip(entries, normalized):
+            if url is None:
+                result.append(entry)
+                continue
+            if url in known or entry['url'] in known or url in seen:
+                continue
+            seen.add(url)
+            result.append(entry)
+        return result
+
+    def mark(self, urls: list):
+        """Отмечает URL как обработанные"""
+        now = datetime.now().isoformat()
+        rows = [(normalize_url(url), now) for url in urls if url]
+        self.storage.write_sync(lambda conn: conn.executemany(
+            "INSERT OR IGNORE INTO processed_urls VALUES (?, ?)", rows
+        ))
+        with self.lock:
+            for url, _ in rows:
+                self.bloom.add(url)
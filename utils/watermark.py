@@ -0,0 +1,103 @@
+import asyncio
+import io
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Optional
+from PIL import Image, ImageDraw, ImageFont
+
+logger = logging.getLogger(__name__)
+
+WATERMARK_TEXT = "@ai_revo"
+
+@lru_cache(maxsize=16)
+def _load_font(font_size: int):
+    """Шрифт нужного размера; загружается один раз на процесс"""
+    try:
+        return ImageFont.truetype("arial.ttf", font_size)
+    except OSError:
+        try:
+            return ImageFont.load_default(size=font_size)
+        except TypeError:
+            # Старые версии Pillow не масштабируют встроенный шрифт
+            return ImageFont.load_default()
+
+@lru_cache(maxsize=16)
+def _render_overlay(width: int, height: int, text: str):
+    """Готовый водяной знак для угла изображения заданного размера.
+
+    Возвращает RGBA-оверлей только для правого нижнего угла и его позицию.
+    """
+    font_size = max(int(width * 0.03), 14)
+    font = _load_font(font_size)
+    text_width = ImageDraw.Draw(Image.new('RGBA', (1, 1))).textlength(text, font=font)
+
+    x = width - text_width - 10
+    y = height - font_size - 10
+    left, top = max(int(x - 5), 0), max(int(y - 2), 0)
+
+    overlay = Image.new('RGBA', (width - left, height - top), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(overlay)
+    draw.rectangle(
+        [x - 5 - left, y - 2 - top, x + text_width + 5 - left, y + font_size + 2 - top],
+        fill=(0, 0, 0, 120))
+    draw.text((x - left, y - top), text, font=font, fill=(255, 255, 255, 220))
+    return overlay, (left, top)
+
+def apply_watermark(image_bytes: bytes, text: str = WATERMARK_TEXT,
+                    image_format: str = 'JPEG', quality: int = 85) -> bytes:
+    """Накладывает водяной знак на угол изображения и сжимает результат"""
+    img = Image.open(io.BytesIO(image_bytes))
+    img = img.convert('RGBA' if image_format == 'PNG' else 'RGB')
+    overlay, (left, top) = _render_overlay(img.width, img.height, text)
+
+    # Смешиваем только область водяного знака, а не весь кадр
+    box = (left, top, img.width, img.height)
+    corner = Image.alpha_composite(img.crop(box).convert('RGBA'), overlay)
+    img.paste(corner.convert(img.mode), box)
+
+    output = io.BytesIO()
+    if image_format == 'PNG':
+        img.save(output, format='PNG', optimize=False)
+    else:
+        img.save(output, format=image_format, quality=quality)
+    return output.getvalue()
+
+class Watermarker:
+    """Наложение водяного знака в пуле процессов, вне event loop"""
+
+    def __init__(self, image_format: str = 'JPEG', quality: int = 85, workers: int = 2,
+                 text: str = WATERMARK_TEXT):
+        self.image_format = image_format.upper()
+        if self.image_format not in ('JPEG', 'WEBP', 'PNG'):
+            raise ValueError(f"Неподдерживаемый формат водяного знака: {image_format}")
+        self.quality = quality
+        self.workers = workers
+        self.text = text
+        self.executor: Optional[ProcessPoolExecutor] = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self.executor is None:
+            # spawn: в процессе бота уже работают потоки, fork с ними небезопасен
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return self.executor
+
+    async def apply(self, image_bytes: bytes) -> bytes:
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._get_executor(), apply_watermark,
+                image_bytes, self.text, self.image_format, self.quality
+            )
+        except Exception as e:
+            logger.error(f"Ошибка добавления водяного знака: {str(e)}")
+            return image_bytes
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None